@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import re
+import os
+import sys
+
+# Vocabulario y autómata de palabras clave compartidos con el conector y SQLCoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from keyword_matcher import first_label, match_question
 
 app = FastAPI(title="MAR-IA - Modelo Agrícola Inteligente", version="3.0")
 
@@ -55,22 +61,11 @@ def answer_identity(intent: str, tone: str) -> str:
     return fmt(responses.get(intent, responses["quien_eres"]), tone)
 
 # ===== DETECCIÓN DE TEMAS AGRÍCOLAS =====
+# Temas con consejo en generate_agro_advice, en orden de precedencia (sin consejos por marca)
+TOPICS = ("cultivo", "riego", "fertilizacion", "plagas", "clima", "precio")
+
 def detect_agro_topic(question: str) -> Optional[str]:
-    q = question.lower()
-    
-    topics = {
-        "cultivo": ["cultivar", "siembra", "plantar", "cultivo", "cosecha"],
-        "riego": ["riego", "agua", "irrigacion", "hidratar"],
-        "fertilizacion": ["fertiliz", "abono", "nutrient", "npk"],
-        "plagas": ["plaga", "enfermedad", "insecto", "control", "fungicida", "pesticida"],
-        "clima": ["clima", "temperatura", "lluvia", "sequia", "helada"],
-        "precio": ["precio", "venta", "mercado", "comercio"]
-    }
-    
-    for topic, keywords in topics.items():
-        if any(kw in q for kw in keywords):
-            return topic
-    return None
+    return first_label(match_question(question)["agro_topic"], TOPICS)
 
 def generate_agro_advice(topic: str, question: str, tone: str) -> str:
     advice = {
@@ -164,7 +159,8 @@ def nlg_answer(
     rows: List[Dict[str, Any]],
     lang: str = "es",
     tone: str = "amigable",
-    suggest_followups: bool = True
+    suggest_followups: bool = True,
+    approximate: bool = False
 ) -> str:
     # 1. VERIFICAR SI ES PREGUNTA SOBRE IDENTIDAD
     identity_intent = is_identity_question(question)
@@ -200,7 +196,13 @@ def nlg_answer(
                         n = first_val
             
             # Parafraseo natural con contexto
-            base = f"Según los datos del sistema, encontré {n} {subj}."
+            if approximate:
+                # Conteo estimado por el planificador: redondeado y presentado como tal
+                if isinstance(n, int) and n >= 1000:
+                    n = f"{round(n, -2):,}".replace(",", ".")
+                base = f"Según las estadísticas del sistema, hay aproximadamente {n} {subj}."
+            else:
+                base = f"Según los datos del sistema, encontré {n} {subj}."
             
             # Agregar contexto agrícola si es relevante
             if "compr" in question.lower():
@@ -251,6 +253,7 @@ class RefineIn(BaseModel):
     tone: str = "amigable"
     suggest_followups: bool = True
     max_new_tokens: int = 192
+    approximate: bool = False
 
 @app.get("/health")
 def health():
@@ -267,13 +270,18 @@ def get_identity():
     return MARIA_IDENTITY
 
 @app.post("/refine")
-def refine(data: RefineIn):
+def refine(data: RefineIn, x_deadline_ms: Optional[int] = Header(default=None)):
     """
     Endpoint principal que maneja respuestas híbridas:
     - Parafrasea datos de BD cuando están disponibles
     - Proporciona conocimiento agrícola cuando no hay datos
     - Se identifica como MAR-IA cuando se le pregunta
     """
+    # Presupuesto enviado por el conector: si ya no queda, no vale la pena redactar.
+    # Solo se comprueba a la entrada: la respuesta sale de plantillas y no hay generación que acotar
+    if x_deadline_ms is not None and x_deadline_ms <= 0:
+        raise HTTPException(status_code=504, detail="Deadline agotado antes de redactar la respuesta")
+
     answer = nlg_answer(
         question=data.question,
         sql=data.sql,
@@ -281,7 +289,8 @@ def refine(data: RefineIn):
         rows=data.rows,
         lang=data.lang,
         tone=data.tone,
-        suggest_followups=data.suggest_followups
+        suggest_followups=data.suggest_followups,
+        approximate=data.approximate
     )
     return {
         "answer": answer,
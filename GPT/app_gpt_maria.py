@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 # app_gpt_maria.py - MAR-IA con NLG integrado
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import re
+import os
+import sys
+
+# Vocabulario y autómata de palabras clave compartidos con el conector y SQLCoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from keyword_matcher import AGRO_TOPICS, first_label, match_question
 
 app = FastAPI(title="MAR-IA - Modelo Agrícola Inteligente", version="3.0")
 
@@ -94,22 +100,7 @@ def answer_identity(intent: str, tone: str) -> str:
 
 # ===== DETECCIÓN DE TEMAS AGRÍCOLAS =====
 def detect_agro_topic(question: str) -> Optional[str]:
-    q = question.lower()
-    
-    topics = {
-        "cultivo": ["cultivar", "siembra", "plantar", "cultivo", "cosecha"],
-        "riego": ["riego", "agua", "irrigacion", "hidratar"],
-        "fertilizacion": ["fertiliz", "abono", "nutrient", "npk"],
-        "fertilizante_marca": ["yara", "yaramilas", "yaraliva", "yaratera", "monomeros", "abocol"],
-        "plagas": ["plaga", "enfermedad", "insecto", "control", "fungicida", "pesticida"],
-        "clima": ["clima", "temperatura", "lluvia", "sequia", "helada"],
-        "precio": ["precio", "venta", "mercado", "comercio"]
-    }
-    
-    for topic, keywords in topics.items():
-        if any(kw in q for kw in keywords):
-            return topic
-    return None
+    return first_label(match_question(question)["agro_topic"], AGRO_TOPICS)
 
 def generate_fertilizer_advice(question: str) -> str:
     """Genera respuestas específicas sobre fertilizantes y marcas"""
@@ -334,7 +325,8 @@ def nlg_answer(
     rows: List[Dict[str, Any]],
     lang: str = "es",
     tone: str = "amigable",
-    suggest_followups: bool = True
+    suggest_followups: bool = True,
+    approximate: bool = False
 ) -> str:
     # 1. VERIFICAR SI ES PREGUNTA SOBRE IDENTIDAD
     identity_intent = is_identity_question(question)
@@ -379,7 +371,13 @@ def nlg_answer(
                         n = first_val
             
             # Parafraseo natural con contexto
-            base = f"Según los datos del sistema, encontré {n} {subj}."
+            if approximate:
+                # Conteo estimado por el planificador: redondeado y presentado como tal
+                if isinstance(n, int) and n >= 1000:
+                    n = f"{round(n, -2):,}".replace(",", ".")
+                base = f"Según las estadísticas del sistema, hay aproximadamente {n} {subj}."
+            else:
+                base = f"Según los datos del sistema, encontré {n} {subj}."
             
             # Agregar contexto agrícola si es relevante
             if "compr" in question.lower():
@@ -430,6 +428,7 @@ class RefineIn(BaseModel):
     tone: str = "amigable"
     suggest_followups: bool = True
     max_new_tokens: int = 192
+    approximate: bool = False
 
 @app.get("/health")
 def health():
@@ -446,7 +445,7 @@ def get_identity():
     return MARIA_IDENTITY
 
 @app.post("/refine")
-def refine(data: RefineIn):
+def refine(data: RefineIn, x_deadline_ms: Optional[int] = Header(default=None)):
     """
     Endpoint principal que maneja respuestas híbridas:
     - Valida si los datos de BD son útiles o placeholders
@@ -454,6 +453,11 @@ def refine(data: RefineIn):
     - Proporciona conocimiento agrícola cuando no hay datos válidos
     - Se identifica como MAR-IA cuando se le pregunta
     """
+    # Presupuesto enviado por el conector: si ya no queda, no vale la pena redactar.
+    # Solo se comprueba a la entrada: la respuesta sale de plantillas y no hay generación que acotar
+    if x_deadline_ms is not None and x_deadline_ms <= 0:
+        raise HTTPException(status_code=504, detail="Deadline agotado antes de redactar la respuesta")
+
     answer = nlg_answer(
         question=data.question,
         sql=data.sql,
@@ -461,7 +465,8 @@ def refine(data: RefineIn):
         rows=data.rows,
         lang=data.lang,
         tone=data.tone,
-        suggest_followups=data.suggest_followups
+        suggest_followups=data.suggest_followups,
+        approximate=data.approximate
     )
     
     # Determinar fuente de la respuesta
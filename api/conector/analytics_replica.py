@@ -0,0 +1,706 @@
+# -*- coding: utf-8 -*-
+"""
+Réplica analítica local (SQLite) para preguntas de agregación.
+
+El conector copia las tablas de hechos más consultadas (producción, ingresos,
+costos, facturas) y sus dimensiones a un archivo SQLite que se adjunta con el
+alias "public", de modo que el SQL generado (public.farm_production, ...) se
+ejecuta sin reescritura. Solo se enrutan agregados cuyo resultado es idéntico
+en ambos motores (ver portable_aggregate_tables): COUNT/SUM/AVG/MIN/MAX con
+filtros de igualdad, sin LIKE, casts ni funciones propias de PostgreSQL. SUM y
+AVG se calculan en decimal exacto con la escala de numeric de PostgreSQL (el
+SUM/AVG nativo de SQLite acumula en coma flotante). Ante cualquier error de
+dialecto se vuelve a PostgreSQL.
+
+Uso offline (sin PostgreSQL), cargando el volcado de datos del repositorio:
+python analytics_replica.py \
+  --schema schema_catalog.yaml \
+  --from-sql ../../data/inserts_completos.sql \
+  --query "SELECT SUM(amount) AS total FROM public.farm_income"
+"""
+
+import os
+import re
+import time
+import decimal
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLES = (
+    "public.farm_production",
+    "public.farm_income",
+    "public.farm_cost",
+    "public.commerce_invoice",
+    # Dimensiones pequeñas para que los JOIN típicos también se resuelvan aquí
+    "public.farm_crop",
+    "public.farm_farm",
+    "public.commerce_buyer",
+)
+
+TABLE_REF_RE = re.compile(r"(?i)\b(?:FROM|JOIN)\s+([a-z0-9_]+)\.([a-z0-9_]+)\b")
+INSERT_RE = re.compile(r"(?is)^\s*INSERT\s+INTO\s+(?:([a-z0-9_]+)\.)?([a-z0-9_]+)\s*\(")
+
+
+def sqlite_type(pg_type: str) -> str:
+    """Afinidad SQLite para un tipo de PostgreSQL del catálogo"""
+    t = (pg_type or "").lower()
+    if any(k in t for k in ("int", "serial", "boolean")):
+        return "INTEGER"
+    if any(k in t for k in ("numeric", "decimal", "double", "real", "float", "money")):
+        return "REAL"
+    return "TEXT"
+
+
+def to_sqlite_value(value: Any) -> Any:
+    """Convierte valores de psycopg2 a tipos que SQLite almacena sin adaptadores"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return str(value)
+    return value
+
+
+def load_table_specs(schema_path: str, tables: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+    """Columnas (nombre, tipo) de cada tabla replicada según schema_catalog.yaml"""
+    wanted = {t.lower() for t in tables}
+    with open(schema_path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+
+    specs: Dict[str, List[Tuple[str, str]]] = {}
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            sname = (sch.get("name") or "public").lower()
+            for t in sch.get("tables", []):
+                full = f"{sname}.{(t.get('name') or '').lower()}"
+                if full in wanted:
+                    specs[full] = [
+                        (c["name"], c.get("type", "")) for c in t.get("columns", []) if c.get("name")
+                    ]
+
+    missing = wanted - set(specs)
+    if missing:
+        logger.warning(f"⚠️ Tablas de réplica ausentes del catálogo: {sorted(missing)}")
+    return specs
+
+
+# ---------- Subconjunto portable (mismo resultado en SQLite y PostgreSQL) ----------
+TOKEN_RE = re.compile(
+    r"\s*(?:('(?:[^']|'')*')|(\d+(?:\.\d+)?)|([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)|(\S))"
+)
+KEYWORDS = {"select", "from", "join", "inner", "on", "where", "and", "group", "by", "limit", "as", "is", "not", "null"}
+# Agregado -> tipos de columna admitidos (texto: la colación cambia MIN/MAX; real: PostgreSQL suma en float8)
+AGGREGATE_KINDS = {
+    "count": {"int", "numeric", "float", "date", "text", "other"},
+    "sum": {"int", "numeric"},
+    "avg": {"int", "numeric"},
+    "min": {"int", "numeric", "float", "date"},
+    "max": {"int", "numeric", "float", "date"},
+}
+GROUP_KINDS = {"int", "numeric", "date", "text"}
+ISO_DATE_RE = re.compile(r"^'\d{4}-\d{2}-\d{2}'$")
+
+
+def column_kind(pg_type: str) -> str:
+    """Clase de tipo para decidir qué operaciones dan lo mismo en ambos motores"""
+    t = (pg_type or "").lower().strip()
+    if t in ("smallint", "integer", "bigint", "int", "int2", "int4", "int8", "serial", "bigserial"):
+        return "int"
+    if t.startswith(("numeric", "decimal")):
+        return "numeric"
+    if t in ("real", "double precision", "float4", "float8"):
+        return "float"
+    if t == "date":
+        return "date"
+    if t in ("text", "varchar") or t.startswith(("character varying", "varchar(")):
+        return "text"
+    return "other"  # timestamps (texto ISO con zona), boolean, uuid, money, char(n)...
+
+
+class _NotPortable(Exception):
+    pass
+
+
+def portable_aggregate_tables(sql: str, table_specs: Dict[str, List[Tuple[str, str]]]) -> Optional[Set[str]]:
+    """Tablas de la consulta si es un agregado portable; None si no lo es"""
+    parsed = parse_portable_aggregate(sql, table_specs)
+    return parsed[0] if parsed else None
+
+
+def parse_portable_aggregate(sql: str, table_specs: Dict[str, List[Tuple[str, str]]]
+                             ) -> Optional[Tuple[Set[str], List[str]]]:
+    """
+    (tablas, nombres de columna que daría PostgreSQL) si es un agregado portable; None si no.
+    Gramática admitida:
+
+        SELECT agg(col|*) [AS a], col [AS a] ... FROM t [a] [JOIN t2 [a] ON x.id = y.t_id]...
+        [WHERE col = literal | col IS [NOT] NULL [AND ...]] [GROUP BY col, ...] [LIMIT n]
+
+    con agg en COUNT/SUM/AVG/MIN/MAX según el tipo de columna (AGGREGATE_KINDS), literales
+    del mismo tipo que la columna y sin ORDER BY (la colación y el orden de NULL difieren).
+    LIMIT solo sin GROUP BY: sin ORDER BY los grupos que entran serían arbitrarios.
+    Los nombres siguen a PostgreSQL (alias en minúsculas, `count`/`sum`... sin alias),
+    no a SQLite, que etiqueta con el texto de la expresión (`COUNT(*)`).
+    """
+    tokens = []
+    for string, number, ident, symbol in TOKEN_RE.findall(sql.strip().rstrip(";")):
+        if string:
+            tokens.append(("str", string))
+        elif number:
+            tokens.append(("num", number))
+        elif ident:
+            tokens.append(("kw" if ident.lower() in KEYWORDS else "id", ident.lower()))
+        elif symbol:
+            if symbol not in "(),=*":
+                return None
+            tokens.append(("sym", symbol))
+    pos = 0
+
+    def peek(kind: Optional[str] = None, value: Optional[str] = None) -> bool:
+        if pos >= len(tokens):
+            return False
+        k, v = tokens[pos]
+        return (kind is None or k == kind) and (value is None or v == value)
+
+    def take(kind: Optional[str] = None, value: Optional[str] = None) -> str:
+        nonlocal pos
+        if not peek(kind, value):
+            raise _NotPortable()
+        pos += 1
+        return tokens[pos - 1][1]
+
+    def alias() -> Optional[str]:
+        if peek("kw", "as"):
+            take()
+            return take("id")
+        if peek("id"):
+            return take()
+        return None
+
+    try:
+        take("kw", "select")
+        items = []  # (agregado o None, referencia de columna o "*")
+        names = []  # nombre de la columna de salida en PostgreSQL
+        while True:
+            if peek("id") and pos + 1 < len(tokens) and tokens[pos + 1] == ("sym", "("):
+                func = take("id")
+                if func not in AGGREGATE_KINDS:
+                    raise _NotPortable()
+                take("sym", "(")
+                ref = take("sym", "*") if func == "count" and peek("sym", "*") else take("id")
+                take("sym", ")")
+                items.append((func, ref))
+            else:
+                items.append((None, take("id")))
+            func, ref = items[-1]
+            names.append(alias() or func or ref.rsplit(".", 1)[-1])
+            if not peek("sym", ","):
+                break
+            take()
+
+        aliases: Dict[str, str] = {}
+        joins = []
+
+        def table_ref():
+            name = take("id")
+            if name not in table_specs:
+                raise _NotPortable()
+            aliases[name] = aliases[name.split(".", 1)[1]] = name
+            if peek("kw", "as"):
+                take()
+            if peek("id"):
+                aliases[take()] = name
+
+        take("kw", "from")
+        table_ref()
+        while peek("kw", "join") or peek("kw", "inner"):
+            if peek("kw", "inner"):
+                take()
+            take("kw", "join")
+            table_ref()
+            take("kw", "on")
+            left = take("id")
+            take("sym", "=")
+            joins.append((left, take("id")))
+
+        filters = []
+        if peek("kw", "where"):
+            take()
+            while True:
+                ref = take("id")
+                if peek("kw", "is"):
+                    take()
+                    if peek("kw", "not"):
+                        take()
+                    take("kw", "null")
+                    filters.append((ref, None))
+                else:
+                    take("sym", "=")
+                    if peek("str") or peek("num"):
+                        filters.append((ref, tokens[pos]))
+                        take()
+                    else:
+                        raise _NotPortable()
+                if not peek("kw", "and"):
+                    break
+                take()
+
+        group = []
+        if peek("kw", "group"):
+            take()
+            take("kw", "by")
+            group.append(take("id"))
+            while peek("sym", ","):
+                take()
+                group.append(take("id"))
+
+        if peek("kw", "limit"):
+            take()
+            if "." in take("num") or group:
+                raise _NotPortable()
+        if pos != len(tokens):
+            raise _NotPortable()
+
+        tables = set(aliases.values())
+        kinds = {}
+        for table in tables:
+            for col, pg_type in table_specs[table]:
+                kinds.setdefault(col.lower(), []).append((table, column_kind(pg_type)))
+
+        def kind_of(ref: str) -> str:
+            """Tipo de col / alias.col (ambigua o desconocida: no portable)"""
+            if "." in ref:
+                prefix, col = ref.rsplit(".", 1)
+                if prefix not in aliases:
+                    raise _NotPortable()
+                found = [k for t, k in kinds.get(col, []) if t == aliases[prefix]]
+            else:
+                found = [k for _, k in kinds.get(ref, [])]
+            if len(found) != 1:
+                raise _NotPortable()
+            return found[0]
+
+        if not any(func for func, _ in items):
+            raise _NotPortable()
+        for func, ref in items:
+            if func is None:
+                if ref not in group:
+                    raise _NotPortable()  # PostgreSQL exige que las columnas sueltas estén en GROUP BY
+            elif ref != "*" and kind_of(ref) not in AGGREGATE_KINDS[func]:
+                raise _NotPortable()
+        for left, right in joins:
+            if kind_of(left) != "int" or kind_of(right) != "int":
+                raise _NotPortable()
+        for ref, literal in filters:
+            kind = kind_of(ref)
+            if literal is None:
+                continue
+            literal_kind, value = literal
+            ok = (
+                (kind == "int" and literal_kind == "num" and "." not in value)
+                or (kind in ("numeric", "float") and literal_kind == "num")
+                or (kind == "text" and literal_kind == "str")
+                or (kind == "date" and literal_kind == "str" and ISO_DATE_RE.match(value))
+            )
+            if not ok:
+                raise _NotPortable()
+        if any(kind_of(ref) not in GROUP_KINDS for ref in group):
+            raise _NotPortable()
+        return tables, names
+    except _NotPortable:
+        return None
+
+
+def _exact(value: Any) -> decimal.Decimal:
+    """Decimal exacto del valor guardado (los numeric se guardan como REAL de hasta 15 dígitos)"""
+    return decimal.Decimal(repr(value)) if isinstance(value, float) else decimal.Decimal(value)
+
+
+def _pg_weight(value: decimal.Decimal) -> Tuple[int, int]:
+    """(peso, primer dígito) de la representación base 10000 de numeric en PostgreSQL"""
+    if not value:
+        return 0, 0
+    weight = value.copy_abs().adjusted() // 4
+    return weight, int(value.copy_abs().scaleb(-4 * weight))
+
+
+def _json_number(value: decimal.Decimal):
+    """Lo mismo que FastAPI hace con el Decimal de psycopg2: int sin decimales, float si los tiene"""
+    return int(value) if value.as_tuple().exponent >= 0 else float(value)
+
+
+class ExactSum:
+    """SUM en decimal exacto (PostgreSQL suma numeric sin redondeo)"""
+
+    def __init__(self):
+        self.total: Optional[decimal.Decimal] = None
+
+    def step(self, value):
+        if value is not None:
+            self.total = _exact(value) + (self.total or 0)
+
+    def finalize(self):
+        return None if self.total is None else _json_number(self.total)
+
+
+class ExactAvg(ExactSum):
+    """AVG como numeric_div de PostgreSQL: al menos 16 cifras significativas, redondeo half-up"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.scale = 0
+
+    def step(self, value):
+        if value is not None:
+            exact = _exact(value)
+            self.count += 1
+            self.scale = max(self.scale, -exact.as_tuple().exponent)
+            self.total = exact + (self.total or 0)
+
+    def finalize(self):
+        if not self.count:
+            return None
+        (w1, d1), (w2, d2) = _pg_weight(self.total), _pg_weight(decimal.Decimal(self.count))
+        qweight = w1 - w2 - (1 if d1 <= d2 else 0)
+        rscale = min(max(16 - qweight * 4, self.scale, 0), 1000)
+        with decimal.localcontext() as ctx:
+            ctx.prec = rscale + 60
+            quotient = (self.total / self.count).quantize(
+                decimal.Decimal(1).scaleb(-rscale), rounding=decimal.ROUND_HALF_UP
+            )
+        return _json_number(quotient)
+
+
+class AnalyticsReplica:
+    """Réplica SQLite de solo lectura para agregados sobre tablas de hechos"""
+
+    engine = "sqlite"
+
+    def __init__(
+        self,
+        path: str,
+        table_specs: Dict[str, List[Tuple[str, str]]],
+        max_staleness_seconds: float = 900
+    ):
+        self.path = path
+        self.table_specs = table_specs
+        self.max_staleness_seconds = max_staleness_seconds
+        self.synced_at: Dict[str, float] = {}
+        self.row_counts: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._writer() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _replica_meta "
+                "(table_name TEXT PRIMARY KEY, synced_at REAL, row_count INTEGER)"
+            )
+            for name, synced_at, count in conn.execute("SELECT * FROM _replica_meta"):
+                if name in table_specs:
+                    self.synced_at[name] = synced_at
+                    self.row_counts[name] = count
+
+    # ---------- Conexiones ----------
+    def _writer(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _reader(self) -> sqlite3.Connection:
+        """Conexión por hilo con el archivo adjunto como esquema 'public'"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.execute("ATTACH DATABASE ? AS public", (self.path,))
+            conn.execute("PRAGMA query_only=ON")
+            # SUM/AVG con la aritmética de numeric de PostgreSQL en lugar de coma flotante
+            conn.create_aggregate("sum", 1, ExactSum)
+            conn.create_aggregate("avg", 1, ExactAvg)
+            self._local.conn = conn
+        return conn
+
+    @property
+    def tables(self) -> Set[str]:
+        return set(self.table_specs)
+
+    # ---------- Sincronización ----------
+    def _create_table_sql(self, name: str, table: str) -> str:
+        cols = ", ".join(f'"{c}" {sqlite_type(t)}' for c, t in self.table_specs[table])
+        return f'CREATE TABLE "{name}" ({cols})'
+
+    def _has_id(self, table: str) -> bool:
+        return any(c == "id" for c, _ in self.table_specs[table])
+
+    def _index_id(self, conn: sqlite3.Connection, short: str, table: str):
+        """Índice por id para aplicar cambios incrementales sin recorrer la tabla"""
+        if self._has_id(table):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{short}_id_idx" ON "{short}"(id)')
+
+    def replace_table(self, table: str, rows: Iterable[Tuple], batch_size: int = 5000) -> int:
+        """Recarga completa de una tabla: se escribe en una tabla nueva y se intercambia"""
+        short = table.split(".", 1)[1]
+        tmp = f"{short}__new"
+        ncols = len(self.table_specs[table])
+        placeholders = ", ".join("?" for _ in range(ncols))
+        total = 0
+
+        with self._write_lock:
+            conn = self._writer()
+            try:
+                conn.execute(f'DROP TABLE IF EXISTS "{tmp}"')
+                conn.execute(self._create_table_sql(tmp, table))
+                conn.execute("BEGIN")
+                batch: List[Tuple] = []
+                for row in rows:
+                    batch.append(tuple(to_sqlite_value(v) for v in row))
+                    if len(batch) >= batch_size:
+                        conn.executemany(f'INSERT INTO "{tmp}" VALUES ({placeholders})', batch)
+                        total += len(batch)
+                        batch = []
+                if batch:
+                    conn.executemany(f'INSERT INTO "{tmp}" VALUES ({placeholders})', batch)
+                    total += len(batch)
+                conn.execute(f'DROP TABLE IF EXISTS "{short}"')
+                conn.execute(f'ALTER TABLE "{tmp}" RENAME TO "{short}"')
+                self._index_id(conn, short, table)
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO _replica_meta VALUES (?, ?, ?)", (table, now, total)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+        self.synced_at[table] = now
+        self.row_counts[table] = total
+        logger.info(f"🧮 Réplica: {table} sincronizada ({total} filas)")
+        return total
+
+    def sync_from_postgres(self, connection_factory: Callable) -> Dict[str, int]:
+        """Copia completa de cada tabla replicada usando un cursor de servidor"""
+        counts: Dict[str, int] = {}
+        for table, cols in self.table_specs.items():
+            col_list = ", ".join(f'"{c}"' for c, _ in cols)
+            with connection_factory() as conn:
+                with conn.cursor(name=f"replica_{table.replace('.', '_')}") as cur:
+                    cur.itersize = 5000
+                    cur.execute(f"SELECT {col_list} FROM {table}")
+                    counts[table] = self.replace_table(table, cur)
+        self.last_error = None
+        return counts
+
+    def load_sql_dump(self, sql_path: str) -> Dict[str, int]:
+        """
+        Carga offline desde un script de INSERTs (data/inserts_completos.sql).
+        Solo se ejecutan los INSERT de tablas replicadas; el resto se ignora.
+        """
+        by_table: Dict[str, List[str]] = {t: [] for t in self.table_specs}
+        with open(sql_path, "r", encoding="utf-8") as f:
+            for stmt in f:
+                m = INSERT_RE.match(stmt)
+                if not m:
+                    continue
+                table = f"{(m.group(1) or 'public').lower()}.{m.group(2).lower()}"
+                if table in by_table:
+                    by_table[table].append(stmt.strip())
+
+        counts: Dict[str, int] = {}
+        with self._write_lock:
+            conn = self._writer()
+            try:
+                for table, stmts in by_table.items():
+                    short = table.split(".", 1)[1]
+                    conn.execute("BEGIN")
+                    conn.execute(f'DROP TABLE IF EXISTS "{short}"')
+                    conn.execute(self._create_table_sql(short, table))
+                    for stmt in stmts:
+                        conn.execute(stmt.rstrip(";"))
+                    self._index_id(conn, short, table)
+                    now = time.time()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO _replica_meta VALUES (?, ?, ?)", (table, now, len(stmts))
+                    )
+                    conn.execute("COMMIT")
+                    self.synced_at[table] = now
+                    self.row_counts[table] = len(stmts)
+                    counts[table] = len(stmts)
+            finally:
+                conn.close()
+        return counts
+
+    def apply_change_event(self, event: Dict[str, Any]):
+        """
+        Aplica un evento de change_capture: inserciones/actualizaciones por id,
+        borrados por id y checkpoints como marca de frescura. Si un cambio llega
+        sin fila (NOTIFY demasiado grande) la tabla se marca como no sincronizada
+        hasta la siguiente copia completa. Reaplicar un evento es inocuo: el
+        conteo de filas sale de lo borrado e insertado de verdad.
+        """
+        table = event.get("table")
+        if table not in self.table_specs:
+            return
+
+        kind = event.get("kind")
+        rows = event.get("rows") or []
+        old_rows = event.get("old_rows") or []
+        short = table.split(".", 1)[1]
+        cols = [c for c, _ in self.table_specs[table]]
+
+        if kind == "checkpoint":
+            if table in self.synced_at:
+                self.synced_at[table] = max(self.synced_at[table], event.get("at", time.time()))
+            return
+
+        if kind in ("update", "delete") and (not rows or not self._has_id(table)):
+            self.synced_at.pop(table, None)
+            logger.warning(f"⚠️ Réplica: cambio sin fila en {table}, se espera copia completa")
+            return
+
+        with self._write_lock:
+            conn = self._writer()
+            try:
+                conn.execute("BEGIN")
+                delta = 0
+                if self._has_id(table):
+                    # En UPDATE el id anterior también sale (por si el cambio fue del propio id)
+                    ids = sorted({r.get("id") for r in rows + old_rows})
+                    delta -= conn.executemany(f'DELETE FROM "{short}" WHERE id = ?', [(i,) for i in ids]).rowcount
+                if kind != "delete":
+                    placeholders = ", ".join("?" for _ in cols)
+                    delta += conn.executemany(
+                        f'INSERT INTO "{short}" VALUES ({placeholders})',
+                        [tuple(to_sqlite_value(r.get(c)) for c in cols) for r in rows]
+                    ).rowcount
+                conn.execute(
+                    "UPDATE _replica_meta SET row_count = row_count + ? WHERE table_name = ?", (delta, table)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+        if table in self.row_counts:
+            self.row_counts[table] += delta
+
+    def start_background_sync(self, connection_factory: Callable, interval_seconds: float):
+        """Sincroniza en segundo plano cada interval_seconds"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync_from_postgres(connection_factory)
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Sincronización de réplica falló: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="analytics-replica-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- Enrutamiento ----------
+    def freshness(self, tables: Iterable[str]) -> Optional[float]:
+        """Antigüedad (s) de la tabla menos reciente; None si alguna no se ha sincronizado"""
+        stamps = [self.synced_at.get(t) for t in tables]
+        if not stamps or any(s is None for s in stamps):
+            return None
+        return time.time() - min(stamps)
+
+    def can_answer(self, sql: str, used_tables: Set[str]) -> bool:
+        """Solo agregados portables (mismo resultado que PostgreSQL) sobre tablas replicadas y frescas"""
+        if not sql or not used_tables:
+            return False
+        referenced = portable_aggregate_tables(sql, self.table_specs)
+        if referenced is None:
+            return False
+        tables = set(used_tables) | referenced
+        if not tables.issubset(self.tables):
+            return False
+        age = self.freshness(tables)
+        return age is not None and age <= self.max_staleness_seconds
+
+    def query(self, sql: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Ejecuta el SQL en la réplica; sqlite3.Error si el dialecto no es compatible.
+        Las columnas de un agregado portable se renombran como las nombraría PostgreSQL.
+        """
+        cur = self._reader().execute(sql.strip().rstrip(";"))
+        cols = [d[0] for d in cur.description] if cur.description else []
+        parsed = parse_portable_aggregate(sql, self.table_specs)
+        if parsed and len(parsed[1]) == len(cols):
+            cols = parsed[1]
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        return rows, cols
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.engine,
+            "path": self.path,
+            "tables": {
+                t: {
+                    "rows": self.row_counts.get(t),
+                    "synced_at": self.synced_at.get(t),
+                    "freshness_seconds": (
+                        round(time.time() - self.synced_at[t], 1) if t in self.synced_at else None
+                    ),
+                }
+                for t in sorted(self.table_specs)
+            },
+            "max_staleness_seconds": self.max_staleness_seconds,
+            "last_error": self.last_error,
+        }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga y consulta la réplica analítica sin PostgreSQL")
+    ap.add_argument("--schema", default="schema_catalog.yaml")
+    ap.add_argument("--path", default="analytics_replica.sqlite")
+    ap.add_argument("--tables", default=",".join(DEFAULT_TABLES))
+    ap.add_argument("--from-sql", dest="from_sql", default=None, help="Script de INSERTs a cargar")
+    ap.add_argument("--query", default=None, help="SQL de agregación a ejecutar en la réplica")
+    args = ap.parse_args()
+
+    specs = load_table_specs(args.schema, [t.strip() for t in args.tables.split(",") if t.strip()])
+    replica = AnalyticsReplica(args.path, specs, max_staleness_seconds=float("inf"))
+
+    if args.from_sql:
+        counts = replica.load_sql_dump(args.from_sql)
+        print(f"[ok] Réplica cargada en {args.path}: {counts}")
+
+    if args.query:
+        used = {f"{s.lower()}.{t.lower()}" for s, t in TABLE_REF_RE.findall(args.query)}
+        print(f"[route] replica={replica.can_answer(args.query, used)}")
+        start = time.perf_counter()
+        rows, cols = replica.query(args.query)
+        print(f"[ok] {len(rows)} filas en {(time.perf_counter() - start) * 1000:.2f} ms")
+        for r in rows[:20]:
+            print(r)
+
+
+if __name__ == "__main__":
+    main()
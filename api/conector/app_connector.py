@@ -1,12 +1,25 @@
 # app_connector.py - VERSIÓN CORREGIDA Y OPTIMIZADA
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-import os, re, yaml, requests, difflib
+import os, re, sys, json, requests, difflib, secrets, hashlib
+import time, threading
 import psycopg2, psycopg2.extras
-from typing import Optional, Set, List, Dict, Tuple
+from typing import Optional, Set, List, Dict, Tuple, Any
+from collections import OrderedDict, deque
 from contextlib import contextmanager
 import logging
 from fastapi.middleware.cors import CORSMiddleware
+from analytics_replica import AnalyticsReplica, DEFAULT_TABLES, load_table_specs
+from change_capture import ChangeCapture
+from rollups import RollupManager, ROLLUP_SPECS
+from bulk_export import stream_csv, stream_parquet, parquet_available
+from catalog_artifact import compile_yaml, default_artifact_path, load_for_yaml, similar_tables, build_trigram_index
+from value_index import ValueIndex, DEFAULT_VALUE_COLUMNS, add_where_conditions, mask_quoted
+
+# Vocabulario y autómata de palabras clave compartidos con SQLCoder y el NLG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from keyword_matcher import TABLE_PREFIXES as KEYWORD_TABLE, match_question
 
 # ====== CONFIGURACIÓN DE LOGGING ======
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +29,8 @@ logger = logging.getLogger(__name__)
 SQLCODER_URL = os.getenv("SQLCODER_URL", "http://127.0.0.1:8011/generate_sql")
 NLG_URL      = os.getenv("NLG_URL", "http://127.0.0.1:8002/refine")
 SCHEMA_PATH  = os.getenv("SCHEMA_PATH", "/workspace/api/conector/schema_catalog.yaml")
+# Catálogo compilado por gen_schema.py; si falta o no corresponde al YAML se compila al vuelo
+CATALOG_ARTIFACT_PATH = os.getenv("CATALOG_ARTIFACT_PATH", "") or default_artifact_path(SCHEMA_PATH)
 
 # Variables críticas de PostgreSQL
 PG_HOST = os.getenv("PG_HOST")
@@ -27,7 +42,84 @@ PG_SSL  = os.getenv("PG_SSLMODE", "prefer")
 
 MAX_RETRIES = 3
 SQLCODER_TIMEOUT = int(os.getenv("SQLCODER_TIMEOUT", "180"))  # Timeout configurable
+# Enviar a SQLCoder solo la huella (sha256) del esquema cuando ya lo confirmó, no el texto completo
+SQLCODER_SCHEMA_FINGERPRINT = os.getenv("SQLCODER_SCHEMA_FINGERPRINT", "true").lower() in ("1", "true", "yes")
 MAX_ROWS_LIMIT = 1000  # Límite de seguridad
+NLG_TIMEOUT = int(os.getenv("NLG_TIMEOUT", "120"))
+
+# Presupuesto total por petición (sobrescribible con AskIn.timeout_seconds)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+MAX_REQUEST_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "600"))
+MIN_STAGE_SECONDS = float(os.getenv("MIN_STAGE_SECONDS", "1"))  # Por debajo no vale la pena lanzar otra etapa
+# Presupuesto restante que se reenvía a SQLCoder y NLG: SQLCoder con modelo lo usa como max_time de
+# generate(); el motor de reglas y NLG (plantillas, sin generación que cortar) solo responden 504 si llega agotado
+DEADLINE_HEADER = "X-Deadline-Ms"
+# Marca las llamadas de la reproducción del calentamiento: SQLCoder no cuenta aciertos de memoria
+WARMUP_HEADER = "X-Warmup"
+
+# Circuit breakers (por dependencia: SQLCoder, NLG, PostgreSQL)
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))  # Proporción de llamadas malas que abre el breaker
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))                 # Últimas N llamadas consideradas
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))            # Mínimo de llamadas antes de evaluar
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))   # Tiempo abierto antes de probar (half-open)
+SQLCODER_SLOW_SECONDS = float(os.getenv("SQLCODER_SLOW_SECONDS", "60"))
+NLG_SLOW_SECONDS = float(os.getenv("NLG_SLOW_SECONDS", "30"))
+PG_SLOW_SECONDS = float(os.getenv("PG_SLOW_SECONDS", "5"))
+HEALTH_DB_TIMEOUT_SECONDS = float(os.getenv("HEALTH_DB_TIMEOUT_SECONDS", "3"))  # Presupuesto de la prueba de BD en /health
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))  # Resultados guardados para servir en modo stale
+
+# Réplica analítica local (SQLite) para agregados sobre tablas de hechos
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "false").lower() in ("1", "true", "yes")
+REPLICA_PATH = os.getenv("REPLICA_PATH", "/workspace/api/conector/analytics_replica.sqlite")
+REPLICA_TABLES = [t.strip().lower() for t in os.getenv("REPLICA_TABLES", ",".join(DEFAULT_TABLES)).split(",") if t.strip()]
+REPLICA_SYNC_SECONDS = float(os.getenv("REPLICA_SYNC_SECONDS", "300"))
+REPLICA_MAX_STALENESS_SECONDS = float(os.getenv("REPLICA_MAX_STALENESS_SECONDS", "900"))
+
+# Paginación de listados: tokens de continuación guardados en memoria
+PAGE_TOKEN_TTL_SECONDS = float(os.getenv("PAGE_TOKEN_TTL_SECONDS", "900"))
+PAGE_TOKEN_MAX_ENTRIES = int(os.getenv("PAGE_TOKEN_MAX_ENTRIES", "1000"))
+
+# Exportación masiva (/export): tiempo máximo de la sentencia COPY
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "600"))
+# Vigencia del export_token que /ask emite con cada consulta ejecutada
+EXPORT_TOKEN_TTL_SECONDS = float(os.getenv("EXPORT_TOKEN_TTL_SECONDS", "900"))
+
+# Calentamiento al arrancar (catálogo, BD, SQLCoder, NLG y preguntas frecuentes)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# La primera carga de SQLCoder 7B puede tardar minutos
+WARMUP_SQLCODER_TIMEOUT = int(os.getenv("WARMUP_SQLCODER_TIMEOUT", "600"))
+WARMUP_REPLAY_TOP_N = int(os.getenv("WARMUP_REPLAY_TOP_N", "0"))
+# Catálogo y BD son obligatorios para /ready: se reintentan cada N segundos hasta que respondan
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+QUESTION_HISTORY_PATH = os.getenv("QUESTION_HISTORY_PATH", "/workspace/api/conector/question_history.json")
+
+# Conteos aproximados: COUNT(*) sin filtros se responde con pg_class.reltuples
+APPROX_COUNTS_ENABLED = os.getenv("APPROX_COUNTS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Por debajo de este tamaño estimado el conteo exacto es barato y se mantiene
+APPROX_COUNT_MIN_ROWS = int(os.getenv("APPROX_COUNT_MIN_ROWS", "100000"))
+
+# Rollups precalculados (día/semana/mes) para producción, ingresos y costos
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() in ("1", "true", "yes")
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))
+ROLLUP_RECENT_DAYS = int(os.getenv("ROLLUP_RECENT_DAYS", "35"))
+ROLLUP_MAX_STALENESS_SECONDS = float(os.getenv("ROLLUP_MAX_STALENESS_SECONDS", "900"))
+
+# Captura incremental de cambios (watermarks + LISTEN/NOTIFY opcional)
+CDC_ENABLED = os.getenv("CDC_ENABLED", "false").lower() in ("1", "true", "yes")
+CDC_TABLES = [t.strip().lower() for t in os.getenv("CDC_TABLES", ",".join(REPLICA_TABLES)).split(",") if t.strip()]
+CDC_POLL_SECONDS = float(os.getenv("CDC_POLL_SECONDS", "15"))
+CDC_LISTEN = os.getenv("CDC_LISTEN", "false").lower() in ("1", "true", "yes")
+CDC_INSTALL_TRIGGERS = os.getenv("CDC_INSTALL_TRIGGERS", "false").lower() in ("1", "true", "yes")
+CDC_STATE_PATH = os.getenv("CDC_STATE_PATH", "/workspace/api/conector/cdc_state.json")
+# Con CDC activo la caché puede servir aciertos frescos (se invalidan por tabla); 0 = solo fallback stale
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "0"))
+
+# Índice de valores (filtros literales como "finca La Esperanza" sin otra llamada al modelo)
+VALUE_INDEX_ENABLED = os.getenv("VALUE_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+VALUE_INDEX_COLUMNS = [c.strip().lower() for c in os.getenv("VALUE_INDEX_COLUMNS", ",".join(DEFAULT_VALUE_COLUMNS)).split(",") if c.strip()]
+VALUE_INDEX_MAX_DISTINCT = int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "2000"))  # Columnas con más valores no se indexan
+VALUE_INDEX_REFRESH_SECONDS = float(os.getenv("VALUE_INDEX_REFRESH_SECONDS", "3600"))
+VALUE_MATCH_THRESHOLD = float(os.getenv("VALUE_MATCH_THRESHOLD", "0.6"))  # Similitud mínima de trigramas
 
 # Validación de configuración al inicio
 def validate_config():
@@ -65,11 +157,423 @@ app.add_middleware(
     max_age=3600
 )
 
+# ====== DEADLINES ======
+class Deadline:
+    """Presupuesto de tiempo de una petición; cada etapa recibe lo que queda como timeout"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self, margin: float = 0.0) -> bool:
+        return self.remaining() <= margin
+
+    def timeout(self, cap: float) -> float:
+        """Timeout para la siguiente etapa: el menor entre su límite propio y lo que queda"""
+        return max(0.001, min(cap, self.remaining()))
+
+    def headers(self) -> Dict[str, str]:
+        return {DEADLINE_HEADER: str(int(self.remaining() * 1000))}
+
+def elapsed_ms(start: float) -> float:
+    """Milisegundos transcurridos desde start (time.perf_counter)"""
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def stage_budget(deadline: Optional["Deadline"], cap: float) -> Tuple[float, Dict[str, str]]:
+    """Timeout y cabeceras para una llamada saliente, con o sin deadline"""
+    if deadline is None:
+        return cap, {}
+    return deadline.timeout(cap), deadline.headers()
+
+# ====== CIRCUIT BREAKERS ======
+class CircuitBreaker:
+    """
+    Breaker por dependencia con estados closed → open → half_open.
+
+    Se abre cuando, en las últimas BREAKER_WINDOW llamadas, la proporción de
+    fallos o llamadas lentas (> slow_call_seconds) supera failure_rate.
+    Tras open_seconds deja pasar una única llamada de prueba (half_open).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        open_seconds: float = BREAKER_OPEN_SECONDS
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes: deque = deque(maxlen=window)  # True = llamada mala
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.total_rejected = 0
+        self.times_opened = 0
+
+    def _cooldown_expired(self) -> bool:
+        return self._opened_at is not None and time.time() - self._opened_at >= self.open_seconds
+
+    def is_open(self) -> bool:
+        """True si el breaker rechazaría llamadas ahora mismo (sin consumir la prueba)"""
+        with self._lock:
+            if self.state == "open":
+                return not self._cooldown_expired()
+            return self.state == "half_open" and self._probe_in_flight
+
+    def allow_request(self) -> bool:
+        """Decide si la llamada puede salir hacia la dependencia"""
+        with self._lock:
+            if self.state == "open" and self._cooldown_expired():
+                self.state = "half_open"
+                self._probe_in_flight = False
+                logger.info(f"🟡 Breaker '{self.name}' en half-open, probando dependencia")
+
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.total_rejected += 1
+            return False
+
+    def record_success(self, elapsed: float):
+        """Registra una llamada completada; si fue lenta cuenta como mala"""
+        self._record(bad=elapsed > self.slow_call_seconds)
+
+    def record_failure(self):
+        self._record(bad=True)
+
+    def release_probe(self):
+        """Llamada abandonada sin resultado: no cuenta, pero en half-open deja probar a otra"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def _record(self, bad: bool):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if bad:
+                    self._open()
+                else:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    self._opened_at = None
+                    logger.info(f"🟢 Breaker '{self.name}' cerrado de nuevo")
+                return
+
+            self._outcomes.append(bad)
+            if self.state == "closed" and len(self._outcomes) >= self.min_calls:
+                rate = sum(self._outcomes) / len(self._outcomes)
+                if rate >= self.failure_rate:
+                    self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.time()
+        self.times_opened += 1
+        logger.warning(f"🔴 Breaker '{self.name}' abierto durante {self.open_seconds}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado del breaker para /health"""
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "recent_bad_rate": round(sum(self._outcomes) / calls, 3) if calls else 0.0,
+                "opened_at": self._opened_at,
+                "retry_in_seconds": (
+                    max(0.0, round(self.open_seconds - (time.time() - self._opened_at), 1))
+                    if self.state == "open" and self._opened_at else 0.0
+                ),
+                "times_opened": self.times_opened,
+                "total_rejected": self.total_rejected,
+            }
+
+sqlcoder_breaker = CircuitBreaker("sqlcoder", slow_call_seconds=SQLCODER_SLOW_SECONDS)
+nlg_breaker = CircuitBreaker("nlg", slow_call_seconds=NLG_SLOW_SECONDS)
+db_breaker = CircuitBreaker("postgres", slow_call_seconds=PG_SLOW_SECONDS)
+
+# ====== CACHÉ DE RESULTADOS (fallback stale) ======
+class ResultCache:
+    """LRU de resultados por SQL; se sirve marcada como stale cuando la BD no está disponible"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(sql: str) -> str:
+        return re.sub(r"\s+", " ", (sql or "").strip().rstrip(";")).lower()
+
+    def put(self, sql: str, rows: List[Dict], columns: List[str], tables: Set[str]):
+        if self.max_entries <= 0:
+            return
+        entry = {
+            "rows": [dict(r) for r in rows],
+            "columns": list(columns),
+            "tables": sorted(tables),
+            "stored_at": time.time(),
+        }
+        with self._lock:
+            key = self._key(sql)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, sql: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            key = self._key(sql)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_fresh(self, sql: str, ttl_seconds: float) -> Optional[Dict[str, Any]]:
+        """Entrada vigente: no invalidada por cambios y más nueva que ttl_seconds"""
+        if ttl_seconds <= 0:
+            return None
+        entry = self.get(sql)
+        if entry is None or entry.get("invalidated_at"):
+            return None
+        if time.time() - entry["stored_at"] > ttl_seconds:
+            return None
+        self.hits += 1
+        return entry
+
+    def invalidate_tables(self, tables: Set[str]) -> int:
+        """
+        Marca como invalidadas las entradas que leen alguna de las tablas.
+        Se conservan para el fallback stale (que ya informa su antigüedad).
+        """
+        now = time.time()
+        count = 0
+        with self._lock:
+            for entry in self._entries.values():
+                if not entry.get("invalidated_at") and tables.intersection(entry["tables"]):
+                    entry["invalidated_at"] = now
+                    count += 1
+        self.invalidations += count
+        return count
+
+    def on_change_event(self, event: Dict[str, Any]):
+        """Suscriptor de change_capture: cualquier cambio real invalida la tabla"""
+        if event.get("kind") != "checkpoint":
+            self.invalidate_tables({event.get("table")})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "fresh_hits": self.hits,
+                "invalidations": self.invalidations,
+            }
+
+result_cache = ResultCache()
+
+# ====== PAGINACIÓN POR KEYSET ======
+class PageTokenStore:
+    """
+    Tokens opacos de continuación para listados. Cada token guarda en el servidor
+    la consulta ya validada (tabla y columnas del atajo, o el SQL generado sin
+    ORDER BY/LIMIT), el límite y las claves de la última fila entregada, así
+    /ask/next no vuelve a llamar a SQLCoder ni usa OFFSET.
+    También guarda los export_token de /export (SQL generado por el servidor).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def issue(self, state: Dict[str, Any]) -> str:
+        token = secrets.token_urlsafe(18)
+        with self._lock:
+            self._entries[token] = {**state, "issued_at": time.time()}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._entries.get(token)
+            if state is None:
+                return None
+            if time.time() - state["issued_at"] > self.ttl_seconds:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return state
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"active_tokens": len(self._entries), "ttl_seconds": self.ttl_seconds}
+
+page_tokens = PageTokenStore(PAGE_TOKEN_MAX_ENTRIES, PAGE_TOKEN_TTL_SECONDS)
+export_tokens = PageTokenStore(PAGE_TOKEN_MAX_ENTRIES, EXPORT_TOKEN_TTL_SECONDS)
+
+# Motivos de next_token = null (campo next_token_reason de /ask y /ask/next)
+NO_PAGE_LAST = "last_page"                      # la página vino incompleta: no hay más filas
+NO_PAGE_UNIQUE_ORDER = "no_unique_order"        # el orden no incluye una clave única (PK o id)
+NO_PAGE_KEY_NOT_SELECTED = "order_key_not_selected"  # las columnas del orden no están en el resultado
+NO_PAGE_UNSUPPORTED = "unsupported_query"       # agregados, JOIN, subconsultas, sin ORDER BY ... LIMIT
+
+def next_page_token(table: str, cols: List[str], limit: int, rows: List[Dict], page: int,
+                    where: Optional[List[str]] = None) -> Tuple[Optional[str], Optional[str]]:
+    """(token, None) para la página siguiente del atajo de listado, o (None, motivo)"""
+    unique = table_unique_key(table, cols)
+    if not unique:
+        return None, NO_PAGE_UNIQUE_ORDER
+    if not rows or len(rows) < limit:
+        return None, NO_PAGE_LAST
+    last = rows[-1]
+    return page_tokens.issue({
+        "table": table,
+        "columns": cols,
+        "limit": limit,
+        "after": [last.get(k) for k in list_order_columns(cols, unique)],
+        "where": where or [],
+        "page": page + 1,
+    }), None
+
+GENERATED_PAGE_RE = re.compile(r"(?is)^(?P<base>.+?)\s+ORDER\s+BY\s+(?P<order>.+?)\s+LIMIT\s+(?P<limit>\d+)$")
+ORDER_ITEM_RE = re.compile(r"(?i)^\s*(?P<col>[A-Za-z_][\w\.]*)(?:\s+(?P<dir>ASC|DESC))?\s*$")
+NOT_PAGEABLE_RE = re.compile(
+    r"(?i)\b(GROUP\s+BY|HAVING|DISTINCT|OFFSET|FETCH|JOIN|UNION|INTERSECT|EXCEPT|WITH)\b"
+    r"|\b(count|sum|avg|min|max)\s*\(|\(\s*SELECT\b|\bOVER\s*\("
+)
+
+def generated_page_sql(base: str, order: List[Tuple[str, str]], limit: int, after: List[Any]) -> Optional[str]:
+    """Página siguiente de un SELECT generado: su WHERE más la condición keyset, mismo orden"""
+    paged = add_where_conditions(base, [keyset_after(order, after)])
+    if paged is None:
+        return None
+    return f"{paged} ORDER BY {', '.join(f'{c} {d}' for c, d in order)} LIMIT {limit}"
+
+def next_generated_token(table: str, base: str, order: List[Tuple[str, str]], limit: int,
+                         rows: List[Dict], page: int) -> Tuple[Optional[str], Optional[str]]:
+    """Token para continuar un SELECT generado después de la última fila de `rows`"""
+    if not rows or len(rows) < limit:
+        return None, NO_PAGE_LAST
+    last = {k.lower(): v for k, v in rows[-1].items()}
+    names = [c.rsplit(".", 1)[-1].lower() for c, _ in order]
+    if any(n not in last for n in names):
+        return None, NO_PAGE_KEY_NOT_SELECTED
+    return page_tokens.issue({
+        "table": table,
+        "base_sql": base,
+        "order": order,
+        "limit": limit,
+        "after": [last[n] for n in names],
+        "page": page + 1,
+    }), None
+
+def paginate_generated(sql: str, used: Set[str], rows: List[Dict]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Token de /ask/next para SQL generado: SELECT de una sola tabla, sin agregados,
+    terminado en ORDER BY columnas LIMIT n, con una clave única (PK o id) en el orden.
+    """
+    body = (sql or "").strip().rstrip(";").strip()
+    masked = mask_quoted(body)
+    if masked is None or len(used) != 1 or NOT_PAGEABLE_RE.search(masked):
+        return None, NO_PAGE_UNSUPPORTED
+    match = GENERATED_PAGE_RE.match(masked)
+    if not match or add_where_conditions(body[:match.end("base")], []) is None:
+        return None, NO_PAGE_UNSUPPORTED
+
+    table = next(iter(used))
+    cols = {c.lower() for c in yaml_columns_for_table(SCHEMA_PATH, table)}
+    order = []
+    for item in match.group("order").split(","):
+        parsed = ORDER_ITEM_RE.match(item)
+        # Solo columnas reales de la tabla (un alias del SELECT no vale en el WHERE del keyset)
+        if not parsed or parsed.group("col").rsplit(".", 1)[-1].lower() not in cols:
+            return None, NO_PAGE_UNSUPPORTED
+        order.append((parsed.group("col"), (parsed.group("dir") or "ASC").upper()))
+
+    unique = {k.lower() for k in table_unique_key(table, list(cols))}
+    if not unique or not unique <= {c.rsplit(".", 1)[-1].lower() for c, _ in order}:
+        return None, NO_PAGE_UNIQUE_ORDER
+    return next_generated_token(table, body[:match.end("base")], order, int(match.group("limit")), rows, 1)
+
+def stale_result_response(sql: str, tables: Set[str], extra: Optional[Dict] = None) -> Optional[Dict]:
+    """Respuesta desde caché marcada con su antigüedad (BD con breaker abierto)"""
+    cached = result_cache.get(sql)
+    if not cached:
+        return None
+
+    staleness = time.time() - cached["stored_at"]
+    rows = cached["rows"]
+    logger.warning(f"🧊 BD no disponible, sirviendo resultado en caché ({staleness:.0f}s de antigüedad)")
+
+    response = {
+        "sql": sql,
+        "rows": rows,
+        "answer": (
+            f"La base de datos no está disponible; muestro {len(rows)} resultado(s) "
+            f"guardados hace {int(staleness)}s."
+        ),
+        "tables_used": sorted(tables) or cached["tables"],
+        "row_count": len(rows),
+        "columns": cached["columns"],
+        "execution_success": True,
+        "stale": True,
+        "cached_at": cached["stored_at"],
+        "staleness_seconds": round(staleness, 1),
+        "superseded": bool(cached.get("invalidated_at")),
+    }
+    if extra:
+        response.update(extra)
+    return response
+
 # ====== CONTEXT MANAGER PARA CONEXIONES DB ======
 @contextmanager
-def get_db_connection():
-    """Context manager para manejar conexiones de forma segura"""
-    conn = None
+def get_db_connection(deadline: Optional[Deadline] = None, track_latency: bool = True):
+    """
+    Context manager para manejar conexiones de forma segura. El breaker registra
+    el resultado al salir del bloque, no al conectar: los timeouts y la lentitud
+    aparecen al ejecutar sentencias. Los errores del propio SQL (sintaxis,
+    columnas) no cuentan como fallo de la BD. Con track_latency=False (lecturas
+    masivas en segundo plano, exportaciones) solo cuentan los fallos. Las
+    excepciones ajenas a la BD (504 del deadline, exportación cancelada,
+    GeneratorExit, KeyboardInterrupt) no se registran.
+    """
+    if deadline is not None and deadline.expired(MIN_STAGE_SECONDS / 2):
+        raise HTTPException(status_code=504, detail="Presupuesto de tiempo agotado antes de consultar la BD")
+
+    # Con deadline, la conexión y cada sentencia heredan el presupuesto restante
+    extra: Dict[str, Any] = {}
+    connect_timeout = 10
+    if deadline is not None:
+        connect_timeout = max(1, int(deadline.timeout(connect_timeout)))
+        extra["options"] = f"-c statement_timeout={max(1, int(deadline.remaining() * 1000))}"
+
+    if not db_breaker.allow_request():
+        raise HTTPException(
+            status_code=503,
+            detail="Base de datos no disponible (circuit breaker abierto)"
+        )
+
+    start = time.time()
     try:
         conn = psycopg2.connect(
             host=PG_HOST,
@@ -78,68 +582,108 @@ def get_db_connection():
             user=PG_USER,
             password=PG_PASS,
             sslmode=PG_SSL,
-            connect_timeout=10
+            connect_timeout=connect_timeout,
+            **extra
         )
-        yield conn
     except psycopg2.OperationalError as e:
+        db_breaker.record_failure()
         logger.error(f"❌ Error de conexión a PostgreSQL: {e}")
         raise HTTPException(
             status_code=503,
             detail=f"No se puede conectar a la base de datos: {str(e)}"
         )
+
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        # Conexión caída o statement_timeout (QueryCanceled): fallo de la dependencia
+        db_breaker.record_failure()
+        logger.error(f"❌ Error de PostgreSQL durante la consulta: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"La base de datos no respondió: {str(e)}"
+        )
+    except psycopg2.Error:
+        # La BD respondió con un error del SQL (sintaxis, columnas, permisos): llamada completada
+        db_breaker.record_success(time.time() - start if track_latency else 0.0)
+        raise
+    except BaseException:
+        # Error del llamador (504, exportación cancelada, GeneratorExit...): no dice nada de la BD
+        db_breaker.release_probe()
+        raise
+    else:
+        db_breaker.record_success(time.time() - start if track_latency else 0.0)
     finally:
-        if conn:
-            conn.close()
+        conn.close()
+
+
+def background_db_connection():
+    """Conexión para tareas largas en segundo plano (sincronizaciones, índices): sin penalizar la duración"""
+    return get_db_connection(track_latency=False)
 
 # ====== UTILIDADES DE ESQUEMA / SQL ======
+_catalog_cache: Dict[str, Tuple[float, Dict]] = {}
+_catalog_lock = threading.Lock()
+
+def catalog_snapshot(path: str) -> Dict:
+    """
+    Catálogo compilado para la versión actual del YAML (mtime): el artefacto de
+    gen_schema.py si corresponde al contenido del YAML; si falta o está obsoleto,
+    se compila desde el YAML.
+    """
+    mtime = os.path.getmtime(path)
+    with _catalog_lock:
+        cached = _catalog_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    artifact_path = CATALOG_ARTIFACT_PATH if path == SCHEMA_PATH else default_artifact_path(path)
+    compiled = load_for_yaml(artifact_path, path)
+    if compiled:
+        logger.info(f"📦 Catálogo compilado cargado: {artifact_path}")
+    else:
+        compiled = compile_yaml(path)
+        logger.info(f"🛠️ Catálogo compilado desde {path} (artefacto ausente u obsoleto)")
+    with _catalog_lock:
+        _catalog_cache[path] = (mtime, compiled)
+    return compiled
+
+def read_catalog_yaml(path: str) -> Dict:
+    """YAML del catálogo parseado una sola vez por versión del archivo (mtime)"""
+    return catalog_snapshot(path)["data"]
+
 def load_schema_text(path: str) -> str:
-    """Carga el esquema desde YAML con manejo de errores"""
+    """Texto del esquema para SQLCoder (precalculado en el catálogo compilado)"""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
+        snapshot = catalog_snapshot(path)
     except Exception as e:
         logger.error(f"❌ Error cargando esquema: {e}")
         raise HTTPException(status_code=500, detail=f"Error cargando esquema: {e}")
     
-    lines: List[str] = []
-    for db in data.get("databases", []):
-        for sch in db.get("schemas", []):
-            sname = sch.get("name", "public")
-            for t in sch.get("tables", []):
-                tname = f'{sname}.{t.get("name","")}'
-                tdesc = t.get("description","") or ""
-                lines.append(f"TABLE {tname} -- {tdesc}".strip())
-                for c in t.get("columns", []):
-                    cname = c.get('name', '')
-                    ctype = c.get('type', '')
-                    if cname and ctype:
-                        lines.append(f"  - {cname} ({ctype})")
-    
-    schema_text = "\n".join(lines)[:20000]
-    logger.info(f"📚 Esquema cargado: {len(lines)} líneas")
+    schema_text = snapshot["schema_text"]
+    logger.info(f"📚 Esquema cargado: {schema_text.count(chr(10)) + 1 if schema_text else 0} líneas")
     return schema_text
 
 def allowed_tables_from_yaml(path: str) -> Set[str]:
     """Extrae todas las tablas permitidas del YAML"""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
+        tabs = set(catalog_snapshot(path)["allowed"])
     except Exception as e:
         logger.error(f"❌ Error leyendo tablas permitidas: {e}")
         return set()
     
-    tabs: Set[str] = set()
-    for db in data.get("databases", []):
-        for sch in db.get("schemas", []):
-            sname = (sch.get("name") or "public").lower()
-            for t in sch.get("tables", []):
-                tname = (t.get("name") or "").lower()
-                if tname:
-                    tabs.add(f"{sname}.{tname}")
-    
     logger.info(f"📋 Tablas permitidas: {len(tabs)}")
     return tabs
 
+def catalog_table_stats(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Metadatos exportados por gen_schema.py por tabla (schema.tabla en minúsculas):
+    rows_estimate, size_bytes, primary_key y foreign_keys. Vacío si el catálogo no los tiene.
+    """
+    try:
+        return catalog_snapshot(path)["stats"]
+    except Exception:
+        return {}
+
 def normalize_schema_dots(sql: str) -> str:
     """Normaliza espacios alrededor de puntos en nombres de tablas"""
     if not sql:
@@ -254,9 +798,20 @@ def singularize(name: str) -> str:
     
     return name
 
+def trigram_index_for(allowed: Set[str]) -> Dict[str, List[str]]:
+    """Índice de trigramas del catálogo compilado si `allowed` es el catálogo; si no, uno al vuelo"""
+    try:
+        snapshot = catalog_snapshot(SCHEMA_PATH)
+        if snapshot["allowed"] == allowed:
+            return snapshot["trigrams"]
+    except Exception:
+        pass
+    return build_trigram_index(allowed)
+
 def suggest_replacements(used: Set[str], allowed: Set[str]) -> Dict[str, str]:
     """Sugiere reemplazos para tablas incorrectas"""
     repl: Dict[str, str] = {}
+    trigram_index: Optional[Dict[str, List[str]]] = None
     allowed_by_schema: Dict[str, Dict[str, str]] = {}
     
     # Organizar tablas permitidas por esquema
@@ -286,24 +841,27 @@ def suggest_replacements(used: Set[str], allowed: Set[str]) -> Dict[str, str]:
             repl[u] = allowed_by_schema[us][cand_tbl]
             continue
         
+        # Candidatas por trigramas (evita comparar con difflib contra todo el catálogo)
+        if trigram_index is None:
+            trigram_index = trigram_index_for(allowed)
+        candidates = similar_tables(trigram_index, ut, limit=50)
+        
         # Buscar coincidencias aproximadas en el mismo esquema
         if us in allowed_by_schema:
-            allowed_tables = list(allowed_by_schema[us].keys())
+            allowed_tables = [c.split(".", 1)[1] for c in candidates if c.split(".", 1)[0] == us]
             match = difflib.get_close_matches(ut, allowed_tables, n=1, cutoff=0.6)
             if match:
                 repl[u] = allowed_by_schema[us][match[0]]
                 continue
         
         # Buscar en todos los esquemas
-        all_allowed_tables = [a.split(".", 1)[1] for a in allowed if '.' in a]
+        all_allowed_tables = [c.split(".", 1)[1] for c in candidates]
         match = difflib.get_close_matches(ut, all_allowed_tables, n=1, cutoff=0.6)
         if match:
-            for a in allowed:
-                if '.' in a:
-                    sch, tbl = a.split(".", 1)
-                    if tbl == match[0]:
-                        repl[u] = a
-                        break
+            for c in candidates:
+                if c.split(".", 1)[1] == match[0]:
+                    repl[u] = c
+                    break
     
     return repl
 
@@ -349,10 +907,7 @@ def force_count_star_for_how_many(sql: str, question: str, used_tables: Set[str]
     if not question or not used_tables:
         return sql
     
-    q = question.lower()
-    count_keywords = ["cuántos", "cuantos", "cantidad", "número", "numero", "total de"]
-    
-    if any(k in q for k in count_keywords):
+    if "force_count" in match_question(question)["connector_intent"]:
         if len(used_tables) == 1 and "count(" not in (sql or "").lower():
             t = list(used_tables)[0]
             logger.info(f"🔢 Forzando COUNT(*) para tabla {t}")
@@ -360,51 +915,54 @@ def force_count_star_for_how_many(sql: str, question: str, used_tables: Set[str]
     
     return sql
 
+COUNT_STAR_RE = re.compile(
+    r"^\s*SELECT\s+COUNT\(\s*\*\s*\)(?:\s+AS\s+(\w+))?\s+FROM\s+([\w\.]+)\s*;?\s*$",
+    re.IGNORECASE
+)
+
+def approximate_count(conn, sql: str, stats: Optional[Dict[str, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Responde un COUNT(*) sin filtros con la estimación del planificador
+    (pg_class.reltuples, actualizada por ANALYZE/autovacuum).
+    None si la consulta tiene filtros, la tabla nunca fue analizada o es pequeña.
+    Con `stats` (catalog_table_stats) las tablas que el catálogo ya marca como
+    pequeñas se descartan sin consultar pg_class.
+    """
+    m = COUNT_STAR_RE.match(sql or "")
+    if not m:
+        return None
+    alias, table = m.group(1) or "count", m.group(2)
+    known = (stats or {}).get(table.lower(), {}).get("rows_estimate")
+    if known is not None and known < APPROX_COUNT_MIN_ROWS:
+        return None
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = cur.fetchone()
+    # reltuples = -1 (PG14+) o 0 si la tabla aún no tiene estadísticas
+    if not row or row[0] is None or row[0] < max(APPROX_COUNT_MIN_ROWS, 1):
+        return None
+    return {"rows": [{alias: int(row[0])}], "columns": [alias], "method": "pg_class.reltuples"}
+
 # ====== ATAJOS "listar/mostrar" ======
 def detect_list_intent(question: str) -> bool:
     """Detecta intención de listar datos"""
     if not question:
         return False
     
-    q = question.lower()
-    keywords = [
-        "muestra", "lista", "enséñame", "ensename", "primeros", "top",
-        "ver los primeros", "muéstrame", "muestrame", "dame", "ver",
-        "últimos", "ultimos"
-    ]
-    
-    return any(w in q for w in keywords)
-
-KEYWORD_TABLE: Dict[str, str] = {
-    "compr": "public.commerce_buyer",
-    "buyer": "public.commerce_buyer",
-    "factur": "public.commerce_invoice",
-    "list": "public.commerce_listing",
-    "bid": "public.commerce_bid",
-    "ofert": "public.commerce_bid",
-    "trabaj": "public.commerce_worker",
-    "deuda": "public.commerce_workerdebt",
-    "pago": "public.commerce_workerpayment",
-    "cultiv": "public.farm_crop",
-    "producc": "public.farm_production",
-    "finca": "public.farm_farm",
-    "herram": "public.farm_tool",
-    "ingreso": "public.farm_income",
-    "costo": "public.farm_cost",
-    "usuario": "public.users_user",
-    "precio": "public.commerce_marketprice",
-}
+    return "list" in match_question(question)["connector_intent"]
+
+# KEYWORD_TABLE (prefijo -> tabla) vive en common/keyword_matcher.py como TABLE_PREFIXES
 
 def pick_table_by_question(question: str, allowed: Set[str]) -> Optional[str]:
     """Selecciona tabla basándose en palabras clave"""
     if not question:
         return None
     
-    q = question.lower()
+    prefixes = match_question(question)["entity_prefix"]
     
-    # Buscar coincidencia exacta en keywords
+    # Buscar coincidencia exacta en keywords (en orden de KEYWORD_TABLE)
     for key, table in KEYWORD_TABLE.items():
-        if key in q and table in allowed:
+        if key in prefixes and table in allowed:
             logger.info(f"🎯 Tabla detectada por keyword '{key}': {table}")
             return table
     
@@ -429,27 +987,68 @@ def yaml_columns_for_table(path: str, full_table: str) -> List[str]:
     if '.' not in full_table:
         return []
     
-    sch, tbl = full_table.split(".", 1)
-    
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
+        return list(catalog_snapshot(path)["columns"].get(full_table.lower(), []))
     except Exception as e:
         logger.error(f"❌ Error leyendo columnas: {e}")
         return []
-    
-    for db in data.get("databases", []):
-        for s in db.get("schemas", []):
-            if (s.get("name") or "").lower() == sch.lower():
-                for t in s.get("tables", []):
-                    if (t.get("name") or "").lower() == tbl.lower():
-                        cols = [(c.get("name") or "").strip() for c in t.get("columns", [])]
-                        return [c for c in cols if c]
-    
-    return []
 
-def default_list_sql(full_table: str, cols: List[str], limit: int = 10) -> str:
-    """Genera SQL por defecto para listar registros"""
+def table_unique_key(full_table: str, cols: List[str]) -> List[str]:
+    """Clave única para desempatar el orden: la PK del catálogo o, si no la exporta, id"""
+    lowered = {c.lower() for c in cols}
+    pk = catalog_table_stats(SCHEMA_PATH).get(full_table.lower(), {}).get("primary_key") or []
+    if pk and all(k.lower() in lowered for k in pk):
+        return list(pk)
+    return ["id"] if "id" in lowered else []
+
+def list_order_columns(cols: List[str], unique: Optional[List[str]] = None) -> List[str]:
+    """Columnas de orden del listado: la preferida (created_at/fecha/date) más la clave única como desempate"""
+    if unique is None:
+        unique = ["id"] if any(c.lower() == "id" for c in cols) else []
+    order_col = None
+    for cand in ["created_at", "fecha", "date"]:
+        if any(c.lower() == cand.lower() for c in cols):
+            order_col = cand
+            break
+    keys = [order_col] if order_col else []
+    keys.extend(k for k in unique if k.lower() not in [c.lower() for c in keys])
+    return keys
+
+def sql_literal(value: Any) -> str:
+    """Literal SQL seguro para un valor leído de la BD"""
+    return psycopg2.extensions.adapt(value).getquoted().decode()
+
+def keyset_after(order: List[Tuple[str, str]], after: List[Any]) -> str:
+    """
+    Condición que continúa ORDER BY order (columna, ASC|DESC) después de la fila `after`:
+    (c1 sigue) OR (c1 = v1 AND c2 sigue) OR ... con el orden de NULL de PostgreSQL
+    (al final en ASC, primero en DESC).
+    """
+    branches = []
+    for i, (col, direction) in enumerate(order):
+        value = after[i]
+        if value is None:
+            follows = "FALSE" if direction == "ASC" else f"{col} IS NOT NULL"
+        elif direction == "ASC":
+            follows = f"({col} > {sql_literal(value)} OR {col} IS NULL)"
+        else:
+            follows = f"{col} < {sql_literal(value)}"
+        equal = [f"{c} IS NULL" if v is None else f"{c} = {sql_literal(v)}" for (c, _), v in zip(order[:i], after)]
+        branches.append(" AND ".join(equal + [follows]))
+    if len(branches) == 1:
+        return branches[0]
+    return "(" + " OR ".join(f"({b})" for b in branches) + ")"
+
+def keyset_condition(keys: List[str], after: List[Any]) -> str:
+    """Condición que continúa un listado ORDER BY keys DESC después de la fila `after`"""
+    return keyset_after([(k, "DESC") for k in keys], after)
+
+def default_list_sql(full_table: str, cols: List[str], limit: int = 10, after: Optional[List[Any]] = None,
+                     where: Optional[List[str]] = None) -> str:
+    """
+    Genera SQL por defecto para listar registros (after = claves de la última fila de la
+    página anterior; where = filtros de valores de la pregunta)
+    """
     # Validar límite
     limit = min(limit, MAX_ROWS_LIMIT)
     
@@ -464,47 +1063,114 @@ def default_list_sql(full_table: str, cols: List[str], limit: int = 10) -> str:
     # Agregar columnas restantes
     ordered.extend([c for c in cols if c.lower() not in [p.lower() for p in preferred_order]])
     
+    # Columnas de ordenamiento (también se seleccionan para poder paginar por keyset)
+    keys = list_order_columns(cols, table_unique_key(full_table, cols))
+
     # Seleccionar primeras 5 columnas o todas si son menos
     if ordered:
-        sel_cols = ", ".join(ordered[:5])
+        selected = ordered[:5]
+        selected.extend([k for k in keys if k.lower() not in [c.lower() for c in selected]])
+        sel_cols = ", ".join(selected)
     else:
         sel_cols = "*"
     
-    # Determinar columna de ordenamiento
-    order_col = None
-    for cand in ["created_at", "fecha", "date", "id"]:
-        if any(c.lower() == cand.lower() for c in cols):
-            order_col = cand
-            break
+    conditions = list(where or [])
+    if after and keys:
+        conditions.append(keyset_condition(keys, after))
+    where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_clause = f" ORDER BY {', '.join(f'{k} DESC' for k in keys)}" if keys else ""
     
-    order_clause = f" ORDER BY {order_col} DESC" if order_col else ""
-    
-    sql = f"SELECT {sel_cols} FROM {full_table}{order_clause} LIMIT {limit}"
+    sql = f"SELECT {sel_cols} FROM {full_table}{where_clause}{order_clause} LIMIT {limit}"
     logger.info(f"📝 SQL generado (atajo): {sql}")
     
     return sql
 
+# ====== EXPORTACIÓN ======
+def export_sql_for(question: str, sql: str) -> str:
+    """
+    SQL a exportar: sin el LIMIT del listado salvo que la pregunta pida ese número
+    ("exporta las 50 últimas facturas" lo conserva; "las facturas de 2024" no)
+    """
+    limit = re.search(r"(?i)\s+LIMIT\s+(\d+)\s*;?\s*$", sql)
+    if not limit:
+        return sql
+    if limit.group(1) in re.findall(r"\d+", question or ""):
+        return sql
+    return sql[:limit.start()]
+
+def issue_export_token(question: str, sql: str, used: Set[str]) -> str:
+    """
+    Token para exportar completa una consulta que el servidor generó y ejecutó.
+    /export no acepta SQL del cliente: solo estos tokens o una pregunta.
+    """
+    return export_tokens.issue({"sql": export_sql_for(question, sql), "tables": sorted(used)})
+
 # ====== GENERACIÓN SQL CON REINTENTOS ======
+# Huellas de esquema que SQLCoder confirmó (las devolvió en schema_fingerprint)
+_sqlcoder_schemas: Set[str] = set()
+
+def schema_fingerprint(schema_text: str) -> str:
+    return hashlib.sha256(schema_text.encode("utf-8")).hexdigest()
+
+def post_generate_sql(payload: Dict, schema_text: str, fingerprint: Optional[str],
+                      deadline: Optional[Deadline] = None, warmup: bool = False) -> requests.Response:
+    """
+    POST a SQLCoder con solo la huella del esquema si ya la conoce, o con el texto completo.
+    Si responde 409 (huella desconocida: reinicio, caché desalojada u otro worker) se reenvía el texto.
+    Con warmup=True se envía WARMUP_HEADER para que SQLCoder no cuente el acierto en memoria.
+    """
+    body = dict(payload)
+    if fingerprint in _sqlcoder_schemas:
+        body["schema_fingerprint"] = fingerprint
+    else:
+        body["schema_text"] = schema_text
+    extra = {WARMUP_HEADER: "1"} if warmup else {}
+    timeout, headers = stage_budget(deadline, SQLCODER_TIMEOUT)
+    r = requests.post(SQLCODER_URL, json=body, headers={**headers, **extra}, timeout=timeout)
+    if r.status_code == 409 and "schema_text" not in body:
+        _sqlcoder_schemas.discard(fingerprint)
+        logger.info("🔁 SQLCoder no reconoce la huella del esquema, reenviando schema_text")
+        timeout, headers = stage_budget(deadline, SQLCODER_TIMEOUT)
+        r = requests.post(SQLCODER_URL, json={**payload, "schema_text": schema_text},
+                          headers={**headers, **extra}, timeout=timeout)
+    return r
+
 def generate_sql_with_retries(
     question: str,
     schema_text: str,
     allowed: Set[str],
     lang: str = "es",
-    max_retries: int = MAX_RETRIES
+    max_retries: int = MAX_RETRIES,
+    deadline: Optional[Deadline] = None,
+    warmup: bool = False
 ) -> Tuple[str, Set[str], str]:
-    """Genera SQL con reintentos automáticos y correcciones"""
+    """
+    Genera SQL con reintentos automáticos y correcciones; deja de reintentar si se agota el deadline.
+    warmup=True (reproducción del calentamiento) pide a SQLCoder que no cuente aciertos de memoria.
+    """
     
     feedback: Optional[str] = None
     last_sql: str = ""
     last_used: Set[str] = set()
+    fingerprint = schema_fingerprint(schema_text) if SQLCODER_SCHEMA_FINGERPRINT else None
 
     for attempt in range(max_retries):
         logger.info(f"🔄 Intento {attempt + 1}/{max_retries} para generar SQL")
+
+        if deadline is not None and deadline.expired(MIN_STAGE_SECONDS):
+            logger.warning(f"⏳ Presupuesto agotado tras {attempt} intento(s), no se reintenta")
+            return last_sql, last_used, (
+                f"Se agotó el presupuesto de tiempo ({deadline.budget_seconds:.0f}s) "
+                f"generando SQL tras {attempt} intento(s)."
+            )
+
+        if not sqlcoder_breaker.allow_request():
+            logger.warning("🔴 SQLCoder con breaker abierto, no se reintenta")
+            return last_sql, last_used, "SQLCoder no disponible (circuit breaker abierto)"
         
         try:
             payload = {
                 "question": question,
-                "schema_text": schema_text,
                 "lang": lang,
                 "max_new_tokens": 256
             }
@@ -513,16 +1179,21 @@ def generate_sql_with_retries(
                 payload["feedback"] = feedback
                 logger.info(f"📝 Feedback enviado: {feedback[:100]}...")
             
-            # Hacer petición con timeout configurable
-            r = requests.post(
-                SQLCODER_URL,
-                json=payload,
-                timeout=SQLCODER_TIMEOUT
-            )
-            r.raise_for_status()
+            # Hacer petición con timeout configurable (acotado por el deadline)
+            timeout, _ = stage_budget(deadline, SQLCODER_TIMEOUT)
+            start = time.time()
+            try:
+                r = post_generate_sql(payload, schema_text, fingerprint, deadline, warmup)
+                r.raise_for_status()
+            except requests.exceptions.RequestException:
+                sqlcoder_breaker.record_failure()
+                raise
+            sqlcoder_breaker.record_success(time.time() - start)
             
             result = r.json()
             sql = result.get("sql", "")
+            if fingerprint and result.get("schema_fingerprint") == fingerprint:
+                _sqlcoder_schemas.add(fingerprint)
             
             if not sql:
                 raise RuntimeError("Respuesta de SQLCoder sin campo 'sql'")
@@ -530,11 +1201,11 @@ def generate_sql_with_retries(
             logger.info(f"✅ SQL recibido: {sql[:100]}...")
             
         except requests.exceptions.Timeout:
-            logger.error(f"⏰ Timeout en intento {attempt + 1} (>{SQLCODER_TIMEOUT}s)")
-            if attempt == max_retries - 1:
+            logger.error(f"⏰ Timeout en intento {attempt + 1} (>{timeout:.0f}s)")
+            if attempt == max_retries - 1 or (deadline is not None and deadline.expired(MIN_STAGE_SECONDS)):
                 return "", set(), (
-                    f"SQLCoder tardó más de {SQLCODER_TIMEOUT}s en responder. "
-                    "Aumenta SQLCODER_TIMEOUT o usa GPU."
+                    f"SQLCoder tardó más de {timeout:.0f}s en responder. "
+                    "Aumenta SQLCODER_TIMEOUT / REQUEST_DEADLINE_SECONDS o usa GPU."
                 )
             continue
         
@@ -603,11 +1274,20 @@ def send_feedback_to_sqlcoder(
     question: str,
     sql: str,
     success: bool,
-    tables_used: Optional[Set[str]] = None
+    tables_used: Optional[Set[str]] = None,
+    deadline: Optional[Deadline] = None
 ):
     """Envía feedback al modelo SQLCoder"""
+    if sqlcoder_breaker.is_open():
+        logger.info("⏭️ Feedback omitido: SQLCoder con breaker abierto")
+        return
+    if deadline is not None and deadline.expired(MIN_STAGE_SECONDS):
+        logger.info("⏭️ Feedback omitido: presupuesto de tiempo agotado")
+        return
+
     try:
         feedback_url = SQLCODER_URL.replace("/generate_sql", "/feedback")
+        timeout, headers = stage_budget(deadline, 10)
         
         requests.post(
             feedback_url,
@@ -617,7 +1297,8 @@ def send_feedback_to_sqlcoder(
                 "success": success,
                 "tables_used": sorted(list(tables_used)) if tables_used else []
             },
-            timeout=10
+            headers=headers,
+            timeout=timeout
         )
         
         logger.info(f"✅ Feedback enviado: success={success}")
@@ -625,11 +1306,181 @@ def send_feedback_to_sqlcoder(
     except Exception as e:
         logger.warning(f"⚠️ No se pudo enviar feedback: {e}")
 
+# ====== FALLBACKS LOCALES ======
+def local_fallback_sql(question: str, allowed: Set[str]) -> Optional[Tuple[str, Set[str]]]:
+    """SQL por reglas locales cuando SQLCoder no está disponible (solo conteos y listados)"""
+    if not question:
+        return None
+
+    matched = match_question(question)
+    table = next((t for k, t in KEYWORD_TABLE.items() if k in matched["entity_prefix"] and t in allowed), None)
+    if not table:
+        return None
+
+    if "count" in matched["connector_intent"]:
+        return f"SELECT COUNT(*) AS total FROM {table}", {table}
+
+    if detect_list_intent(question):
+        cols = yaml_columns_for_table(SCHEMA_PATH, table)
+        return default_list_sql(table, cols), {table}
+
+    return None
+
+def fallback_answer(rows: List[Dict], cols: List[str]) -> str:
+    """Respuesta por defecto cuando NLG no responde"""
+    if rows:
+        return f"Encontré {len(rows)} resultado(s). Columnas: {', '.join(cols)}"
+    return "No encontré resultados para tu consulta."
+
+def request_nlg_answer(payload: Dict[str, Any], deadline: Optional[Deadline] = None) -> Optional[str]:
+    """Llama a NLG respetando su breaker y el deadline; None si hay que usar la respuesta local"""
+    if deadline is not None and deadline.expired(MIN_STAGE_SECONDS):
+        logger.warning("⏳ Presupuesto agotado, se omite NLG y se usa respuesta por defecto")
+        return None
+    if not nlg_breaker.allow_request():
+        logger.warning("🔴 NLG con breaker abierto, usando respuesta por defecto")
+        return None
+
+    timeout, headers = stage_budget(deadline, NLG_TIMEOUT)
+    start = time.time()
+    try:
+        r = requests.post(NLG_URL, json=payload, headers=headers, timeout=timeout)
+        r.raise_for_status()
+        answer = r.json().get("answer")
+    except requests.exceptions.Timeout:
+        nlg_breaker.record_failure()
+        logger.warning("⚠️ Timeout en NLG, usando respuesta por defecto")
+        return None
+    except Exception as ex:
+        nlg_breaker.record_failure()
+        logger.warning(f"⚠️ NLG falló: {ex}, usando respuesta por defecto")
+        return None
+
+    nlg_breaker.record_success(time.time() - start)
+    return answer
+
+# ====== RÉPLICA ANALÍTICA ======
+replica: Optional[AnalyticsReplica] = None
+
+def init_replica():
+    """Crea la réplica y arranca su sincronización periódica (si REPLICA_ENABLED)"""
+    global replica
+    if not REPLICA_ENABLED:
+        return
+    try:
+        specs = load_table_specs(SCHEMA_PATH, REPLICA_TABLES)
+        replica = AnalyticsReplica(REPLICA_PATH, specs, REPLICA_MAX_STALENESS_SECONDS)
+        replica.start_background_sync(background_db_connection, REPLICA_SYNC_SECONDS)
+        logger.info(f"🧮 Réplica analítica activa: {sorted(specs)}")
+    except Exception as e:
+        replica = None
+        logger.error(f"❌ No se pudo iniciar la réplica analítica: {e}")
+
+# ====== ROLLUPS ======
+rollups: Optional[RollupManager] = None
+
+def init_rollups():
+    """Crea las tablas de rollup si faltan y arranca su refresco en segundo plano"""
+    global rollups
+    if not ROLLUPS_ENABLED:
+        return
+    try:
+        rollups = RollupManager(
+            background_db_connection,
+            recent_days=ROLLUP_RECENT_DAYS,
+            max_staleness_seconds=ROLLUP_MAX_STALENESS_SECONDS
+        )
+        rollups.ensure_tables()
+        rollups.start(ROLLUP_REFRESH_SECONDS)
+        logger.info(f"📊 Rollups activos: {sorted(ROLLUP_SPECS)}")
+    except Exception as e:
+        rollups = None
+        logger.error(f"❌ No se pudieron preparar los rollups: {e}")
+
+# ====== ÍNDICE DE VALORES ======
+value_index: Optional[ValueIndex] = None
+
+def init_value_index():
+    """Construye el índice de valores en segundo plano y lo refresca periódicamente"""
+    global value_index
+    if not VALUE_INDEX_ENABLED:
+        return
+    value_index = ValueIndex(
+        background_db_connection,
+        lambda: catalog_snapshot(SCHEMA_PATH),
+        columns=VALUE_INDEX_COLUMNS,
+        max_distinct=VALUE_INDEX_MAX_DISTINCT,
+        threshold=VALUE_MATCH_THRESHOLD
+    )
+    value_index.start(VALUE_INDEX_REFRESH_SECONDS)
+    logger.info(f"🔤 Índice de valores activo: {VALUE_INDEX_COLUMNS}")
+
+def value_filters_for(question: str, table: str, sql: str = "") -> Tuple[List[str], Set[str], List[Dict[str, Any]]]:
+    """Filtros de valores mencionados en la pregunta para `table` (vacío si el índice está apagado)"""
+    if value_index is None:
+        return [], set(), []
+    try:
+        return value_index.filters_for(question, table, sql)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron calcular filtros de valores: {e}")
+        return [], set(), []
+
+def apply_value_filters(question: str, sql: str, used: Set[str]) -> Tuple[str, Set[str], List[Dict[str, Any]]]:
+    """Añade al SQL (de una sola tabla) los filtros de valores que la pregunta menciona y el SQL no"""
+    if len(used) != 1:
+        return sql, used, []
+    conditions, extra, applied = value_filters_for(question, next(iter(used)), sql)
+    if not conditions:
+        return sql, used, []
+    filtered = add_where_conditions(sql, conditions)
+    if filtered is None:
+        logger.info("↩️ SQL demasiado complejo para añadir filtros de valores")
+        return sql, used, []
+    logger.info(f"🔤 Filtros de valores: {[m['value'] for m in applied]}")
+    return filtered, used | extra, applied
+
+# ====== CAPTURA DE CAMBIOS ======
+change_capture: Optional[ChangeCapture] = None
+
+def init_change_capture():
+    """Arranca la captura incremental y conecta caché y réplica como suscriptores"""
+    global change_capture
+    if not CDC_ENABLED:
+        return
+    try:
+        specs = load_table_specs(SCHEMA_PATH, CDC_TABLES)
+        change_capture = ChangeCapture(background_db_connection, specs, CDC_STATE_PATH)
+        change_capture.subscribe(result_cache.on_change_event)
+        if replica is not None:
+            change_capture.subscribe(replica.apply_change_event)
+        if rollups is not None:
+            change_capture.subscribe(rollups.apply_change_event)
+        if CDC_INSTALL_TRIGGERS:
+            change_capture.install_triggers()
+        change_capture.start(CDC_POLL_SECONDS, listen=CDC_LISTEN)
+        logger.info(f"🔁 Captura de cambios activa: {sorted(specs)} (listen={CDC_LISTEN})")
+    except Exception as e:
+        change_capture = None
+        logger.error(f"❌ No se pudo iniciar la captura de cambios: {e}")
+
+def query_replica(sql: str, used: Set[str]) -> Optional[Tuple[List[Dict], List[str], float]]:
+    """Ejecuta agregados en la réplica; None para seguir por PostgreSQL"""
+    if replica is None or not replica.can_answer(sql, used):
+        return None
+    try:
+        rows, cols = replica.query(sql)
+    except Exception as e:
+        logger.info(f"↩️ SQL no compatible con la réplica, se usa PostgreSQL: {e}")
+        return None
+    freshness = replica.freshness(used) or 0.0
+    logger.info(f"🧮 Agregado resuelto en réplica ({len(rows)} filas, {freshness:.0f}s de antigüedad)")
+    return rows, cols, freshness
+
 # ====== VALIDACIÓN DE CONEXIÓN ======
-def test_db_connection() -> Tuple[bool, str]:
-    """Prueba la conexión a PostgreSQL"""
+def test_db_connection(deadline: Optional[Deadline] = None) -> Tuple[bool, str]:
+    """Prueba la conexión a PostgreSQL (conexión y SELECT limitados por el deadline si se da)"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(deadline) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT version()")
                 version = cur.fetchone()[0]
@@ -645,6 +1496,38 @@ def test_db_connection() -> Tuple[bool, str]:
 class AskIn(BaseModel):
     question: str = Field(..., min_length=1, max_length=500)
     lang: str = Field(default="es", pattern="^(es|en)$")
+    timeout_seconds: Optional[float] = Field(
+        default=None, gt=0, le=MAX_REQUEST_DEADLINE_SECONDS,
+        description="Presupuesto total de la petición (por defecto REQUEST_DEADLINE_SECONDS)"
+    )
+    exact_count: bool = Field(
+        default=False,
+        description="Con APPROX_COUNTS_ENABLED, fuerza COUNT(*) exacto en vez de la estimación"
+    )
+
+class AskNextIn(BaseModel):
+    token: str = Field(..., min_length=8, max_length=128)
+    limit: Optional[int] = Field(default=None, gt=0, le=MAX_ROWS_LIMIT)
+    timeout_seconds: Optional[float] = Field(
+        default=None, gt=0, le=MAX_REQUEST_DEADLINE_SECONDS,
+        description="Presupuesto total de la petición (por defecto REQUEST_DEADLINE_SECONDS)"
+    )
+
+class ExportIn(BaseModel):
+    question: Optional[str] = Field(default=None, min_length=1, max_length=500)
+    export_token: Optional[str] = Field(
+        default=None, min_length=8, max_length=128,
+        description="export_token devuelto por /ask (exporta el SQL que ya se ejecutó)"
+    )
+    format: str = Field(default="csv", pattern="^(csv|parquet)$")
+    lang: str = Field(default="es", pattern="^(es|en)$")
+    timeout_seconds: Optional[float] = Field(
+        default=None, gt=0, le=max(MAX_REQUEST_DEADLINE_SECONDS, EXPORT_TIMEOUT_SECONDS),
+        description=(
+            "Presupuesto total de la exportación: generación del SQL, validación y envío "
+            "(por defecto REQUEST_DEADLINE_SECONDS para generar y EXPORT_TIMEOUT_SECONDS para enviar)"
+        )
+    )
 
 class RefineIn(BaseModel):
     question: str
@@ -657,27 +1540,169 @@ class RefineIn(BaseModel):
     max_new_tokens: int = Field(default=192, ge=50, le=512)
 
 # ====== STARTUP EVENT ======
+# ====== CALENTAMIENTO / READINESS ======
+class QuestionHistory:
+    """Frecuencia de preguntas respondidas con éxito, persistida para el calentamiento"""
+
+    def __init__(self, path: str, save_every: int = 20):
+        self.path = path
+        self.save_every = save_every
+        self.counts: Dict[str, int] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.counts = json.load(f).get("counts", {})
+            except Exception as e:
+                logger.warning(f"⚠️ Historial de preguntas ilegible, se reinicia: {e}")
+
+    def record(self, question: str):
+        key = " ".join(question.lower().split())
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self._pending += 1
+            if self._pending >= self.save_every:
+                self._save()
+
+    def _save(self):
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"counts": self.counts}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._pending = 0
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el historial de preguntas: {e}")
+
+    def top(self, n: int) -> List[str]:
+        with self._lock:
+            return [q for q, _ in sorted(self.counts.items(), key=lambda kv: -kv[1])[:n]]
+
+question_history = QuestionHistory(QUESTION_HISTORY_PATH)
+
+warmup_state: Dict[str, Any] = {
+    "ready": not WARMUP_ENABLED,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+}
+
+def _warmup_step(name: str, fn) -> bool:
+    start = time.time()
+    attempts = warmup_state["steps"].get(name, {}).get("attempts", 0) + 1
+    try:
+        detail = fn()
+        warmup_state["steps"][name] = {"ok": True, "seconds": round(time.time() - start, 2),
+                                       "attempts": attempts, "detail": detail}
+        logger.info(f"🔥 Calentamiento '{name}' listo en {time.time() - start:.1f}s")
+        return True
+    except Exception as e:
+        warmup_state["steps"][name] = {"ok": False, "seconds": round(time.time() - start, 2),
+                                       "attempts": attempts, "error": str(e)}
+        logger.warning(f"⚠️ Calentamiento '{name}' falló: {e}")
+        return False
+
+def _warm_catalog():
+    allowed = allowed_tables_from_yaml(SCHEMA_PATH)
+    load_schema_text(SCHEMA_PATH)
+    return {"tables": len(allowed)}
+
+def _warm_database():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        missing = verify_tables_exist(conn, allowed_tables_from_yaml(SCHEMA_PATH))
+    return {"missing_tables": missing}
+
+def _warm_sqlcoder():
+    r = requests.post(SQLCODER_URL.replace("/generate_sql", "/warmup"), timeout=WARMUP_SQLCODER_TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+def _warm_nlg():
+    r = requests.get(NLG_URL.replace("/refine", "/health"), timeout=10)
+    r.raise_for_status()
+    return {"status": r.json().get("status")}
+
+def _warm_replay():
+    replayed = 0
+    for question in question_history.top(WARMUP_REPLAY_TOP_N):
+        try:
+            # Sin historial, feedback ni aciertos en SQLCoder: reproducir no debe inflar el top-N
+            # del próximo arranque ni las frecuencias de la memoria
+            answer_question(AskIn(question=question), side_effects=False)
+            replayed += 1
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo reproducir '{question}': {e}")
+    return {"replayed": replayed}
+
+def run_warmup():
+    """
+    Prepara catálogo, BD y servicios antes de declarar el conector listo.
+    Catálogo y BD son obligatorios: se reintentan hasta que funcionen y /ready
+    sigue en 503 mientras tanto. SQLCoder y NLG solo se calientan (si fallan,
+    /ask tiene fallbacks locales).
+    """
+    warmup_state["started_at"] = time.time()
+    required = {"catalog": _warm_catalog, "database": _warm_database}
+    pending = [name for name, fn in required.items() if not _warmup_step(name, fn)]
+    _warmup_step("sqlcoder", _warm_sqlcoder)
+    _warmup_step("nlg", _warm_nlg)
+    while pending:
+        logger.warning(f"⏳ Calentamiento obligatorio pendiente: {pending}; reintento en {WARMUP_RETRY_SECONDS:.0f}s")
+        time.sleep(WARMUP_RETRY_SECONDS)
+        pending = [name for name in pending if not _warmup_step(name, required[name])]
+    if WARMUP_REPLAY_TOP_N > 0:
+        _warmup_step("replay", _warm_replay)
+    warmup_state["finished_at"] = time.time()
+    warmup_state["ready"] = True
+    logger.info(f"✅ Calentamiento completo en {warmup_state['finished_at'] - warmup_state['started_at']:.1f}s")
+
 @app.on_event("startup")
 async def startup_event():
     """Validación al iniciar la aplicación"""
     try:
         validate_config()
+        init_replica()
+        init_rollups()
+        init_change_capture()
+        init_value_index()
+        if WARMUP_ENABLED:
+            # En segundo plano: /ready responde 503 hasta que termine
+            threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
         logger.info("🚀 Aplicación iniciada correctamente")
     except Exception as e:
         logger.error(f"❌ Error en startup: {e}")
         raise
 
 # ====== ENDPOINTS ======
+@app.get("/ready")
+def ready():
+    """Readiness: 503 hasta que termine el calentamiento de arranque"""
+    body = {
+        "ready": warmup_state["ready"],
+        "steps": warmup_state["steps"],
+        "warmup_seconds": (
+            round(warmup_state["finished_at"] - warmup_state["started_at"], 1)
+            if warmup_state["finished_at"] else None
+        ),
+    }
+    if not warmup_state["ready"]:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.get("/health")
 def health():
     """Health check con validación de conexiones"""
-    db_ok, db_info = test_db_connection()
+    db_ok, db_info = test_db_connection(Deadline(HEALTH_DB_TIMEOUT_SECONDS))
     
     return {
         "status": "ok" if db_ok else "degraded",
         "version": "2.2",
         "sqlcoder_url": SQLCODER_URL,
         "sqlcoder_timeout": SQLCODER_TIMEOUT,
+        "sqlcoder_schema_fingerprints": len(_sqlcoder_schemas),
         "nlg_url": NLG_URL,
         "schema_path": SCHEMA_PATH,
         "pg_host": PG_HOST,
@@ -685,18 +1710,34 @@ def health():
         "pg_info": db_info if db_ok else f"Error: {db_info}",
         "max_retries": MAX_RETRIES,
         "max_rows_limit": MAX_ROWS_LIMIT,
+        "circuit_breakers": {
+            b.name: b.snapshot() for b in (sqlcoder_breaker, nlg_breaker, db_breaker)
+        },
+        "result_cache": result_cache.stats(),
+        "analytics_replica": replica.stats() if replica else {"enabled": False},
+        "change_capture": change_capture.stats() if change_capture else {"enabled": False},
+        "rollups": rollups.stats() if rollups else {"enabled": False},
+        "value_index": value_index.stats() if value_index else {"enabled": False},
+        "pagination": page_tokens.stats(),
     }
 
 @app.post("/refine")
 def refine_via_nlg(data: RefineIn):
     """Proxy directo a NLG - úsalo solo si ya tienes el SQL ejecutado"""
+    if not nlg_breaker.allow_request():
+        raise HTTPException(status_code=503, detail="NLG no disponible (circuit breaker abierto)")
+
+    start = time.time()
     try:
-        r = requests.post(NLG_URL, json=data.model_dump(), timeout=120)
+        r = requests.post(NLG_URL, json=data.model_dump(), timeout=NLG_TIMEOUT)
         r.raise_for_status()
+        nlg_breaker.record_success(time.time() - start)
         return r.json()
     except requests.exceptions.Timeout:
+        nlg_breaker.record_failure()
         raise HTTPException(status_code=504, detail="Timeout al contactar NLG")
     except Exception as e:
+        nlg_breaker.record_failure()
         raise HTTPException(
             status_code=503,
             detail=f"Error al llamar NLG: {str(e)}"
@@ -730,28 +1771,31 @@ def nlg_identity():
             detail=f"No se pudo consultar identity del NLG: {str(e)}"
         )
 
-@app.post("/ask")
-def ask(data: AskIn):
+def answer_question(data: AskIn, side_effects: bool = True):
     """
-    Endpoint principal - convierte preguntas en SQL y las ejecuta
+    Convierte preguntas en SQL y las ejecuta (cuerpo de /ask)
     
     Flujo:
     1. Detecta atajos (listar tablas comunes)
     2. Genera SQL con SQLCoder (con reintentos)
     3. Valida y ejecuta en PostgreSQL
     4. Genera respuesta en lenguaje natural con NLG
+
+    Si un breaker está abierto se usa el fallback local sin esperar timeouts:
+    reglas locales para SQLCoder, texto por defecto para NLG y resultados en
+    caché (marcados como stale) para PostgreSQL.
+
+    Toda la petición comparte un deadline: cada etapa recibe el tiempo
+    restante como timeout y se reenvía en la cabecera X-Deadline-Ms.
+
+    Con side_effects=False (reproducción del calentamiento) no se registra la
+    pregunta en el historial, no se envía feedback a SQLCoder y la generación
+    va marcada con WARMUP_HEADER para que SQLCoder no cuente aciertos de memoria.
     """
-    
-    # 0) Verificar conexión a BD
-    db_ok, db_error = test_db_connection()
-    if not db_ok:
-        raise HTTPException(
-            status_code=503,
-            detail={
-                "error": f"Base de datos no disponible: {db_error}",
-                "suggestion": "Verifica las variables de entorno: PG_HOST, PG_DB, PG_USER, PG_PASS"
-            }
-        )
+    feedback = send_feedback_to_sqlcoder if side_effects else (lambda *args: None)
+    deadline = Deadline(data.timeout_seconds or REQUEST_DEADLINE_SECONDS)
+    request_start = time.perf_counter()
+    timings: Dict[str, float] = {}
     
     # 1) Cargar esquema y tablas permitidas
     try:
@@ -779,18 +1823,29 @@ def ask(data: AskIn):
             if limit_match:
                 limit = min(int(limit_match.group(1)), MAX_ROWS_LIMIT)
             
-            sql = default_list_sql(table, cols, limit=limit)
+            where, filter_tables, value_matches = value_filters_for(data.question, table)
+            sql = default_list_sql(table, cols, limit=limit, where=where)
+
+            if db_breaker.is_open():
+                stale = stale_result_response(sql, {table} | filter_tables, {"shortcut": "list_intent"})
+                if stale:
+                    return stale
+                raise HTTPException(status_code=503, detail="Base de datos no disponible y sin resultado en caché")
             
             # Ejecutar query
+            stage_start = time.perf_counter()
             try:
-                with get_db_connection() as conn:
+                with get_db_connection(deadline) as conn:
                     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                         cur.execute(sql)
                         rows = cur.fetchall() if cur.description else []
                         cols_out = [c.name for c in cur.description] if cur.description else []
                 
                 logger.info(f"✅ Query ejecutado (atajo): {len(rows)} filas")
+                result_cache.put(sql, rows, cols_out, {table} | filter_tables)
             
+            except HTTPException:
+                raise  # BD no disponible (503) o presupuesto agotado (504)
             except Exception as e:
                 logger.error(f"❌ Error ejecutando SQL (atajo): {e}")
                 raise HTTPException(
@@ -801,48 +1856,69 @@ def ask(data: AskIn):
                     }
                 )
             
+            timings["database"] = elapsed_ms(stage_start)
+
             # Enviar feedback positivo
-            send_feedback_to_sqlcoder(data.question, sql, True, {table})
+            feedback(data.question, sql, True, {table}, deadline)
             
             # Generar respuesta NLG
-            try:
-                r2 = requests.post(NLG_URL, json={
-                    "question": data.question,
-                    "sql": sql,
-                    "columns": cols_out,
-                    "rows": rows,
-                    "lang": data.lang,
-                    "tone": "amigable",
-                    "suggest_followups": True,
-                    "max_new_tokens": 192
-                }, timeout=120)
-                r2.raise_for_status()
-                answer = r2.json().get("answer", f"Encontré {len(rows)} registros en {table}")
-            
-            except Exception as ex:
-                logger.warning(f"⚠️ NLG falló (atajo): {ex}")
-                answer = f"Encontré {len(rows)} registros en {table}"
-
+            stage_start = time.perf_counter()
+            answer = request_nlg_answer({
+                "question": data.question,
+                "sql": sql,
+                "columns": cols_out,
+                "rows": rows,
+                "lang": data.lang,
+                "tone": "amigable",
+                "suggest_followups": True,
+                "max_new_tokens": 192
+            }, deadline) or f"Encontré {len(rows)} registros en {table}"
+            timings["nlg"] = elapsed_ms(stage_start)
+            timings["total"] = elapsed_ms(request_start)
+
+            if side_effects:
+                question_history.record(data.question)
+            next_token, next_reason = next_page_token(table, cols, limit, rows, 1, where)
             return {
                 "sql": sql,
                 "rows": rows,
                 "answer": answer,
                 "shortcut": "list_intent",
                 "tables_used": [table],
-                "execution_success": True
+                "execution_success": True,
+                "page": 1,
+                "next_token": next_token,
+                "next_token_reason": next_reason,
+                "export_token": issue_export_token(data.question, sql, {table} | filter_tables),
+                **({"value_filters": value_matches} if value_matches else {}),
+                "timings_ms": timings
             }
 
     # ===== GENERACIÓN SQL NORMAL =====
-    logger.info(f"🤖 Generando SQL para: {data.question}")
-    
-    sql, used, error = generate_sql_with_retries(
-        question=data.question,
-        schema_text=schema_text,
-        allowed=allowed,
-        lang=data.lang,
-        max_retries=MAX_RETRIES
-    )
+    fallback_used = None
+    stage_start = time.perf_counter()
+    local = local_fallback_sql(data.question, allowed) if sqlcoder_breaker.is_open() else None
+
+    if local:
+        sql, used = local
+        error = ""
+        fallback_used = "local_rules"
+        logger.warning(f"🔴 SQLCoder con breaker abierto, usando SQL local: {sql}")
+    else:
+        logger.info(f"🤖 Generando SQL para: {data.question}")
+        
+        sql, used, error = generate_sql_with_retries(
+            question=data.question,
+            schema_text=schema_text,
+            allowed=allowed,
+            lang=data.lang,
+            max_retries=MAX_RETRIES,
+            deadline=deadline,
+            warmup=not side_effects
+        )
     
+    timings["sqlcoder"] = elapsed_ms(stage_start)
+
     # Si hubo error en generación
     if error:
         logger.error(f"❌ Error generando SQL: {error}")
@@ -855,104 +1931,154 @@ def ask(data: AskIn):
             "execution_success": False
         }
 
+    # Filtros literales que la pregunta menciona y el SQL generado omitió
+    sql, used, value_matches = apply_value_filters(data.question, sql, used)
+
     logger.info(f"📝 SQL generado: {sql}")
     logger.info(f"🔍 Tablas usadas: {sorted(used)}")
 
-    # ===== EJECUTAR SQL =====
-    try:
-        with get_db_connection() as conn:
-            # Verificar que las tablas existan
-            missing = verify_tables_exist(conn, used)
+    # ===== RÉPLICA ANALÍTICA (solo agregados sobre tablas replicadas) =====
+    data_source = "postgres"
+    replica_freshness = None
+    rollup = None
+    approx = None
+    stage_start = time.perf_counter()
+    replica_result = query_replica(sql, used)
+    fresh = result_cache.get_fresh(sql, RESULT_CACHE_TTL_SECONDS)
+
+    if replica_result:
+        rows, cols, replica_freshness = replica_result
+        data_source = "replica"
+        feedback(data.question, sql, True, used, deadline)
+
+    elif fresh:
+        rows, cols = fresh["rows"], fresh["columns"]
+        data_source = "cache"
+        logger.info("⚡ Resultado servido desde caché (sin cambios en sus tablas)")
+
+    elif db_breaker.is_open():
+        stale = stale_result_response(sql, used, {"fallback": fallback_used} if fallback_used else None)
+        if stale:
+            return stale
+        raise HTTPException(status_code=503, detail="Base de datos no disponible y sin resultado en caché")
+
+    else:
+        # ===== EJECUTAR SQL =====
+        try:
+            with get_db_connection(deadline) as conn:
+                # Verificar que las tablas existan
+                missing = verify_tables_exist(conn, used)
             
-            if missing:
-                logger.error(f"❌ Tablas no encontradas en BD: {missing}")
-                send_feedback_to_sqlcoder(data.question, sql, False, used)
+                if missing:
+                    logger.error(f"❌ Tablas no encontradas en BD: {missing}")
+                    feedback(data.question, sql, False, used, deadline)
                 
-                return {
-                    "error": f"Las siguientes tablas no existen en la base de datos: {', '.join(missing)}",
-                    "sql": sql,
-                    "used_tables": sorted(list(used)),
-                    "missing_tables": missing,
-                    "suggestion": "El catálogo YAML puede estar desactualizado o las tablas fueron eliminadas",
-                    "execution_success": False
-                }
-
-            # Ejecutar query
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute(sql)
-                rows = cur.fetchall() if cur.description else []
-                cols = [c.name for c in cur.description] if cur.description else []
-
-        logger.info(f"✅ Ejecución exitosa: {len(rows)} filas retornadas")
-        send_feedback_to_sqlcoder(data.question, sql, True, used)
+                    return {
+                        "error": f"Las siguientes tablas no existen en la base de datos: {', '.join(missing)}",
+                        "sql": sql,
+                        "used_tables": sorted(list(used)),
+                        "missing_tables": missing,
+                        "suggestion": "El catálogo YAML puede estar desactualizado o las tablas fueron eliminadas",
+                        "execution_success": False
+                    }
 
-    except psycopg2.errors.SyntaxError as e:
-        logger.error(f"❌ Error de sintaxis SQL: {e}")
-        send_feedback_to_sqlcoder(data.question, sql, False, used)
+                # Agregados que un rollup puede responder se leen del rollup
+                rollup = rollups.rewrite(sql) if rollups else None
+                if rollup:
+                    try:
+                        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                            cur.execute(rollup["sql"])
+                            rows = cur.fetchall() if cur.description else []
+                            cols = [c.name for c in cur.description] if cur.description else []
+                        data_source = "rollup"
+                        logger.info(f"📊 Respondido desde {rollup['rollup']} (grano {rollup['grain']})")
+                    except Exception as e:
+                        logger.warning(f"⚠️ Rollup falló, se usa la tabla base: {e}")
+                        conn.rollback()
+                        rollup = None
+
+                # Conteos sin filtros sobre tablas grandes: estimación del planificador
+                if not rollup and APPROX_COUNTS_ENABLED and not data.exact_count:
+                    approx = approximate_count(conn, sql, catalog_table_stats(SCHEMA_PATH))
+                    if approx:
+                        rows, cols = approx["rows"], approx["columns"]
+                        logger.info(f"🔢 Conteo aproximado ({approx['method']}): {rows[0]}")
+
+                # Ejecutar query
+                if not rollup and not approx:
+                    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                        cur.execute(sql)
+                        rows = cur.fetchall() if cur.description else []
+                        cols = [c.name for c in cur.description] if cur.description else []
+
+            logger.info(f"✅ Ejecución exitosa: {len(rows)} filas retornadas")
+            if not approx:
+                result_cache.put(sql, rows, cols, used)
+            feedback(data.question, sql, True, used, deadline)
+
+        except HTTPException:
+            raise  # BD no disponible o sin presupuesto: no es culpa del SQL generado
+        except psycopg2.errors.SyntaxError as e:
+            logger.error(f"❌ Error de sintaxis SQL: {e}")
+            feedback(data.question, sql, False, used, deadline)
         
-        return {
-            "error": f"Error de sintaxis en el SQL generado: {str(e)}",
-            "sql": sql,
-            "suggestion": "El SQL generado tiene errores de sintaxis. Intenta reformular la pregunta.",
-            "execution_success": False
-        }
+            return {
+                "error": f"Error de sintaxis en el SQL generado: {str(e)}",
+                "sql": sql,
+                "suggestion": "El SQL generado tiene errores de sintaxis. Intenta reformular la pregunta.",
+                "execution_success": False
+            }
     
-    except psycopg2.errors.UndefinedColumn as e:
-        logger.error(f"❌ Columna no definida: {e}")
-        send_feedback_to_sqlcoder(data.question, sql, False, used)
+        except psycopg2.errors.UndefinedColumn as e:
+            logger.error(f"❌ Columna no definida: {e}")
+            feedback(data.question, sql, False, used, deadline)
         
-        return {
-            "error": f"Una o más columnas no existen en la tabla: {str(e)}",
-            "sql": sql,
-            "suggestion": "El esquema YAML puede estar desactualizado. Verifica las columnas disponibles.",
-            "execution_success": False
-        }
+            return {
+                "error": f"Una o más columnas no existen en la tabla: {str(e)}",
+                "sql": sql,
+                "suggestion": "El esquema YAML puede estar desactualizado. Verifica las columnas disponibles.",
+                "execution_success": False
+            }
     
-    except Exception as e:
-        logger.error(f"❌ Error ejecutando SQL: {e}")
-        send_feedback_to_sqlcoder(data.question, sql, False, used)
+        except Exception as e:
+            logger.error(f"❌ Error ejecutando SQL: {e}")
+            feedback(data.question, sql, False, used, deadline)
         
-        return {
-            "error": f"Error ejecutando SQL en PostgreSQL: {str(e)}",
-            "sql": sql,
-            "suggestion": "Verifica que el SQL sea válido y las tablas/columnas existan",
-            "execution_success": False
-        }
+            return {
+                "error": f"Error ejecutando SQL en PostgreSQL: {str(e)}",
+                "sql": sql,
+                "suggestion": "Verifica que el SQL sea válido y las tablas/columnas existan",
+                "execution_success": False
+            }
+
+    timings["database"] = elapsed_ms(stage_start)
 
     # ===== GENERAR RESPUESTA NLG =====
-    try:
-        logger.info("💬 Generando respuesta en lenguaje natural...")
-        
-        r2 = requests.post(NLG_URL, json={
-            "question": data.question,
-            "sql": sql,
-            "columns": cols,
-            "rows": rows,
-            "lang": data.lang,
-            "tone": "amigable",
-            "suggest_followups": True,
-            "max_new_tokens": 192
-        }, timeout=120)
-        
-        r2.raise_for_status()
-        answer = r2.json().get("answer")
+    logger.info("💬 Generando respuesta en lenguaje natural...")
+    stage_start = time.perf_counter()
+    answer = request_nlg_answer({
+        "question": data.question,
+        "sql": sql,
+        "columns": cols,
+        "rows": rows,
+        "lang": data.lang,
+        "tone": "amigable",
+        "suggest_followups": True,
+        "max_new_tokens": 192,
+        "approximate": bool(approx)
+    }, deadline)
+    if answer is None:
+        answer = fallback_answer(rows, cols)
+    else:
         logger.info("✅ Respuesta generada por NLG")
-    
-    except requests.exceptions.Timeout:
-        logger.warning("⚠️ Timeout en NLG, usando respuesta por defecto")
-        if rows:
-            answer = f"Encontré {len(rows)} resultado(s). Columnas disponibles: {', '.join(cols)}"
-        else:
-            answer = "No encontré resultados para tu consulta."
-    
-    except Exception as ex:
-        logger.warning(f"⚠️ NLG falló: {ex}, usando respuesta por defecto")
-        if rows:
-            answer = f"Encontré {len(rows)} resultado(s). Columnas: {', '.join(cols)}"
-        else:
-            answer = "No encontré resultados para tu consulta."
+
+    timings["nlg"] = elapsed_ms(stage_start)
+    timings["total"] = elapsed_ms(request_start)
 
     # ===== RESPUESTA EXITOSA =====
+    if side_effects:
+        question_history.record(data.question)
+    next_token, next_reason = paginate_generated(sql, used, rows) if not approx else (None, NO_PAGE_UNSUPPORTED)
     return {
         "sql": sql,
         "rows": rows,
@@ -960,9 +2086,143 @@ def ask(data: AskIn):
         "tables_used": sorted(list(used)),
         "row_count": len(rows),
         "columns": cols,
-        "execution_success": True
+        "execution_success": True,
+        "data_source": data_source,
+        "page": 1,
+        "next_token": next_token,
+        "next_token_reason": next_reason,
+        "export_token": issue_export_token(data.question, sql, used),
+        **({"replica_freshness_seconds": round(replica_freshness, 1)} if data_source == "replica" else {}),
+        **({
+            "rollup_sql": rollup["sql"],
+            "rollup_grain": rollup["grain"],
+            "rollup_freshness_seconds": round(rollup["freshness_seconds"], 1),
+        } if data_source == "rollup" else {}),
+        **({"approximate": True, "count_method": approx["method"]} if approx else {}),
+        **({"fallback": fallback_used} if fallback_used else {}),
+        **({"value_filters": value_matches} if value_matches else {}),
+        "timings_ms": timings
     }
 
+@app.post("/ask")
+def ask(data: AskIn):
+    """Endpoint principal - convierte preguntas en SQL y las ejecuta (ver answer_question)"""
+    return answer_question(data)
+
+
+@app.post("/ask/next")
+def ask_next(data: AskNextIn):
+    """
+    Siguiente página de un listado iniciado en /ask (atajo o SQL generado).
+    Usa la consulta validada guardada con el token y continúa por keyset
+    (WHERE (orden, clave) después de la última fila) en lugar de OFFSET.
+    """
+    state = page_tokens.get(data.token)
+    if not state:
+        raise HTTPException(status_code=404, detail="Token de paginación desconocido o expirado")
+
+    table, limit, page = state["table"], data.limit or state["limit"], state["page"]
+    if state.get("base_sql"):
+        sql = generated_page_sql(state["base_sql"], state["order"], limit, state["after"])
+        if sql is None:
+            raise HTTPException(status_code=410, detail="La consulta del token ya no se puede paginar")
+    else:
+        sql = default_list_sql(table, state["columns"], limit=limit, after=state["after"], where=state.get("where"))
+
+    if db_breaker.is_open():
+        raise HTTPException(status_code=503, detail="Base de datos no disponible (circuit breaker abierto)")
+
+    try:
+        with get_db_connection(Deadline(data.timeout_seconds or REQUEST_DEADLINE_SECONDS)) as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(sql)
+                rows = cur.fetchall() if cur.description else []
+                cols_out = [c.name for c in cur.description] if cur.description else []
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error ejecutando página {page}: {e}")
+        raise HTTPException(status_code=500, detail={"error": f"Error ejecutando SQL: {str(e)}", "sql": sql})
+
+    logger.info(f"📄 Página {page} de {table}: {len(rows)} filas")
+    if state.get("base_sql"):
+        next_token, next_reason = next_generated_token(table, state["base_sql"], state["order"], limit, rows, page)
+    else:
+        next_token, next_reason = next_page_token(table, state["columns"], limit, rows, page, state.get("where"))
+    return {
+        "sql": sql,
+        "rows": rows,
+        "columns": cols_out,
+        "row_count": len(rows),
+        "answer": f"Página {page}: {len(rows)} registros de {table}",
+        "tables_used": [table],
+        "execution_success": True,
+        "page": page,
+        "next_token": next_token,
+        "next_token_reason": next_reason,
+    }
+
+
+@app.post("/export")
+def export(data: ExportIn):
+    """
+    Exportación masiva en streaming (CSV por COPY TO STDOUT, o Parquet).
+
+    Solo exporta SQL generado por el servidor: el export_token que /ask devuelve
+    con cada consulta ejecutada, o una pregunta (se genera el SQL como en /ask,
+    sin el LIMIT del listado salvo que la pregunta pida un número). La
+    respuesta va por bloques con memoria constante.
+    """
+    if not data.question and not data.export_token:
+        raise HTTPException(status_code=400, detail="Indica 'question' o 'export_token'")
+    if data.format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Exportación Parquet no disponible: instala pyarrow")
+    if db_breaker.is_open():
+        raise HTTPException(status_code=503, detail="Base de datos no disponible (circuit breaker abierto)")
+
+    budget = Deadline(data.timeout_seconds) if data.timeout_seconds else None
+    if data.export_token:
+        state = export_tokens.get(data.export_token)
+        if not state:
+            raise HTTPException(status_code=404, detail="export_token desconocido o expirado")
+        sql, used = state["sql"], set(state["tables"])
+    else:
+        sql, used, error = generate_sql_with_retries(
+            data.question, load_schema_text(SCHEMA_PATH), allowed_tables_from_yaml(SCHEMA_PATH),
+            data.lang, deadline=budget or Deadline(REQUEST_DEADLINE_SECONDS)
+        )
+        if error:
+            raise HTTPException(status_code=422, detail={"error": error, "sql": sql})
+        sql = export_sql_for(data.question, sql)
+
+    # Errores de sintaxis o columnas se detectan antes de enviar cabeceras
+    try:
+        with get_db_connection(budget) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN {sql}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={"error": f"SQL inválido: {str(e)}", "sql": sql})
+
+    export_deadline = budget or Deadline(EXPORT_TIMEOUT_SECONDS)
+    connection_factory = lambda: get_db_connection(export_deadline, track_latency=False)
+    name = sorted(used)[0].split(".", 1)[-1] if used else "export"
+    logger.info(f"📤 Exportando {data.format}: {sql}")
+
+    if data.format == "parquet":
+        body, media_type = stream_parquet(connection_factory, sql), "application/vnd.apache.parquet"
+    else:
+        body, media_type = stream_csv(connection_factory, sql), "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{data.format}"',
+            "X-Export-Tables": ",".join(sorted(used)),
+        }
+    )
+
 
 # ====== ENDPOINT DE DEBUG ======
 @app.get("/debug/tables")
@@ -989,6 +2249,17 @@ def debug_aliases():
         "aliases": ALIASES
     }
 
+@app.get("/debug/values")
+def debug_values(q: str, table: str = ""):
+    """Valores del índice parecidos a `q`; con `table`, los filtros que se añadirían para esa tabla"""
+    if value_index is None:
+        raise HTTPException(status_code=404, detail="Índice de valores desactivado (VALUE_INDEX_ENABLED)")
+    result: Dict[str, Any] = {"lookup": value_index.lookup(q), "matches": value_index.match_question(q)}
+    if table:
+        conditions, extra, _ = value_index.filters_for(q, table.lower())
+        result.update({"conditions": conditions, "extra_tables": sorted(extra)})
+    return result
+
 
 @app.post("/debug/validate_sql")
 def debug_validate_sql(sql: str, question: str = ""):
@@ -1037,8 +2308,28 @@ def debug_config():
         "sqlcoder_url": SQLCODER_URL,
         "sqlcoder_timeout": SQLCODER_TIMEOUT,
         "nlg_url": NLG_URL,
+        "nlg_timeout": NLG_TIMEOUT,
+        "request_deadline_seconds": REQUEST_DEADLINE_SECONDS,
+        "replica_enabled": REPLICA_ENABLED,
+        "replica_tables": REPLICA_TABLES,
+        "warmup_enabled": WARMUP_ENABLED,
+        "warmup_replay_top_n": WARMUP_REPLAY_TOP_N,
+        "warmup_retry_seconds": WARMUP_RETRY_SECONDS,
+        "export_timeout_seconds": EXPORT_TIMEOUT_SECONDS,
+        "export_token_ttl_seconds": EXPORT_TOKEN_TTL_SECONDS,
+        "export_parquet_available": parquet_available(),
+        "approx_counts_enabled": APPROX_COUNTS_ENABLED,
+        "approx_count_min_rows": APPROX_COUNT_MIN_ROWS,
+        "rollups_enabled": ROLLUPS_ENABLED,
+        "cdc_enabled": CDC_ENABLED,
+        "cdc_listen": CDC_LISTEN,
+        "result_cache_ttl_seconds": RESULT_CACHE_TTL_SECONDS,
+        "breaker_failure_rate": BREAKER_FAILURE_RATE,
+        "breaker_open_seconds": BREAKER_OPEN_SECONDS,
         "schema_path": SCHEMA_PATH,
         "schema_exists": os.path.exists(SCHEMA_PATH),
+        "catalog_artifact_path": CATALOG_ARTIFACT_PATH,
+        "catalog_artifact_exists": os.path.exists(CATALOG_ARTIFACT_PATH),
         "pg_host": PG_HOST,
         "pg_port": PG_PORT,
         "pg_db": PG_DB,
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Exportación masiva en streaming con memoria constante.
+
+- CSV: COPY (<sql>) TO STDOUT directamente desde PostgreSQL, sin pasar por
+  cursores de diccionarios ni JSON.
+- Parquet (opcional, requiere pyarrow): cursor con nombre leído por lotes y
+  escrito por grupos de filas.
+
+En ambos casos un hilo productor escribe en una cola acotada y la respuesta HTTP
+consume la cola por bloques: si el cliente lee despacio el productor se frena, y
+si se desconecta el productor se cancela y libera la conexión.
+"""
+
+import queue
+import logging
+import threading
+from decimal import Decimal
+from typing import Any, Callable, Iterator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 256 * 1024
+QUEUE_CHUNKS = 8
+PARQUET_BATCH_ROWS = 10000
+
+_DONE = object()
+
+
+class ExportCancelled(Exception):
+    """El cliente dejó de leer la respuesta"""
+
+
+class _QueueWriter:
+    """Archivo de solo escritura que entrega bloques de CHUNK_BYTES a una cola acotada"""
+
+    def __init__(self, chunks: "queue.Queue", cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def _put(self, item: Any):
+        while True:
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.buffer.extend(data)
+        self.position += len(data)
+        if len(self.buffer) >= CHUNK_BYTES:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        self.closed = True
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def _stream(produce: Callable[[_QueueWriter], None], name: str) -> Iterator[bytes]:
+    """Ejecuta produce() en un hilo y entrega sus bloques a medida que llegan"""
+    chunks: "queue.Queue" = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    writer = _QueueWriter(chunks, cancelled)
+
+    def run():
+        try:
+            produce(writer)
+            writer.flush()
+            writer._put(_DONE)
+        except ExportCancelled:
+            logger.info(f"✂️ Exportación {name} cancelada por el cliente")
+        except Exception as e:
+            logger.error(f"❌ Exportación {name} falló: {e}")
+            try:
+                writer._put(e)
+            except ExportCancelled:
+                pass
+
+    threading.Thread(target=run, name=f"export-{name}", daemon=True).start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                # Ya se enviaron cabeceras: cortar la respuesta es la única señal posible
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+
+
+def stream_csv(connection_factory: Callable, sql: str) -> Iterator[bytes]:
+    """CSV con cabecera generado por COPY (<sql>) TO STDOUT"""
+    def produce(writer: _QueueWriter):
+        with connection_factory() as conn:
+            conn.set_session(readonly=True)
+            with conn.cursor() as cur:
+                cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+            conn.rollback()
+    return _stream(produce, "csv")
+
+
+def _arrow_schema(description) -> "pa.Schema":
+    """Esquema Arrow a partir de los OID de tipo de PostgreSQL (texto por defecto)"""
+    types = {
+        16: pa.bool_(),
+        20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+        700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),
+        1082: pa.date32(),
+        1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(c.name, types.get(c.type_code, pa.string())) for c in description])
+
+
+def _arrow_value(value: Any, arrow_type: "pa.DataType") -> Any:
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return float(value)
+    if pa.types.is_string(arrow_type) and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def stream_parquet(connection_factory: Callable, sql: str) -> Iterator[bytes]:
+    """Parquet escrito por grupos de PARQUET_BATCH_ROWS filas desde un cursor con nombre"""
+    if pa is None:
+        raise RuntimeError("pyarrow no está instalado")
+
+    def produce(writer: _QueueWriter):
+        with connection_factory() as conn:
+            conn.set_session(readonly=True)
+            with conn.cursor(name="bulk_export") as cur:
+                cur.itersize = PARQUET_BATCH_ROWS
+                cur.execute(sql)
+                batch = cur.fetchmany(PARQUET_BATCH_ROWS)
+                schema = _arrow_schema(cur.description)
+                parquet_writer = pq.ParquetWriter(writer, schema)
+                while batch:
+                    columns = [
+                        pa.array([_arrow_value(r[i], field.type) for r in batch], type=field.type)
+                        for i, field in enumerate(schema)
+                    ]
+                    parquet_writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                    batch = cur.fetchmany(PARQUET_BATCH_ROWS)
+                parquet_writer.close()
+            conn.rollback()
+    return _stream(produce, "parquet")
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo compilado.
+
+Todo lo que el conector y SQLCoder derivan de schema_catalog.yaml, calculado una
+sola vez (por gen_schema.py o por este módulo) y guardado en un pickle con
+cabecera de versión. Cargarlo toma milisegundos frente a parsear el YAML y
+reconstruir índices en cada arranque.
+
+Contenido:
+- data: el YAML tal cual (para código que aún lo recorre directamente)
+- allowed: tablas permitidas (schema.tabla en minúsculas)
+- columns: columnas por tabla (clave en minúsculas)
+- stats: rows_estimate, size_bytes, primary_key y foreign_keys por tabla
+- trigrams: índice trigrama -> tablas, para corregir nombres de tabla
+- schema_text: texto del prompt (TABLE ... -- desc / - col (tipo) / FK ...)
+- prompt_tables: las tablas de schema_text en el formato de parse_schema() de SQLCoder
+- source: sha256 y tamaño del YAML de origen; si no coincide, el artefacto está obsoleto
+
+Uso (compilar un YAML existente sin pasar por la BD):
+    python catalog_artifact.py schema_catalog.yaml
+"""
+
+import os
+import sys
+import struct
+import pickle
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AGROCAT\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">8sI")
+
+SCHEMA_TEXT_LIMIT = 20000
+
+
+def default_artifact_path(yaml_path: str) -> str:
+    """schema_catalog.yaml -> schema_catalog.catalog.pkl"""
+    return os.path.splitext(yaml_path)[0] + ".catalog.pkl"
+
+
+# ====== CONSTRUCCIÓN ======
+def trigrams(name: str) -> Set[str]:
+    """Trigramas de un nombre con relleno (como pg_trgm): 'cost' -> {'  c', ' co', 'cos', 'ost', 'st '}"""
+    padded = f"  {name.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_trigram_index(tables: Iterable[str]) -> Dict[str, List[str]]:
+    """trigrama del nombre de tabla (sin esquema) -> tablas schema.tabla que lo contienen"""
+    index: Dict[str, List[str]] = {}
+    for full in sorted(tables):
+        for tri in trigrams(full.split(".", 1)[-1]):
+            index.setdefault(tri, []).append(full)
+    return index
+
+
+def similar_tables(index: Dict[str, List[str]], name: str, limit: int = 20) -> List[str]:
+    """Tablas con más trigramas en común con `name` (candidatas para difflib)"""
+    counts: Dict[str, int] = {}
+    for tri in trigrams(name):
+        for full in index.get(tri, ()):
+            counts[full] = counts.get(full, 0) + 1
+    return sorted(counts, key=lambda t: (-counts[t], t))[:limit]
+
+
+def render_schema_text(data: Dict) -> str:
+    """Texto del esquema para el prompt de SQLCoder (recortado a SCHEMA_TEXT_LIMIT caracteres)"""
+    lines: List[str] = []
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            sname = sch.get("name", "public")
+            for t in sch.get("tables", []):
+                tname = f'{sname}.{t.get("name","")}'
+                tdesc = t.get("description","") or ""
+                lines.append(f"TABLE {tname} -- {tdesc}".strip())
+                for c in t.get("columns", []):
+                    cname = c.get('name', '')
+                    ctype = c.get('type', '')
+                    if cname and ctype:
+                        lines.append(f"  - {cname} ({ctype})")
+                # Aristas de JOIN exportadas por gen_schema.py (parse_schema ignora estas líneas)
+                for fk in t.get("foreign_keys", []) or []:
+                    ref = fk.get("references", {})
+                    lines.append(
+                        f"  FK {', '.join(fk.get('columns', []))} -> "
+                        f"{ref.get('schema', sname)}.{ref.get('table', '')}({', '.join(ref.get('columns', []))})"
+                    )
+    return "\n".join(lines)[:SCHEMA_TEXT_LIMIT]
+
+
+def compile_catalog(data: Dict, source: bytes = b"") -> Dict[str, Any]:
+    """Estructuras derivadas del YAML ya parseado; `source` son los bytes del YAML (para detectar obsolescencia)"""
+    allowed: Set[str] = set()
+    columns: Dict[str, List[str]] = {}
+    stats: Dict[str, Dict[str, Any]] = {}
+    tables: Dict[str, Dict[str, Any]] = {}
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            sname = sch.get("name") or "public"
+            for t in sch.get("tables", []):
+                tname = t.get("name") or ""
+                if not tname:
+                    continue
+                key = f"{sname}.{tname}".lower()
+                allowed.add(key)
+                columns[key] = [n for n in ((c.get("name") or "").strip() for c in t.get("columns", [])) if n]
+                stats[key] = {
+                    "rows_estimate": t.get("rows_estimate"),
+                    "size_bytes": t.get("size_bytes"),
+                    "primary_key": t.get("primary_key", []),
+                    "foreign_keys": t.get("foreign_keys", []),
+                }
+                tables[f"{sch.get('name', 'public')}.{tname}"] = {
+                    "description": (t.get("description", "") or "").strip(),
+                    "columns": [
+                        {"name": c["name"], "type": c["type"]}
+                        for c in t.get("columns", []) if c.get("name") and c.get("type")
+                    ],
+                }
+
+    schema_text = render_schema_text(data)
+    # Solo las tablas que entraron en el texto recortado, como las vería parse_schema()
+    in_text = {line.split()[1] for line in schema_text.splitlines() if line.startswith("TABLE ")}
+    prompt_tables = {name: info for name, info in tables.items() if name in in_text}
+
+    return {
+        "version": FORMAT_VERSION,
+        "source": {"sha256": hashlib.sha256(source).hexdigest(), "size": len(source)},
+        "data": data,
+        "allowed": frozenset(allowed),
+        "columns": columns,
+        "stats": stats,
+        "trigrams": build_trigram_index(allowed),
+        "schema_text": schema_text,
+        "schema_text_sha256": hashlib.sha256(schema_text.encode("utf-8")).hexdigest(),
+        "prompt_tables": prompt_tables,
+    }
+
+
+def compile_yaml(yaml_path: str) -> Dict[str, Any]:
+    with open(yaml_path, "rb") as f:
+        source = f.read()
+    return compile_catalog(yaml.safe_load(source) or {}, source)
+
+
+# ====== LECTURA / ESCRITURA ======
+def write_artifact(path: str, artifact: Dict[str, Any]):
+    """Escritura atómica: cabecera (magia + versión) y pickle"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def read_artifact(path: str) -> Optional[Dict[str, Any]]:
+    """Artefacto o None si no existe, está dañado o es de otra versión del formato"""
+    try:
+        with open(path, "rb") as f:
+            magic, version = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                logger.warning(f"⚠️ Catálogo compilado {path} con formato incompatible (v{version})")
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Catálogo compilado ilegible {path}: {e}")
+        return None
+
+
+def load_for_yaml(artifact_path: str, yaml_path: str) -> Optional[Dict[str, Any]]:
+    """Artefacto solo si fue compilado desde el contenido actual del YAML"""
+    artifact = read_artifact(artifact_path)
+    if not artifact:
+        return None
+    with open(yaml_path, "rb") as f:
+        source = f.read()
+    if artifact.get("source", {}).get("sha256") != hashlib.sha256(source).hexdigest():
+        logger.info(f"♻️ Catálogo compilado obsoleto respecto a {yaml_path}")
+        return None
+    return artifact
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python catalog_artifact.py schema_catalog.yaml [salida.catalog.pkl]")
+        sys.exit(1)
+    src = sys.argv[1]
+    out = sys.argv[2] if len(sys.argv) > 2 else default_artifact_path(src)
+    compiled = compile_yaml(src)
+    write_artifact(out, compiled)
+    print(f"[ok] Catálogo compilado en {out} (tablas={len(compiled['allowed'])})")
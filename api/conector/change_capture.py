@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Captura incremental de cambios para mantener frescas la caché de resultados
+y la réplica analítica sin volver a leer tablas completas.
+
+- Inserciones: cada tabla lleva una marca de agua (watermark) sobre su clave
+  única id. Un id se asigna al insertar pero la fila solo es visible al hacer
+  COMMIT, así que transacciones que confirman fuera de orden dejan huecos por
+  debajo del id máximo visto. Por eso la marca "segura" solo avanza hasta el id
+  máximo de un sondeo anterior cuando todas las transacciones que estaban en
+  curso en ese sondeo terminaron (xmin del snapshot >= su xmax); por encima de
+  ella se vuelve a leer en cada sondeo y se descartan los ids ya publicados.
+- Tablas sin id: una columna de fecha no es única (filas con la misma fecha que
+  la marca se perderían), así que solo se detecta que cambiaron con los
+  contadores de pg_stat_user_tables y se publica un cambio sin filas (los
+  suscriptores resincronizan la tabla completa).
+- Actualizaciones y borrados (opcional): un trigger publica cada cambio en un
+  canal LISTEN/NOTIFY de PostgreSQL; en UPDATE incluye también la fila anterior.
+
+Los suscriptores reciben eventos como diccionarios:
+    {"table": "public.farm_production", "kind": "insert|update|delete|checkpoint",
+     "rows": [...], "old_rows": [...], "at": <epoch>}
+"old_rows" (solo en update) son las filas antes del cambio: un UPDATE que mueve
+una fila de fecha toca dos periodos. "checkpoint" indica que la tabla está al
+día hasta "at" aunque no haya filas nuevas.
+"""
+
+import os
+import json
+import time
+import select
+import logging
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+logger = logging.getLogger(__name__)
+
+# Solo columnas únicas: con una fecha repetida "> marca" salta filas de la misma fecha
+WATERMARK_CANDIDATES = ("id",)
+NOTIFY_CHANNEL = "maria_changes"
+# Sondeos pendientes de confirmar (xmax, id máximo) que se conservan mientras una transacción larga frena la marca
+MAX_HORIZONS = 64
+
+NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION maria_notify_change() RETURNS trigger AS $$
+DECLARE
+    payload text;
+    rec record;
+BEGIN
+    IF TG_OP = 'DELETE' THEN rec := OLD; ELSE rec := NEW; END IF;
+    payload := json_build_object(
+        'table', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME,
+        'op', lower(TG_OP),
+        'row', row_to_json(rec),
+        'old_row', CASE WHEN TG_OP = 'UPDATE' THEN row_to_json(OLD) END
+    )::text;
+    -- NOTIFY admite hasta 8000 bytes: si las filas no caben se envía sin ellas
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object(
+            'table', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME,
+            'op', lower(TG_OP),
+            'row', NULL
+        )::text;
+    END IF;
+    PERFORM pg_notify(TG_ARGV[0], payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def pick_watermark_column(columns: List[Tuple[str, str]]) -> Optional[str]:
+    """Primera columna de WATERMARK_CANDIDATES (únicas) presente en la tabla"""
+    names = {c.lower(): c for c, _ in columns}
+    for cand in WATERMARK_CANDIDATES:
+        if cand in names:
+            return names[cand]
+    return None
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class ChangeCapture:
+    """Sondeo por watermark + escucha opcional de NOTIFY, con publicación a suscriptores"""
+
+    def __init__(
+        self,
+        connection_factory: Callable,
+        table_specs: Dict[str, List[Tuple[str, str]]],
+        state_path: str,
+        batch_size: int = 5000,
+        channel: str = NOTIFY_CHANNEL
+    ):
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.channel = channel
+        self.state_path = state_path
+        self.columns: Dict[str, List[str]] = {t: [c for c, _ in cols] for t, cols in table_specs.items()}
+        self.watermark_columns: Dict[str, str] = {}
+        for table, cols in table_specs.items():
+            col = pick_watermark_column(cols)
+            if col:
+                self.watermark_columns[table] = col
+            else:
+                logger.warning(f"⚠️ {table} sin columna id: solo se detectan cambios (resincronización completa)")
+
+        # watermarks[tabla] = {"mark": id seguro, "seen": ids publicados > mark, "horizons": [[xmax, id máx]]}
+        # counters[tabla] = ins+upd+del de pg_stat_user_tables (tablas sin id)
+        self.watermarks, self.counters = self._load_state()
+        self.last_poll_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.events_published = 0
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # ---------- Suscripción ----------
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        self._subscribers.append(callback)
+
+    def publish(self, event: Dict[str, Any]):
+        self.events_published += 1
+        for cb in self._subscribers:
+            try:
+                cb(event)
+            except Exception as e:
+                logger.warning(f"⚠️ Suscriptor de cambios falló en {event.get('table')}: {e}")
+
+    # ---------- Estado ----------
+    def _load_state(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                watermarks = {}
+                for table, value in state.get("watermarks", {}).items():
+                    if table not in self.watermark_columns:
+                        continue  # Marcas antiguas sobre fechas: la tabla pasa a detección de cambios
+                    if not isinstance(value, dict):  # Formato anterior: solo el valor de la marca
+                        value = {"mark": value, "seen": [], "horizons": []}
+                    watermarks[table] = value
+                return watermarks, state.get("counters", {})
+            except Exception as e:
+                logger.warning(f"⚠️ Estado de captura ilegible, se reinicia: {e}")
+        return {}, {}
+
+    def _save_state(self):
+        try:
+            if os.path.dirname(self.state_path):
+                os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"watermarks": self.watermarks, "counters": self.counters, "saved_at": time.time()}, f)
+            os.replace(tmp, self.state_path)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el estado de captura: {e}")
+
+    # ---------- Sondeo por watermark ----------
+    def prime(self):
+        """Fija la marca inicial en el máximo actual (las copias completas ya cubren lo anterior)"""
+        pending = [t for t in self.watermark_columns if t not in self.watermarks]
+        if not pending:
+            return
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                for table in pending:
+                    col = self.watermark_columns[table]
+                    cur.execute(f'SELECT MAX("{col}") FROM {table}')
+                    self.watermarks[table] = {"mark": _json_value(cur.fetchone()[0]), "seen": [], "horizons": []}
+        self._save_state()
+
+    def poll_once(self) -> Dict[str, int]:
+        """Lee solo las filas nuevas de cada tabla y publica un evento por lote"""
+        new_rows: Dict[str, int] = {}
+        with self.connection_factory() as conn:
+            for table, col in self.watermark_columns.items():
+                new_rows[table] = self._poll_table(conn, table, col)
+
+            # Snapshot tomado después de leer: toda fila no visible con id <= al máximo
+            # leído pertenece a una transacción con xid < xmax de este snapshot
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT txid_snapshot_xmin(s), txid_snapshot_xmax(s) FROM txid_current_snapshot() AS s"
+                )
+                xmin, xmax = cur.fetchone()
+            for table in self.watermark_columns:
+                self._advance(table, xmin, xmax)
+                self.publish({"table": table, "kind": "checkpoint", "rows": [], "at": time.time()})
+
+            for table in self.columns:
+                if table not in self.watermark_columns:
+                    self._poll_counters(conn, table)
+
+        self.last_poll_at = time.time()
+        self._save_state()
+        return new_rows
+
+    def _poll_table(self, conn, table: str, col: str) -> int:
+        """Relee los ids por encima de la marca segura y publica los que aún no se publicaron"""
+        state = self.watermarks.setdefault(table, {"mark": None, "seen": [], "horizons": []})
+        seen = set(state["seen"])
+        cols = ", ".join(f'"{c}"' for c in self.columns[table])
+        after = state["mark"]
+        total = 0
+        while True:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                if after is None:
+                    cur.execute(
+                        f'SELECT {cols} FROM {table} ORDER BY "{col}" LIMIT %s',
+                        (self.batch_size,)
+                    )
+                else:
+                    cur.execute(
+                        f'SELECT {cols} FROM {table} WHERE "{col}" > %s ORDER BY "{col}" LIMIT %s',
+                        (after, self.batch_size)
+                    )
+                rows = [{k: _json_value(v) for k, v in r.items()} for r in cur.fetchall()]
+
+            if not rows:
+                break
+            after = rows[-1][col]
+            fresh = [r for r in rows if r[col] not in seen]
+            if fresh:
+                seen.update(r[col] for r in fresh)
+                total += len(fresh)
+                self.publish({"table": table, "kind": "insert", "rows": fresh, "at": time.time()})
+            if len(rows) < self.batch_size:
+                break
+
+        state["seen"] = sorted(seen)
+        return total
+
+    def _advance(self, table: str, xmin: int, xmax: int):
+        """
+        Registra el sondeo (xmax, id máximo visto) y sube la marca segura hasta el
+        id máximo de los sondeos cuyas transacciones en curso ya terminaron.
+        """
+        state = self.watermarks[table]
+        top = max(state["seen"], default=state["mark"])
+        if top is not None:
+            state["horizons"].append([xmax, top])
+        ready = [h for h in state["horizons"] if h[0] <= xmin]
+        if ready:
+            mark = max(h[1] for h in ready)
+            state["mark"] = mark if state["mark"] is None else max(state["mark"], mark)
+            state["horizons"] = [h for h in state["horizons"] if h[0] > xmin]
+            state["seen"] = [i for i in state["seen"] if i > state["mark"]]
+        # Una transacción muy larga frena la marca: se descartan sondeos intermedios (solo retrasa el avance)
+        if len(state["horizons"]) > MAX_HORIZONS:
+            del state["horizons"][1:len(state["horizons"]) - MAX_HORIZONS + 1]
+
+    def _poll_counters(self, conn, table: str):
+        """Tablas sin id: un cambio en ins+upd+del publica un evento sin filas (resincronización)"""
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relid = to_regclass(%s)",
+                (table,)
+            )
+            row = cur.fetchone()
+        if not row or row[0] is None:
+            return
+        previous = self.counters.get(table)
+        self.counters[table] = int(row[0])
+        if previous is not None and previous != row[0]:
+            self.publish({"table": table, "kind": "update", "rows": [], "at": time.time()})
+
+    # ---------- LISTEN/NOTIFY ----------
+    def install_triggers(self):
+        """Crea la función y los triggers AFTER UPDATE OR DELETE en cada tabla"""
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute(NOTIFY_FUNCTION_SQL)
+                for table in self.columns:
+                    trigger = f"maria_notify_{table.split('.', 1)[1]}"
+                    cur.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+                    cur.execute(
+                        f"CREATE TRIGGER {trigger} AFTER UPDATE OR DELETE ON {table} "
+                        f"FOR EACH ROW EXECUTE FUNCTION maria_notify_change('{self.channel}')"
+                    )
+            conn.commit()
+        logger.info(f"🔔 Triggers de cambios instalados en {len(self.columns)} tablas")
+
+    def handle_notification(self, payload: str):
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            logger.warning(f"⚠️ Notificación ilegible: {payload[:100]}")
+            return
+        table = msg.get("table")
+        if table not in self.columns:
+            return
+        row, old = msg.get("row"), msg.get("old_row")
+        self.publish({
+            "table": table,
+            "kind": msg.get("op", "update"),
+            "rows": [row] if row else [],
+            "old_rows": [old] if old else [],
+            "at": time.time(),
+        })
+
+    def listen_forever(self):
+        """Escucha el canal NOTIFY hasta stop(); reconecta si la conexión cae"""
+        while not self._stop.is_set():
+            try:
+                with self.connection_factory() as conn:
+                    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                    with conn.cursor() as cur:
+                        cur.execute(f"LISTEN {self.channel}")
+                    logger.info(f"🔔 Escuchando cambios en canal '{self.channel}'")
+                    while not self._stop.is_set():
+                        if select.select([conn], [], [], 5) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self.handle_notification(conn.notifies.pop(0).payload)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"⚠️ Escucha de cambios interrumpida: {e}")
+                self._stop.wait(5)
+
+    # ---------- Ciclo de vida ----------
+    def start(self, poll_seconds: float, listen: bool = False):
+        def poll_loop():
+            while not self._stop.is_set():
+                try:
+                    self.prime()
+                    self.poll_once()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Sondeo de cambios falló: {e}")
+                self._stop.wait(poll_seconds)
+
+        self._threads.append(threading.Thread(target=poll_loop, name="change-capture-poll", daemon=True))
+        if listen:
+            self._threads.append(threading.Thread(target=self.listen_forever, name="change-capture-listen", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tables": {
+                **{
+                    t: {
+                        "column": c,
+                        "watermark": self.watermarks.get(t, {}).get("mark"),
+                        "pending_ids": len(self.watermarks.get(t, {}).get("seen", [])),
+                    }
+                    for t, c in sorted(self.watermark_columns.items())
+                },
+                **{
+                    t: {"column": None, "change_counter": self.counters.get(t)}
+                    for t in sorted(self.columns) if t not in self.watermark_columns
+                },
+            },
+            "last_poll_at": self.last_poll_at,
+            "events_published": self.events_published,
+            "subscribers": len(self._subscribers),
+            "last_error": self.last_error,
+        }
@@ -4,20 +4,118 @@
 """
 Genera un schema_catalog.yaml a partir de una BD PostgreSQL.
 
+La introspección usa dos consultas sobre pg_catalog por esquema (o por todo el
+catálogo): una para tablas y columnas, y otra para claves primarias, claves
+foráneas e índices. Además de columnas y descripciones exporta:
+- primary_key, foreign_keys (aristas para planear JOINs) e indexes,
+- rows_estimate (pg_class.reltuples) y size_bytes, para guardas de costo
+  sin consultas adicionales desde el conector.
+
 Uso típico:
 python gen_schema.py \
   --host 148.230.92.252 --port 5432 \
   --db agrodb --user agro --password "TU_PASS" --sslmode require \
   --schema public \
   --out /workspace/api/conector/schema_catalog.yaml
+
+Varios esquemas en paralelo (una conexión por esquema):
+python gen_schema.py ... --schema public,ventas,inventario --parallel 3
+
+Junto al YAML se escribe el catálogo compilado (schema_catalog.catalog.pkl, ver
+catalog_artifact.py) que el conector y SQLCoder cargan al arrancar.
 """
 
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
 import psycopg2
 import psycopg2.extras
 import yaml
 
+from catalog_artifact import compile_yaml, default_artifact_path, write_artifact
+
+
+SYSTEM_SCHEMAS_SQL = """
+    n.nspname NOT IN ('pg_catalog','information_schema')
+    AND n.nspname NOT LIKE 'pg_toast%%'
+    AND n.nspname NOT LIKE 'pg_temp%%'
+"""
+
+# 1) Tablas con sus columnas (una fila por tabla). format_type(..., NULL) da el
+#    mismo nombre de tipo que information_schema.columns.data_type, sin typmod.
+TABLES_SQL = """
+    SELECT n.nspname AS schema,
+           c.relname AS table,
+           c.relkind,
+           obj_description(c.oid, 'pg_class') AS description,
+           c.reltuples::bigint AS rows_estimate,
+           pg_total_relation_size(c.oid) AS size_bytes,
+           COALESCE(
+               json_agg(
+                   json_build_object(
+                       'name', a.attname,
+                       'type', format_type(a.atttypid, NULL),
+                       'description', col_description(c.oid, a.attnum)
+                   ) ORDER BY a.attnum
+               ) FILTER (WHERE a.attnum IS NOT NULL),
+               '[]'
+           ) AS columns
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE {schemas}
+      AND c.relkind IN ({relkinds})
+      AND NOT c.relispartition
+    GROUP BY n.nspname, c.relname, c.relkind, c.oid, c.reltuples
+    ORDER BY n.nspname, c.relname
+"""
+
+# 2) Claves primarias, claves foráneas e índices (una fila por objeto)
+KEYS_SQL = """
+    SELECT n.nspname AS schema,
+           c.relname AS table,
+           CASE co.contype WHEN 'p' THEN 'primary_key' ELSE 'foreign_key' END AS kind,
+           co.conname AS name,
+           ARRAY(
+               SELECT a.attname FROM unnest(co.conkey) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = co.conrelid AND a.attnum = k.attnum
+               ORDER BY k.ord
+           ) AS columns,
+           rn.nspname AS ref_schema,
+           rc.relname AS ref_table,
+           ARRAY(
+               SELECT a.attname FROM unnest(co.confkey) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = co.confrelid AND a.attnum = k.attnum
+               ORDER BY k.ord
+           ) AS ref_columns,
+           NULL::boolean AS is_unique,
+           NULL::text AS definition
+    FROM pg_constraint co
+    JOIN pg_class c ON c.oid = co.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_class rc ON rc.oid = co.confrelid
+    LEFT JOIN pg_namespace rn ON rn.oid = rc.relnamespace
+    WHERE {schemas} AND co.contype IN ('p', 'f')
+    UNION ALL
+    SELECT n.nspname, c.relname, 'index', ic.relname,
+           ARRAY(
+               SELECT a.attname FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+               ORDER BY k.ord
+           ),
+           NULL, NULL, NULL,
+           i.indisunique,
+           pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_class c ON c.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE {schemas}
+    ORDER BY 1, 2, 3, 4
+"""
+
 
 def fetch(conn, q, args=()):
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
@@ -25,6 +123,74 @@ def fetch(conn, q, args=()):
         return cur.fetchall()
 
 
+def connect(args):
+    return psycopg2.connect(
+        host=args.host,
+        port=args.port,
+        dbname=args.db,
+        user=args.user,
+        password=args.password,
+        sslmode=args.sslmode,
+    )
+
+
+def introspect(conn, schemas: Optional[List[str]], include_views: bool) -> Dict[str, List[Dict]]:
+    """Tablas de los esquemas dados (todos si None), agrupadas por esquema"""
+    schema_sql = SYSTEM_SCHEMAS_SQL + (" AND n.nspname = ANY(%s)" if schemas else "")
+    params = (schemas,) if schemas else ()
+    relkinds = "'r','p'" if not include_views else "'r','p','v','m'"
+
+    tables = fetch(conn, TABLES_SQL.format(schemas=schema_sql, relkinds=relkinds), params)
+    keys = fetch(conn, KEYS_SQL.format(schemas=schema_sql), params * 2)
+
+    keymap: Dict[tuple, Dict[str, list]] = {}
+    for k in keys:
+        entry = keymap.setdefault((k["schema"], k["table"]), {"primary_key": [], "foreign_keys": [], "indexes": []})
+        if k["kind"] == "primary_key":
+            entry["primary_key"] = list(k["columns"])
+        elif k["kind"] == "foreign_key":
+            entry["foreign_keys"].append({
+                "name": k["name"],
+                "columns": list(k["columns"]),
+                "references": {
+                    "schema": k["ref_schema"],
+                    "table": k["ref_table"],
+                    "columns": list(k["ref_columns"]),
+                },
+            })
+        else:
+            entry["indexes"].append({
+                "name": k["name"],
+                "columns": list(k["columns"]),
+                "unique": bool(k["is_unique"]),
+                "definition": k["definition"],
+            })
+
+    by_schema: Dict[str, List[Dict]] = {}
+    for t in tables:
+        extra = keymap.get((t["schema"], t["table"]), {})
+        # reltuples = -1 (PG14+) si la tabla nunca fue analizada
+        rows_estimate = t["rows_estimate"] if t["rows_estimate"] is not None and t["rows_estimate"] >= 0 else None
+        by_schema.setdefault(t["schema"], []).append({
+            "name": t["table"],
+            **({"description": t["description"]} if t.get("description") else {}),
+            "rows_estimate": rows_estimate,
+            "size_bytes": t["size_bytes"],
+            **({"primary_key": extra["primary_key"]} if extra.get("primary_key") else {}),
+            "columns": [
+                {
+                    "name": c["name"],
+                    "type": c["type"],
+                    **({"description": c["description"]} if c.get("description") else {}),
+                }
+                for c in t["columns"]
+            ],
+            **({"foreign_keys": extra["foreign_keys"]} if extra.get("foreign_keys") else {}),
+            **({"indexes": extra["indexes"]} if extra.get("indexes") else {}),
+        })
+    return by_schema
+
+
 def main():
     ap = argparse.ArgumentParser(description="Exporta el esquema de PostgreSQL a schema_catalog.yaml")
     ap.add_argument("--host", required=True)
@@ -33,108 +199,51 @@ def main():
     ap.add_argument("--user", required=True)
     ap.add_argument("--password", required=True)
     ap.add_argument("--sslmode", default="require", help="disable|allow|prefer|require|verify-ca|verify-full")
-    ap.add_argument("--schema", default=None, help="Filtrar por esquema (ej. public). Si se omite, exporta todos.")
+    ap.add_argument("--schema", default=None,
+                    help="Filtrar por esquema(s) separados por coma (ej. public). Si se omite, exporta todos.")
+    ap.add_argument("--parallel", type=int, default=1,
+                    help="Introspeccionar hasta N esquemas en paralelo (una conexión por esquema)")
     ap.add_argument("--out", default="schema_catalog.yaml")
     ap.add_argument("--limit_tables", type=int, default=0, help="0 = sin límite de tablas")
     ap.add_argument("--include_views", action="store_true", help="Incluir vistas además de tablas")
+    ap.add_argument("--artifact", default=None,
+                    help="Ruta del catálogo compilado (por defecto <out>.catalog.pkl junto al YAML)")
+    ap.add_argument("--no_artifact", action="store_true", help="No generar el catálogo compilado")
     args = ap.parse_args()
 
-    conn = psycopg2.connect(
-        host=args.host,
-        port=args.port,
-        dbname=args.db,
-        user=args.user,
-        password=args.password,
-        sslmode=args.sslmode,
-    )
-
-    # 1) Esquemas
-    schema_filter_ns = "AND n.nspname = %s" if args.schema else ""
-    schemas = fetch(
-        conn,
-        f"""
-        SELECT n.nspname AS schema
-        FROM pg_namespace n
-        WHERE n.nspname NOT IN ('pg_catalog','information_schema')
-          AND n.nspname NOT LIKE 'pg_toast%%'
-          {schema_filter_ns}
-        ORDER BY 1;
-        """,
-        (args.schema,) if args.schema else (),
-    )
+    schemas = [s.strip() for s in args.schema.split(",") if s.strip()] if args.schema else None
 
-    # 2) Tablas (y opcionalmente vistas)
-    relkinds = ("'r'") if not args.include_views else ("'r','v'")
-    schema_filter_cls = "AND n.nspname = %s" if args.schema else ""
-    tables = fetch(
-        conn,
-        f"""
-        SELECT n.nspname AS schema,
-               c.relname  AS table,
-               obj_description(c.oid, 'pg_class') AS description,
-               c.relkind
-        FROM pg_class c
-        JOIN pg_namespace n ON n.oid = c.relnamespace
-        WHERE n.nspname NOT IN ('pg_catalog','information_schema')
-          AND n.nspname NOT LIKE 'pg_toast%%'
-          AND c.relkind IN ({relkinds})
-          {schema_filter_cls}
-        ORDER BY n.nspname, c.relname;
-        """,
-        (args.schema,) if args.schema else (),
-    )
+    # 1) Introspección: una pasada para todos los esquemas, o una por esquema en paralelo
+    if schemas and args.parallel > 1 and len(schemas) > 1:
+        def one(schema):
+            conn = connect(args)
+            try:
+                return introspect(conn, [schema], args.include_views)
+            finally:
+                conn.close()
 
-    # 3) Columnas (¡sin %s dentro de format()! usamos quote_ident)
-    schema_filter_cols = "AND c.table_schema = %s" if args.schema else ""
-    cols = fetch(
-        conn,
-        f"""
-        SELECT
-            c.table_schema AS schema,
-            c.table_name   AS table,
-            c.column_name  AS name,
-            c.data_type    AS type,
-            col_description(
-                (quote_ident(c.table_schema) || '.' || quote_ident(c.table_name))::regclass::oid,
-                c.ordinal_position
-            ) AS description
-        FROM information_schema.columns c
-        WHERE c.table_schema NOT IN ('pg_catalog','information_schema')
-          {schema_filter_cols}
-        ORDER BY c.table_schema, c.table_name, c.ordinal_position;
-        """,
-        (args.schema,) if args.schema else (),
-    )
-
-    # 4) Armar mapa de columnas
-    colmap = {}
-    for r in cols:
-        key = (r["schema"], r["table"])
-        colmap.setdefault(key, []).append({
-            "name": r["name"],
-            "type": r["type"],
-            **({"description": r["description"]} if r.get("description") else {}),
-        })
+        by_schema: Dict[str, List[Dict]] = {}
+        with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+            for result in pool.map(one, schemas):
+                by_schema.update(result)
+    else:
+        conn = connect(args)
+        try:
+            by_schema = introspect(conn, schemas, args.include_views)
+        finally:
+            conn.close()
 
-    # 5) Construir estructura YAML final
+    # 2) Construir estructura YAML final
     schema_nodes = []
     total_tables = 0
     limit = args.limit_tables if args.limit_tables and args.limit_tables > 0 else None
 
-    for s in schemas:
-        sname = s["schema"]
+    for sname in sorted(by_schema):
         tables_in_schema = []
-        for t in tables:
-            if t["schema"] != sname:
-                continue
+        for t in by_schema[sname]:
             if limit is not None and total_tables >= limit:
                 break
-            key = (t["schema"], t["table"])
-            tables_in_schema.append({
-                "name": t["table"],
-                **({"description": t["description"]} if t.get("description") else {}),
-                "columns": colmap.get(key, []),
-            })
+            tables_in_schema.append(t)
             total_tables += 1
 
         if tables_in_schema:
@@ -152,13 +261,20 @@ def main():
         ]
     }
 
-    # 6) Guardar YAML
+    # 3) Guardar YAML
     out_path = os.path.abspath(args.out)
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         yaml.safe_dump(out_obj, f, sort_keys=False, allow_unicode=True)
 
-    print(f"[ok] Esquema guardado en {out_path} (schemas={len(schema_nodes)}, tablas={total_tables})")
+    fks = sum(len(t.get("foreign_keys", [])) for s in schema_nodes for t in s["tables"])
+    print(f"[ok] Esquema guardado en {out_path} (schemas={len(schema_nodes)}, tablas={total_tables}, fks={fks})")
+
+    # 4) Catálogo compilado (índices y texto del prompt precalculados para el conector y SQLCoder)
+    if not args.no_artifact:
+        artifact_path = os.path.abspath(args.artifact or default_artifact_path(out_path))
+        write_artifact(artifact_path, compile_yaml(out_path))
+        print(f"[ok] Catálogo compilado en {artifact_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+Rollups precalculados (día / semana / mes) de producción, ingresos y costos.
+
+Cada tabla base tiene una tabla hermana public.rollup_<tabla> en PostgreSQL con
+una fila por (grano, periodo, dimensiones) y los acumulados SUM / COUNT / MIN / MAX
+de su medida. Se mantienen de forma incremental:
+- recalculando solo los periodos tocados por eventos de change_capture, y
+- refrescando periódicamente la ventana reciente (por si la captura está apagada).
+
+rewrite_query() reconoce agregados simples sobre una tabla base y los reescribe
+para leer del rollup del grano más grueso que sigue dando el mismo resultado.
+"""
+
+import re
+import time
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tabla base -> columna de fecha, medida y dimensiones que conserva el rollup
+ROLLUP_SPECS: Dict[str, Dict[str, Any]] = {
+    "public.farm_production": {"date": "date", "measure": "quantity_kg", "dims": ["crop_id"]},
+    "public.farm_income": {"date": "date", "measure": "amount", "dims": ["farm_id", "source"]},
+    "public.farm_cost": {"date": "date", "measure": "amount", "dims": ["farm_id", "category"]},
+}
+
+# Del más grueso al más fino: se elige el primero que responda la consulta
+GRAINS = ("month", "week", "day")
+
+# Granos de date_trunc solicitados -> granos de rollup que los pueden reconstruir
+COMPATIBLE_GRAINS = {
+    "day": {"day"},
+    "week": {"week", "day"},
+    "month": {"month", "day"},
+    "quarter": {"month", "day"},
+    "year": {"month", "day"},
+}
+
+SELECT_RE = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<table>[\w\.]+)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+ALIAS_RE = re.compile(r"^(?P<expr>.+?)\s+AS\s+(?P<alias>\"?\w+\"?)$", re.IGNORECASE | re.DOTALL)
+AGG_RE = re.compile(r"^(?P<fn>SUM|COUNT|AVG|MIN|MAX)\s*\(\s*(?P<arg>\*|\"?\w+\"?)\s*\)$", re.IGNORECASE)
+TRUNC_RE = re.compile(
+    r"^DATE_TRUNC\s*\(\s*'(?P<grain>\w+)'\s*,\s*\"?(?P<col>\w+)\"?\s*\)(?P<cast>\s*::\s*\w+)?$",
+    re.IGNORECASE
+)
+BOUND_RE = re.compile(
+    r"^\"?(?P<col>\w+)\"?\s*(?P<op>>=|<=|>|<)\s*(?P<value>'\d{4}-\d{2}-\d{2}'"
+    r"|DATE_TRUNC\s*\(\s*'\w+'\s*,\s*CURRENT_DATE\s*\))$",
+    re.IGNORECASE
+)
+EQ_RE = re.compile(r"^\"?(?P<col>\w+)\"?\s*=\s*(?P<value>-?\d+|'[^']*')$", re.IGNORECASE)
+IN_RE = re.compile(r"^\"?(?P<col>\w+)\"?\s+IN\s*\((?P<values>[^()]*)\)$", re.IGNORECASE)
+ORDER_ITEM_RE = re.compile(r"^(?P<expr>.+?)(?:\s+(?P<dir>ASC|DESC))?$", re.IGNORECASE | re.DOTALL)
+
+
+def rollup_table_name(table: str) -> str:
+    schema, name = table.split(".", 1)
+    return f"{schema}.rollup_{name}"
+
+
+def period_start(day: date, grain: str) -> date:
+    """Equivalente en Python a date_trunc(grain, day)::date"""
+    if grain == "month":
+        return day.replace(day=1)
+    if grain == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _is_aligned(day: date, grain: str) -> bool:
+    return period_start(day, grain) == day
+
+
+def _split_top_level(text: str, sep_re: str) -> List[str]:
+    """Separa por sep_re solo fuera de paréntesis y comillas"""
+    parts, depth, start, in_quote = [], 0, 0, False
+    pattern = re.compile(sep_re, re.IGNORECASE)
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "'":
+            in_quote = not in_quote
+        elif not in_quote and ch == "(":
+            depth += 1
+        elif not in_quote and ch == ")":
+            depth -= 1
+        elif not in_quote and depth == 0:
+            m = pattern.match(text, i)
+            if m:
+                parts.append(text[start:i].strip())
+                start = i = m.end()
+                continue
+        i += 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _norm(expr: str) -> str:
+    return re.sub(r"\s+", "", expr).replace('"', "").lower()
+
+
+def _bound_alignment(value: str, inclusive_upper: bool, exclusive_lower: bool) -> Tuple[Optional[str], Set[str]]:
+    """
+    Devuelve (literal equivalente sobre el periodo, granos donde el límite cae en
+    frontera de periodo). "<= D" y "> D" equivalen a "< D+1" y ">= D+1".
+    """
+    if value.startswith("'"):
+        day = date.fromisoformat(value.strip("'"))
+        if inclusive_upper or exclusive_lower:
+            day += timedelta(days=1)
+        return f"'{day.isoformat()}'", {g for g in GRAINS if _is_aligned(day, g)}
+
+    # date_trunc('<g>', CURRENT_DATE): alineado con los granos que lo dividen
+    if inclusive_upper or exclusive_lower:
+        return None, set()
+    grain = re.search(r"'(\w+)'", value).group(1).lower()
+    return value, COMPATIBLE_GRAINS.get(grain, set())
+
+
+def rewrite_query(sql: str) -> Optional[Dict[str, Any]]:
+    """
+    Reescribe un agregado simple sobre una tabla con rollup.
+    Retorna {"sql", "table", "rollup", "grain"} o None si no aplica.
+
+    Forma soportada:
+        SELECT [date_trunc('g', fecha) [AS a],] [dim [AS b],] AGG(medida|*) [AS c], ...
+        FROM tabla [WHERE dim = v AND fecha >= 'YYYY-MM-DD' AND ...]
+        [GROUP BY ...] [ORDER BY ...] [LIMIT n]
+    """
+    m = SELECT_RE.match(sql)
+    if not m:
+        return None
+    table = m.group("table").lower()
+    if "." not in table:
+        table = f"public.{table}"
+    spec = ROLLUP_SPECS.get(table)
+    if not spec:
+        return None
+    date_col, measure, dims = spec["date"], spec["measure"], spec["dims"]
+
+    candidates = set(GRAINS)
+    select_out: List[str] = []
+    group_exprs: Dict[str, str] = {}
+    has_agg = False
+
+    # ---------- SELECT ----------
+    for item in _split_top_level(m.group("select"), r","):
+        am = ALIAS_RE.match(item)
+        expr, alias = (am.group("expr").strip(), am.group("alias")) if am else (item, None)
+
+        agg = AGG_RE.match(expr)
+        trunc = TRUNC_RE.match(expr)
+        column = expr.strip('"').lower()
+
+        if agg:
+            fn, arg = agg.group("fn").upper(), agg.group("arg").strip('"').lower()
+            if arg not in ("*", measure) or (arg == "*" and fn != "COUNT"):
+                return None
+            new_expr = {
+                "SUM": "SUM(sum_value)",
+                "COUNT": "COALESCE(SUM(row_count), 0)::bigint" if arg == "*"
+                         else "COALESCE(SUM(value_count), 0)::bigint",
+                "AVG": "SUM(sum_value) / NULLIF(SUM(value_count), 0)",
+                "MIN": "MIN(min_value)",
+                "MAX": "MAX(max_value)",
+            }[fn]
+            select_out.append(f"{new_expr} AS {alias or fn.lower()}")
+            has_agg = True
+        elif trunc:
+            grain = trunc.group("grain").lower()
+            if trunc.group("col").lower() != date_col or grain not in COMPATIBLE_GRAINS:
+                return None
+            candidates &= COMPATIBLE_GRAINS[grain]
+            new_expr = f"date_trunc('{grain}', period){trunc.group('cast') or ''}"
+            group_exprs[_norm(expr)] = new_expr
+            select_out.append(f"{new_expr} AS {alias or 'date_trunc'}")
+        elif re.fullmatch(r"\w+", column) and column in dims:
+            group_exprs[_norm(expr)] = column
+            select_out.append(f"{column} AS {alias}" if alias else column)
+        else:
+            return None
+
+    if not has_agg:
+        return None
+
+    # ---------- WHERE ----------
+    where_out = []
+    if m.group("where"):
+        for cond in _split_top_level(m.group("where"), r"\s+AND\s+"):
+            bound, eq, inl = BOUND_RE.match(cond), EQ_RE.match(cond), IN_RE.match(cond)
+            if bound and bound.group("col").lower() == date_col:
+                op = bound.group("op")
+                literal, aligned = _bound_alignment(bound.group("value"), op == "<=", op == ">")
+                if literal is None:
+                    return None
+                candidates &= aligned
+                where_out.append(f"period {'>=' if op in ('>=', '>') else '<'} {literal}")
+            elif eq and eq.group("col").lower() in dims:
+                where_out.append(f"{eq.group('col').lower()} = {eq.group('value')}")
+            elif inl and inl.group("col").lower() in dims:
+                where_out.append(f"{inl.group('col').lower()} IN ({inl.group('values')})")
+            else:
+                return None
+
+    # ---------- GROUP BY ----------
+    select_items = _split_top_level(m.group("select"), r",")
+    group_out = []
+    if m.group("group"):
+        seen = set()
+        for g in _split_top_level(m.group("group"), r","):
+            if g.isdigit():
+                idx = int(g) - 1
+                if idx >= len(select_items):
+                    return None
+                am = ALIAS_RE.match(select_items[idx])
+                g = am.group("expr") if am else select_items[idx]
+            key = _norm(g)
+            if key not in group_exprs:
+                return None
+            seen.add(key)
+            group_out.append(group_exprs[key])
+        if seen != set(group_exprs):
+            return None
+    elif group_exprs:
+        return None
+
+    # ---------- ORDER BY ----------
+    order_out = []
+    if m.group("order"):
+        aliases = {}
+        for item in select_items:
+            am = ALIAS_RE.match(item)
+            if am:
+                aliases[am.group("alias").strip('"').lower()] = True
+        for item in _split_top_level(m.group("order"), r","):
+            om = ORDER_ITEM_RE.match(item)
+            expr, direction = om.group("expr").strip(), om.group("dir")
+            key = _norm(expr)
+            if expr.isdigit() or key in aliases:
+                new = expr
+            elif key in group_exprs:
+                new = group_exprs[key]
+            else:
+                return None
+            order_out.append(f"{new} {direction.upper()}" if direction else new)
+
+    grain = next((g for g in GRAINS if g in candidates), None)
+    if grain is None:
+        return None
+
+    conditions = [f"grain = '{grain}'"] + where_out
+    rewritten = (
+        f"SELECT {', '.join(select_out)} FROM {rollup_table_name(table)} "
+        f"WHERE {' AND '.join(conditions)}"
+    )
+    if group_out:
+        rewritten += f" GROUP BY {', '.join(group_out)}"
+    if order_out:
+        rewritten += f" ORDER BY {', '.join(order_out)}"
+    if m.group("limit"):
+        rewritten += f" LIMIT {m.group('limit')}"
+
+    return {"sql": rewritten, "table": table, "rollup": rollup_table_name(table), "grain": grain}
+
+
+class RollupManager:
+    """Crea, reconstruye y refresca incrementalmente las tablas de rollup"""
+
+    def __init__(
+        self,
+        connection_factory: Callable,
+        tables: Optional[List[str]] = None,
+        recent_days: int = 35,
+        max_staleness_seconds: float = 900
+    ):
+        self.connection_factory = connection_factory
+        self.specs = {t: s for t, s in ROLLUP_SPECS.items() if tables is None or t in tables}
+        self.recent_days = recent_days
+        self.max_staleness_seconds = max_staleness_seconds
+        self.refreshed_at: Dict[str, float] = {}
+        self.periods_refreshed = 0
+        self.rewrites = 0
+        self.last_error: Optional[str] = None
+        self._pending_full: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- SQL ----------
+    def _ddl(self, table: str) -> List[str]:
+        spec = self.specs[table]
+        rollup = rollup_table_name(table)
+        dims = "".join(f", {d} {'bigint' if d.endswith('_id') else 'text'}" for d in spec["dims"])
+        short = rollup.split(".", 1)[1]
+        return [
+            f"CREATE TABLE IF NOT EXISTS {rollup} ("
+            f"grain text NOT NULL, period date{dims}, "
+            f"sum_value numeric, value_count bigint NOT NULL, row_count bigint NOT NULL, "
+            f"min_value numeric, max_value numeric, refreshed_at timestamptz NOT NULL DEFAULT now())",
+            f"CREATE INDEX IF NOT EXISTS {short}_grain_period_idx ON {rollup} (grain, period)",
+        ]
+
+    def _insert_sql(self, table: str, where: str) -> str:
+        spec = self.specs[table]
+        dims = ", ".join(spec["dims"])
+        col, measure = f'"{spec["date"]}"', f'"{spec["measure"]}"'
+        return (
+            f"INSERT INTO {rollup_table_name(table)} "
+            f"(grain, period, {dims}, sum_value, value_count, row_count, min_value, max_value) "
+            f"SELECT %(grain)s, date_trunc(%(grain)s, {col})::date, {dims}, "
+            f"SUM({measure}), COUNT({measure}), COUNT(*), MIN({measure}), MAX({measure}) "
+            f"FROM {table} WHERE {where} GROUP BY 2, {dims}"
+        )
+
+    # ---------- Mantenimiento ----------
+    def ensure_tables(self):
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                for table in self.specs:
+                    for stmt in self._ddl(table):
+                        cur.execute(stmt)
+                    cur.execute(f"SELECT 1 FROM {rollup_table_name(table)} LIMIT 1")
+                    if cur.fetchone() is None:
+                        self._pending_full.add(table)
+            conn.commit()
+
+    def rebuild(self, table: str):
+        """Reconstrucción completa de un rollup en una sola transacción"""
+        with self._lock, self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {rollup_table_name(table)}")
+                for grain in GRAINS:
+                    cur.execute(self._insert_sql(table, "TRUE"), {"grain": grain})
+            conn.commit()
+        self.refreshed_at[table] = time.time()
+        self._pending_full.discard(table)
+        logger.info(f"📊 Rollup reconstruido: {rollup_table_name(table)}")
+
+    def refresh_periods(self, table: str, days: Set[Optional[date]]):
+        """Recalcula solo los periodos que contienen las fechas dadas (None = filas sin fecha)"""
+        col = f'"{self.specs[table]["date"]}"'
+        include_null = None in days
+        real_days = [d for d in days if d is not None]
+        with self._lock, self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                for grain in GRAINS:
+                    periods = sorted({period_start(d, grain) for d in real_days})
+                    params = {"grain": grain, "periods": periods, "include_null": include_null}
+                    cur.execute(
+                        f"DELETE FROM {rollup_table_name(table)} WHERE grain = %(grain)s "
+                        f"AND (period = ANY(%(periods)s::date[]) OR (%(include_null)s AND period IS NULL))",
+                        params
+                    )
+                    cur.execute(
+                        self._insert_sql(
+                            table,
+                            f"(date_trunc(%(grain)s, {col})::date = ANY(%(periods)s::date[]) "
+                            f"OR (%(include_null)s AND {col} IS NULL))"
+                        ),
+                        params
+                    )
+                    self.periods_refreshed += len(periods) + (1 if include_null else 0)
+            conn.commit()
+
+    def refresh_recent(self, table: str):
+        """Recalcula los periodos que se solapan con los últimos recent_days días"""
+        since = date.today() - timedelta(days=self.recent_days)
+        self.refresh_periods(table, {since + timedelta(days=i) for i in range(self.recent_days + 1)})
+        self.refreshed_at[table] = time.time()
+
+    def apply_change_event(self, event: Dict[str, Any]):
+        """
+        Suscriptor de change_capture: recalcula los periodos tocados por el evento
+        (en un UPDATE, también los de la fila anterior: cambiar la fecha mueve la fila de periodo)
+        """
+        table = event.get("table")
+        if table not in self.specs:
+            return
+        if event.get("kind") == "checkpoint":
+            if table not in self._pending_full:
+                self.refreshed_at[table] = event.get("at", time.time())
+            return
+        rows = event.get("rows") or []
+        if not rows:
+            # Cambio sin fila (payload NOTIFY recortado): no sabemos qué periodo tocó
+            self._pending_full.add(table)
+            self.refreshed_at.pop(table, None)
+            return
+        col = self.specs[table]["date"]
+        try:
+            days: Set[Optional[date]] = set()
+            for row in rows + (event.get("old_rows") or []):
+                value = row.get(col)
+                days.add(date.fromisoformat(str(value)[:10]) if value else None)
+            self.refresh_periods(table, days)
+        except Exception as e:
+            # publish() se traga el error y el checkpoint siguiente la daría por fresca:
+            # la tabla queda pendiente de reconstrucción completa (tick) y no se sirve mientras tanto
+            self._pending_full.add(table)
+            self.refreshed_at.pop(table, None)
+            self.last_error = str(e)
+            logger.warning(f"⚠️ Rollup de {table} no se pudo actualizar con el cambio, se reconstruirá: {e}")
+
+    def tick(self):
+        for table in list(self.specs):
+            if table in self._pending_full:
+                self.rebuild(table)
+            else:
+                self.refresh_recent(table)
+
+    def start(self, interval_seconds: float):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.tick()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Refresco de rollups falló: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="rollup-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- Consulta ----------
+    def freshness(self, table: str) -> Optional[float]:
+        if table in self._pending_full or table not in self.refreshed_at:
+            return None
+        return time.time() - self.refreshed_at[table]
+
+    def rewrite(self, sql: str) -> Optional[Dict[str, Any]]:
+        """rewrite_query() limitado a rollups existentes y suficientemente frescos"""
+        result = rewrite_query(sql)
+        if not result or result["table"] not in self.specs:
+            return None
+        age = self.freshness(result["table"])
+        if age is None or age > self.max_staleness_seconds:
+            return None
+        self.rewrites += 1
+        result["freshness_seconds"] = age
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "tables": {
+                rollup_table_name(t): {
+                    "freshness_seconds": round(f, 1) if (f := self.freshness(t)) is not None else None,
+                    "pending_rebuild": t in self._pending_full,
+                }
+                for t in sorted(self.specs)
+            },
+            "periods_refreshed": self.periods_refreshed,
+            "rewrites": self.rewrites,
+            "last_error": self.last_error,
+        }
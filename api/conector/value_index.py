@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de valores de columnas de texto de baja cardinalidad.
+
+Preguntas como "producción de café en la finca La Esperanza" necesitan filtros
+literales que ni el motor de reglas ni el conector conocen. Este índice guarda
+los valores existentes de columnas como farm_crop.name, farm_farm.name,
+commerce_buyer.name o farm_cost.category para:
+- reconocerlos en la pregunta (exacto tras normalizar acentos, o aproximado
+  por trigramas: "cafe" -> "Café", "la esperansa" -> "La Esperanza"), y
+- añadir el filtro al SQL generado sin otra llamada a SQLCoder.
+
+Construcción (build):
+1. pg_stats da n_distinct de cada columna de texto del catálogo; se conservan
+   las que tienen como mucho max_distinct valores (más las de `columns`).
+2. SELECT DISTINCT trae los valores de esas columnas. Si una columna supera el
+   límite (estadísticas viejas), se queda con most_common_vals de pg_stats.
+
+Si el filtro está en otra tabla, se llega a ella por claves foráneas (del
+catálogo, o por convención <x>_id -> <esquema>.<app>_<x>):
+    crop_id IN (SELECT id FROM public.farm_crop WHERE name IN ('Café'))
+"""
+
+import re
+import time
+import logging
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from catalog_artifact import trigrams
+
+logger = logging.getLogger(__name__)
+
+# Columnas que siempre se indexan (aunque pg_stats no tenga estadísticas)
+DEFAULT_VALUE_COLUMNS = [
+    "public.farm_crop.name",
+    "public.farm_farm.name",
+    "public.commerce_buyer.name",
+    "public.farm_cost.category",
+]
+
+TEXT_TYPES = {"text", "character varying", "varchar", "character", "char", "citext"}
+# Columnas de texto que nunca se indexan (datos personales o sin valor como filtro)
+EXCLUDED_COLUMN_RE = re.compile(r"(?i)(password|passwd|token|secret|hash|email|phone|telefono|address|direccion)")
+
+# Palabras que no bastan por sí solas como valor ("la", "de", ...)
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "en", "y", "o", "por", "para", "con", "un", "una",
+    "the", "of", "in", "and", "or", "for", "with", "a", "an", "total", "todos", "todas",
+}
+
+PG_STATS_SQL = """
+    SELECT s.schemaname, s.tablename, s.attname, s.n_distinct,
+           s.most_common_vals::text::text[] AS most_common_vals,
+           c.reltuples::bigint AS reltuples
+    FROM pg_stats s
+    JOIN pg_namespace n ON n.nspname = s.schemaname
+    JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+    WHERE s.schemaname || '.' || s.tablename = ANY(%s)
+"""
+
+
+def normalize_value(text: str) -> str:
+    """Minúsculas, sin acentos y con separadores simples: 'Café  Orgánico' -> 'cafe organico'"""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def quote_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def estimated_distinct(n_distinct: Optional[float], reltuples: Optional[int]) -> Optional[float]:
+    """n_distinct de pg_stats en número de valores (negativo = fracción de las filas)"""
+    if n_distinct is None:
+        return None
+    if n_distinct >= 0:
+        return n_distinct
+    if reltuples is None or reltuples < 0:
+        return None
+    return -n_distinct * reltuples
+
+
+# ====== GRAFO DE CLAVES FORÁNEAS ======
+def reference_graph(columns: Dict[str, List[str]], stats: Dict[str, Dict[str, Any]]) -> Dict[str, List[Tuple[str, str, str]]]:
+    """
+    tabla -> [(columna, tabla referenciada, columna referenciada)].
+    Usa foreign_keys del catálogo (gen_schema.py); sin ellas, la convención
+    <x>_id -> tabla del mismo esquema llamada <x> o <app>_<x> con columna id.
+    """
+    graph: Dict[str, List[Tuple[str, str, str]]] = {}
+    for table, cols in columns.items():
+        schema = table.split(".", 1)[0]
+        edges: List[Tuple[str, str, str]] = []
+        for fk in (stats.get(table, {}).get("foreign_keys") or []):
+            ref = fk.get("references", {})
+            if len(fk.get("columns", [])) == 1 and len(ref.get("columns", [])) == 1:
+                ref_table = f"{ref.get('schema') or schema}.{ref.get('table')}".lower()
+                edges.append((fk["columns"][0], ref_table, ref["columns"][0]))
+        if not edges:
+            for col in cols:
+                if not col.lower().endswith("_id"):
+                    continue
+                stem = col.lower()[:-3]
+                candidates = [
+                    t for t, tcols in columns.items()
+                    if t.startswith(f"{schema}.") and "id" in [c.lower() for c in tcols]
+                    and (t.split(".", 1)[1] == stem or t.split(".", 1)[1].endswith(f"_{stem}"))
+                ]
+                if len(candidates) == 1:
+                    edges.append((col, candidates[0], "id"))
+        if edges:
+            graph[table] = edges
+    return graph
+
+
+def reference_path(graph: Dict[str, List[Tuple[str, str, str]]], start: str, target: str,
+                   max_hops: int = 2) -> Optional[List[Tuple[str, str, str]]]:
+    """Camino más corto de aristas FK desde `start` hasta `target` (None si no hay en max_hops)"""
+    frontier: List[Tuple[str, List[Tuple[str, str, str]]]] = [(start, [])]
+    seen = {start}
+    for _ in range(max_hops):
+        nxt = []
+        for table, path in frontier:
+            for edge in graph.get(table, []):
+                if edge[1] == target:
+                    return path + [edge]
+                if edge[1] not in seen:
+                    seen.add(edge[1])
+                    nxt.append((edge[1], path + [edge]))
+        frontier = nxt
+    return None
+
+
+# ====== REESCRITURA DEL SQL ======
+SIMPLE_SELECT_RE = re.compile(r"(?is)^\s*SELECT\b.+?\bFROM\s+[\w\.\"]+(?:\s+(?:AS\s+)?(?!WHERE|GROUP|ORDER|LIMIT|HAVING|OFFSET)\w+)?\b")
+CLAUSE_TAIL_RE = re.compile(r"(?i)\b(GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|OFFSET)\b")
+QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+def mask_quoted(sql: str) -> Optional[str]:
+    """
+    Copia del SQL con el contenido de literales e identificadores entre comillas
+    sustituido por espacios (misma longitud, mismas posiciones), para que
+    `LIKE '%order by%'` no se tome por una cláusula. None si hay comillas sin cerrar.
+    """
+    masked = QUOTED_RE.sub(lambda m: m.group(0)[0] + " " * (len(m.group(0)) - 2) + m.group(0)[0], sql)
+    unquoted = QUOTED_RE.sub("", masked)
+    if "'" in unquoted or '"' in unquoted:
+        return None
+    return masked
+
+
+def add_where_conditions(sql: str, conditions: List[str]) -> Optional[str]:
+    """
+    Añade condiciones (AND) a un SELECT simple de una sola tabla.
+    None si el SQL no es de esa forma (JOIN, subconsultas, UNION...): mejor no filtrar que romperlo.
+    """
+    if not conditions:
+        return sql
+    body = sql.strip().rstrip(";").strip()
+    # Las cláusulas se buscan en la versión enmascarada; los cortes se aplican al SQL original
+    masked = mask_quoted(body)
+    if masked is None:
+        return None
+    if re.search(r"(?i)\b(JOIN|UNION|INTERSECT|EXCEPT|WITH)\b|\(\s*SELECT\b", masked):
+        return None
+    head = SIMPLE_SELECT_RE.match(masked)
+    if not head:
+        return None
+    start = head.end()
+    cond = " AND ".join(conditions)
+    where = re.match(r"(?is)\s*WHERE\b", masked[start:])
+    if where:
+        start += where.end()
+        tail = CLAUSE_TAIL_RE.search(masked, start)
+        existing = body[start:tail.start() if tail else len(body)].strip()
+        after = body[tail.start():] if tail else ""
+        return f"{body[:head.end()]} WHERE ({existing}) AND {cond}" + (f" {after.strip()}" if after else "")
+    rest = body[start:]
+    tail = CLAUSE_TAIL_RE.search(masked, start)
+    if tail and body[start:tail.start()].strip():
+        return None
+    after = body[tail.start():].strip() if tail else rest.strip()
+    if after and not tail:
+        return None
+    return f"{body[:head.end()]} WHERE {cond}" + (f" {after}" if after else "")
+
+
+class ValueIndex:
+    """Valores conocidos por (tabla, columna) con búsqueda exacta y aproximada"""
+
+    def __init__(self, connect: Callable, catalog: Callable[[], Dict[str, Any]],
+                 columns: Optional[List[str]] = None, max_distinct: int = 2000,
+                 threshold: float = 0.6, max_words: int = 4):
+        self.connect = connect                # get_db_connection del conector
+        self.catalog = catalog                # () -> catálogo compilado (columns, stats)
+        self.columns = [c.lower() for c in (columns if columns is not None else DEFAULT_VALUE_COLUMNS)]
+        self.max_distinct = max_distinct
+        self.threshold = threshold
+        self.max_words = max_words
+        self._values: Dict[Tuple[str, str], List[str]] = {}
+        self._exact: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._trigrams: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._graph: Tuple[Optional[int], Dict[str, List[Tuple[str, str, str]]]] = (None, {})
+        self.built_at: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # ---------- Construcción ----------
+    def candidate_columns(self, stats_rows: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """(tabla, columna) a indexar: texto de baja cardinalidad según pg_stats, más las fijas"""
+        catalog = self.catalog()
+        data_types: Dict[Tuple[str, str], str] = {}
+        for db in catalog.get("data", {}).get("databases", []):
+            for sch in db.get("schemas", []):
+                for t in sch.get("tables", []):
+                    for c in t.get("columns", []):
+                        key = (f"{sch.get('name') or 'public'}.{t.get('name')}".lower(), (c.get("name") or "").lower())
+                        data_types[key] = (c.get("type") or "").lower()
+
+        chosen: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for full in self.columns:
+            table, _, col = full.rpartition(".")
+            if table in catalog.get("allowed", ()):
+                chosen[(table, col)] = {"estimate": None, "most_common": []}
+        for s in stats_rows:
+            key = (f"{s['schemaname']}.{s['tablename']}".lower(), s["attname"].lower())
+            if data_types.get(key) not in TEXT_TYPES or EXCLUDED_COLUMN_RE.search(key[1]):
+                continue
+            estimate = estimated_distinct(s["n_distinct"], s["reltuples"])
+            info = {"estimate": estimate, "most_common": list(s["most_common_vals"] or [])}
+            if key in chosen:
+                chosen[key] = info
+            elif estimate is not None and 0 < estimate <= self.max_distinct:
+                chosen[key] = info
+        return chosen
+
+    def build(self):
+        """Lee pg_stats y los valores distintos; reemplaza el índice de una vez al final"""
+        start = time.time()
+        tables = sorted(self.catalog().get("allowed", ()))
+        values: Dict[Tuple[str, str], List[str]] = {}
+        with self.connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(PG_STATS_SQL, (tables,))
+                names = [d.name for d in cur.description]
+                stats_rows = [dict(zip(names, r)) for r in cur.fetchall()]
+            for (table, col), info in self.candidate_columns(stats_rows).items():
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            f'SELECT DISTINCT "{col}" FROM {table} WHERE "{col}" IS NOT NULL LIMIT %s',
+                            (self.max_distinct + 1,)
+                        )
+                        found = [r[0] for r in cur.fetchall()]
+                except Exception as e:
+                    conn.rollback()
+                    logger.warning(f"⚠️ No se pudieron leer valores de {table}.{col}: {e}")
+                    continue
+                if len(found) > self.max_distinct:
+                    # Más valores de los esperados: solo los frecuentes según pg_stats
+                    found = info["most_common"]
+                if found:
+                    values[(table, col)] = sorted({str(v) for v in found if str(v).strip()})
+        self._install(values)
+        self.build_seconds = time.time() - start
+        logger.info(
+            f"🔤 Índice de valores: {sum(len(v) for v in values.values())} valores "
+            f"en {len(values)} columnas ({self.build_seconds:.2f}s)"
+        )
+
+    def _install(self, values: Dict[Tuple[str, str], List[str]]):
+        exact: Dict[str, List[Tuple[str, str, str]]] = {}
+        grams: Dict[str, List[str]] = {}
+        for (table, col), vals in values.items():
+            for v in vals:
+                norm = normalize_value(v)
+                if len(norm) < 3 or norm in STOPWORDS:
+                    continue
+                if norm not in exact:
+                    for tri in trigrams(norm):
+                        grams.setdefault(tri, []).append(norm)
+                exact.setdefault(norm, []).append((table, col, v))
+        with self._lock:
+            self._values, self._exact, self._trigrams = values, exact, grams
+            self.built_at = time.time()
+
+    def start(self, interval_seconds: float):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.build()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Construcción del índice de valores falló: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="value-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- Búsqueda ----------
+    def lookup(self, text: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Valores parecidos a `text` (similitud de trigramas, 1.0 = igual tras normalizar)"""
+        norm = normalize_value(text)
+        if not norm:
+            return []
+        with self._lock:
+            exact, grams = self._exact, self._trigrams
+        scored: List[Tuple[float, str]] = []
+        if norm in exact:
+            scored.append((1.0, norm))
+        q = trigrams(norm)
+        shared: Dict[str, int] = {}
+        for tri in q:
+            for cand in grams.get(tri, ()):
+                shared[cand] = shared.get(cand, 0) + 1
+        for cand, n in shared.items():
+            if cand == norm:
+                continue
+            score = n / (len(q) + len(trigrams(cand)) - n)
+            if score >= self.threshold:
+                scored.append((score, cand))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [
+            {"table": t, "column": c, "value": v, "score": round(score, 3)}
+            for score, cand in scored[:limit]
+            for t, c, v in exact[cand]
+        ]
+
+    def match_question(self, question: str) -> List[Dict[str, Any]]:
+        """
+        Valores mencionados en la pregunta. Evalúa frases de hasta max_words
+        palabras y se queda con las de mejor similitud (a igualdad, las más
+        largas) sin solapar: "café en" no le gana a "café" exacto.
+        """
+        words = normalize_value(question).split()
+        candidates: List[Tuple[float, int, int, List[Dict[str, Any]]]] = []
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for i in range(len(words) - size + 1):
+                phrase = " ".join(words[i:i + size])
+                if len(phrase) < 3 or all(w in STOPWORDS for w in words[i:i + size]):
+                    continue
+                hits = self.lookup(phrase, limit=10)
+                if hits:
+                    # Solo los mejores (el mismo valor puede existir en varias columnas)
+                    best = [{**h, "text": phrase} for h in hits if h["score"] == hits[0]["score"]]
+                    candidates.append((hits[0]["score"], size, i, best))
+
+        used = [False] * len(words)
+        found: List[Dict[str, Any]] = []
+        for score, size, i, best in sorted(candidates, key=lambda c: (-c[0], -c[1], c[2])):
+            if any(used[i:i + size]):
+                continue
+            used[i:i + size] = [True] * size
+            found.extend(best)
+        return found
+
+    # ---------- Filtros ----------
+    def graph(self) -> Dict[str, List[Tuple[str, str, str]]]:
+        """Grafo de claves foráneas, recalculado solo si cambia el catálogo"""
+        catalog = self.catalog()
+        if self._graph[0] != id(catalog):
+            self._graph = (id(catalog), reference_graph(catalog.get("columns", {}), catalog.get("stats", {})))
+        return self._graph[1]
+
+    def filters_for(self, question: str, table: str, sql: str = "") -> Tuple[List[str], Set[str], List[Dict[str, Any]]]:
+        """
+        Condiciones WHERE para `table` a partir de los valores de la pregunta.
+        Devuelve (condiciones, tablas extra que usan las subconsultas, coincidencias aplicadas).
+        Se omiten valores que el SQL ya menciona.
+        """
+        graph = self.graph()
+        sql_norm = normalize_value(sql)
+        grouped: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for m in self.match_question(question):
+            if normalize_value(m["value"]) in sql_norm:
+                continue
+            grouped.setdefault((m["table"], m["column"]), []).append(m)
+
+        conditions: List[str] = []
+        extra_tables: Set[str] = set()
+        applied: List[Dict[str, Any]] = []
+        for (vtable, col), matches in grouped.items():
+            literals = ", ".join(quote_literal(v) for v in sorted({m["value"] for m in matches}))
+            cond = f"{col} IN ({literals})"
+            if vtable != table:
+                path = reference_path(graph, table, vtable)
+                if path is None:
+                    continue
+                # De la tabla del valor hacia atrás: ref_col IN (SELECT ... WHERE cond)
+                for i in range(len(path) - 1, -1, -1):
+                    fk_col, ref_table, ref_col = path[i]
+                    cond = f"{fk_col} IN (SELECT {ref_col} FROM {ref_table} WHERE {cond})"
+                    extra_tables.add(ref_table)
+            conditions.append(cond)
+            applied.extend(matches)
+        return conditions, extra_tables, applied
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            values = self._values
+        return {
+            "enabled": True,
+            "columns": {f"{t}.{c}": len(v) for (t, c), v in sorted(values.items())},
+            "values": sum(len(v) for v in values.values()),
+            "built_seconds_ago": round(time.time() - self.built_at, 1) if self.built_at else None,
+            "build_seconds": round(self.build_seconds, 2) if self.build_seconds is not None else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks de la validación/corrección de SQL del conector"""
+
+import pytest
+
+from synthetic import CATALOG_SIZES, synthetic_tables
+
+MISSPELLED = {"public.farm_crops", "public.invoices", "public.comerce_buyer", "public.farm_productions"}
+
+
+@pytest.fixture(scope="module", params=CATALOG_SIZES, ids=lambda n: f"{n}_tables")
+def catalog(request):
+    return set(synthetic_tables(request.param))
+
+
+def _messy_sql(catalog) -> str:
+    """JOIN de tres tablas del catálogo con espacios alrededor de los puntos"""
+    names = sorted(catalog)
+    a, b, c = names[0], names[len(names) // 2], names[-1]
+    sa, ta = a.split(".")
+    sb, tb = b.split(".")
+    sc, tc = c.split(".")
+    return (
+        f"SELECT x.id, y.id, COUNT(*) FROM {sa} . {ta} x "
+        f"JOIN {sb} .{tb} y ON y.id = x.id "
+        f"LEFT JOIN {sc}. {tc} z ON z.id = y.id "
+        f"WHERE x.id > 10 GROUP BY x.id, y.id ORDER BY 3 DESC LIMIT 50"
+    )
+
+
+def bench_normalize_schema_dots(benchmark, connector, catalog):
+    benchmark(connector["normalize_schema_dots"], _messy_sql(catalog))
+
+
+def bench_tables_in_sql(benchmark, connector, catalog):
+    sql = connector["normalize_schema_dots"](_messy_sql(catalog))
+    benchmark(connector["tables_in_sql"], sql)
+
+
+def bench_suggest_replacements(benchmark, connector, catalog):
+    used = MISSPELLED | {sorted(catalog)[0]}
+    benchmark(connector["suggest_replacements"], used, catalog)
+
+
+def bench_apply_table_replacements(benchmark, connector, catalog):
+    replacements = connector["suggest_replacements"](MISSPELLED, catalog)
+    sql = " UNION ALL ".join(f"SELECT COUNT(*) FROM {t}" for t in sorted(MISSPELLED))
+    benchmark(connector["apply_table_replacements"], sql, replacements)
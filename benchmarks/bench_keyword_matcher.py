@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks del autómata de palabras clave compartido (common/keyword_matcher.py)"""
+
+import pytest
+
+QUESTIONS = {
+    "short": "¿cuántas facturas hay?",
+    "miss": "dame un resumen general",
+    "long": "por favor, muéstrame el total de ingresos por mes de las fincas con cultivos de café "
+            "y compara con los costos de herramientas y los pagos a trabajadores del último año",
+}
+
+
+@pytest.mark.parametrize("question", QUESTIONS.values(), ids=QUESTIONS.keys())
+def bench_keyword_match(benchmark, keyword_matcher, question):
+    # Sin memoizar: una pasada del autómata sobre todos los espacios de nombres
+    benchmark(keyword_matcher["MATCHER"].match, question)
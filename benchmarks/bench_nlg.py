@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks de la redacción de respuestas (app_gpt_maria.nlg_answer)"""
+
+import pytest
+
+CASES = {
+    "count": ("¿Cuántos compradores hay?", "SELECT COUNT(*) AS total FROM public.commerce_buyer", 1),
+    "list_10": ("muestra 10 compradores", "SELECT id, name, email FROM public.commerce_buyer LIMIT 10", 10),
+    "table_1000": ("ingresos por finca", "SELECT id, farm_id, amount FROM public.farm_income", 1000),
+}
+
+
+def _rows(n: int):
+    if n == 1:
+        return [{"total": 42}]
+    return [{"id": i, "name": f"Comprador {i}", "email": f"c{i}@example.com", "farm_id": i % 7,
+             "amount": round(i * 13.7, 2)} for i in range(n)]
+
+
+@pytest.mark.parametrize("case", CASES.values(), ids=CASES.keys())
+def bench_nlg_answer(benchmark, nlg, case):
+    question, sql, n = case
+    rows = _rows(n)
+    columns = list(rows[0].keys())
+    benchmark(nlg["nlg_answer"], question, sql, columns, rows)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks del motor de reglas de SQLCoder"""
+
+import os
+import tempfile
+
+import pytest
+
+from synthetic import CATALOG_SIZES, MEMORY_SIZES, render_schema_text, synthetic_memory, synthetic_tables
+
+QUESTIONS = {
+    "keyword_hit": "¿cuántas facturas hay?",
+    "keyword_miss": "dame un resumen general",
+}
+ROUNDS = 200
+
+
+@pytest.fixture(scope="module", params=CATALOG_SIZES, ids=lambda n: f"{n}_tables")
+def tables(request):
+    return synthetic_tables(request.param)
+
+
+@pytest.fixture(scope="module", params=MEMORY_SIZES, ids=lambda n: f"{n}_entries")
+def memory(request, sqlcoder):
+    path = os.path.join(tempfile.mkdtemp(prefix="microbench_memory_"), "memory.json")
+    mem = sqlcoder["SQLMemory"](path)
+    mem.memory = synthetic_memory(request.param)
+    return mem
+
+
+@pytest.fixture(scope="module", params=MEMORY_SIZES, ids=lambda n: f"{n}_entries")
+def sqlite_memory(request, sqlcoder):
+    path = os.path.join(tempfile.mkdtemp(prefix="microbench_memory_"), "memory.sqlite")
+    mem = sqlcoder["SQLiteMemory"](path, max_entries=request.param)
+    mem.import_entries(synthetic_memory(request.param)["successful_queries"])
+    return mem
+
+
+@pytest.fixture(scope="module", params=MEMORY_SIZES, ids=lambda n: f"{n}_entries")
+def ngram_index(request, sqlcoder):
+    pytest.importorskip("scipy")
+    index = sqlcoder["NgramIndex"]()
+    index.add_many((e["question"], e["original"]) for e in synthetic_memory(request.param)["successful_queries"])
+    return index
+
+
+def bench_parse_schema(benchmark, sqlcoder, tables):
+    benchmark(sqlcoder["parse_schema"], render_schema_text(tables))
+
+
+@pytest.mark.parametrize("by_fingerprint", [False, True], ids=["schema_text", "fingerprint"])
+def bench_schema_cache_hit(benchmark, sqlcoder, tables, by_fingerprint):
+    cache = sqlcoder["SchemaCache"]()
+    schema_text = render_schema_text(tables)
+    _, fingerprint, _ = cache.resolve(schema_text, None)
+    if by_fingerprint:
+        benchmark(cache.resolve, None, fingerprint)
+    else:
+        benchmark(cache.resolve, schema_text, None)
+
+
+@pytest.mark.parametrize("question", QUESTIONS.values(), ids=QUESTIONS.keys())
+def bench_find_table(benchmark, sqlcoder, tables, question):
+    # match_question está memoizado: se vacía antes de cada ronda para medir la pregunta nueva
+    benchmark.pedantic(sqlcoder["find_table"], args=(question, list(tables)),
+                       setup=sqlcoder["match_question"].cache_clear, rounds=ROUNDS)
+
+
+@pytest.mark.parametrize("question", QUESTIONS.values(), ids=QUESTIONS.keys())
+def bench_generate_sql(benchmark, sqlcoder, tables, question):
+    benchmark.pedantic(sqlcoder["generate_sql"], args=(question, tables),
+                       setup=sqlcoder["match_question"].cache_clear, rounds=ROUNDS)
+
+
+def bench_memory_get_similar_hit(benchmark, memory):
+    benchmark(memory.get_similar, memory.memory["successful_queries"][-1]["original"])
+
+
+def bench_memory_get_similar_miss(benchmark, memory):
+    benchmark(memory.get_similar, "pregunta que no está en la memoria")
+
+
+def bench_sqlite_memory_get_similar_hit(benchmark, sqlite_memory):
+    question = synthetic_memory(1)["successful_queries"][0]["original"]
+    benchmark(sqlite_memory.get_similar, question)
+
+
+def bench_sqlite_memory_get_similar_miss(benchmark, sqlite_memory):
+    benchmark(sqlite_memory.get_similar, "pregunta que no está en la memoria")
+
+
+def bench_similarity_top_k(benchmark, ngram_index):
+    # Casi duplicado de una pregunta de la memoria sintética
+    benchmark(ngram_index.top_k, "cuantos registros de crop hay", 5, 0.3)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Fixtures compartidas: módulos del repo cargados una sola vez por sesión"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+_TMP = tempfile.mkdtemp(prefix="microbench_")
+
+
+@pytest.fixture(scope="session")
+def connector():
+    return harness.load_module(harness.CONECTOR_DIR, "app_connector.py", {
+        "SCHEMA_PATH": harness.SCHEMA_PATH,
+        "QUESTION_HISTORY_PATH": os.path.join(_TMP, "question_history.json"),
+    })
+
+
+@pytest.fixture(scope="session")
+def sqlcoder():
+    return harness.load_module(harness.SQLCODER_DIR, "app_sqlcoder.py", {
+        "MEMORY_FILE": os.path.join(_TMP, "memory.json"),
+    })
+
+
+@pytest.fixture(scope="session")
+def nlg():
+    return harness.load_module(harness.NLG_DIR, "app_gpt_maria.py")
+
+
+@pytest.fixture(scope="session")
+def keyword_matcher():
+    return harness.load_module(harness.COMMON_DIR, "keyword_matcher.py")
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark end-to-end reproducible del conector.
+
+Levanta en el mismo proceso:
+- SQLCoder (motor de reglas real) y NLG (app_gpt real) con latencia inyectada
+  para simular el tiempo de inferencia de los modelos,
+- el conector apuntando a una PostgreSQL local cargada desde data/,
+y reproduce un corpus de preguntas a niveles fijos de concurrencia.
+
+Uso:
+    python benchmarks/e2e_bench.py --load --concurrency 1,4,16 --requests 200 \\
+        --sqlcoder-latency-ms 40 --nlg-latency-ms 80 --output bench_results/e2e.json
+
+El JSON resultante (p50/p95/p99, throughput y desglose por etapa usando
+timings_ms de /ask) se puede comparar entre commits.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+from question_corpus import score  # noqa: E402
+
+DEFAULT_QUESTIONS = [
+    "¿Cuántos usuarios hay?",
+    "¿Cuántos compradores hay registrados?",
+    "¿Cuál es el total de ingresos?",
+    "¿Cuál es el total de costos?",
+    "producción total por mes",
+    "ingresos totales por mes",
+    "¿Cuál es el promedio de producción?",
+    "muestra los primeros 5 compradores",
+    "lista las facturas",
+    "dame 10 cultivos",
+    "muestra los últimos costos",
+    "¿Cuántas fincas hay?",
+    "¿Cuántos trabajadores hay?",
+    "total de deudas de trabajadores",
+    "muestra los precios de mercado",
+]
+
+STAGES = ("sqlcoder", "database", "nlg")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    Corpus de preguntas: .txt (una por línea), .json (lista) o .jsonl (campo question).
+    Las entradas con expected_table/intent (question_corpus.py) se puntúan por exactitud.
+    """
+    if not path:
+        return [{"question": q} for q in DEFAULT_QUESTIONS]
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(l) for l in f if l.strip()]
+        if path.endswith(".json"):
+            return [q if isinstance(q, dict) else {"question": q} for q in json.load(f)]
+        return [{"question": l.strip()} for l in f if l.strip() and not l.startswith("#")]
+
+
+def start_services(args, tmpdir: str) -> Dict[str, harness.ServerThread]:
+    """SQLCoder y NLG reales con latencia inyectada, y el conector apuntando a ellos"""
+    sqlcoder_app = harness.load_app(
+        harness.SQLCODER_DIR, "app_sqlcoder.py",
+        {"MEMORY_FILE": os.path.join(tmpdir, "memory.json")}
+    )
+    harness.add_latency(sqlcoder_app, args.sqlcoder_latency_ms, ("/generate_sql",))
+    sqlcoder = harness.ServerThread(sqlcoder_app, harness.free_port(), "bench-sqlcoder").start()
+
+    nlg_app = harness.load_app(harness.NLG_DIR, "app_gpt.py")
+    harness.add_latency(nlg_app, args.nlg_latency_ms, ("/refine",))
+    nlg = harness.ServerThread(nlg_app, harness.free_port(), "bench-nlg").start()
+
+    env = {
+        **harness.pg_settings(args),
+        "SCHEMA_PATH": harness.SCHEMA_PATH,
+        "SQLCODER_URL": f"{sqlcoder.url}/generate_sql",
+        "NLG_URL": f"{nlg.url}/refine",
+        "QUESTION_HISTORY_PATH": os.path.join(tmpdir, "question_history.json"),
+        "CDC_STATE_PATH": os.path.join(tmpdir, "cdc_state.json"),
+        "REPLICA_PATH": os.path.join(tmpdir, "replica.sqlite"),
+        "WARMUP_ENABLED": "false",
+    }
+    # Las funciones opcionales (réplica, rollups, CDC...) se activan desde el entorno del benchmark
+    connector_app = harness.load_app(harness.CONECTOR_DIR, "app_connector.py", env)
+    connector = harness.ServerThread(connector_app, harness.free_port(), "bench-connector").start()
+    return {"sqlcoder": sqlcoder, "nlg": nlg, "connector": connector}
+
+
+def run_level(url: str, questions: List[Dict[str, Any]], concurrency: int, total: int, timeout: float
+              ) -> Dict[str, Any]:
+    """Envía `total` preguntas (en ciclo sobre el corpus) con `concurrency` clientes"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def one(i: int) -> Dict[str, Any]:
+        item = questions[i % len(questions)]
+        start = time.perf_counter()
+        try:
+            r = session.post(f"{url}/ask", json={"question": item["question"]}, timeout=timeout)
+            body = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+            ok = r.status_code == 200 and body.get("execution_success", False)
+        except Exception as e:
+            body, ok = {"error": str(e)}, False
+        return {
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "ok": ok,
+            "timings": body.get("timings_ms", {}),
+            "data_source": body.get("data_source") or body.get("shortcut"),
+            "score": score(item, body.get("sql", "")) if ok and "expected_table" in item else None,
+        }
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - wall_start
+
+    ok = [r for r in results if r["ok"]]
+    sources: Dict[str, int] = {}
+    for r in ok:
+        sources[r["data_source"] or "postgres"] = sources.get(r["data_source"] or "postgres", 0) + 1
+    scored = [r["score"] for r in ok if r["score"] is not None]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall > 0 else None,
+        "latency_ms": harness.summarize([r["latency_ms"] for r in ok]),
+        "stages_ms": {
+            stage: harness.summarize([r["timings"][stage] for r in ok if stage in r["timings"]])
+            for stage in STAGES
+        },
+        "data_sources": sources,
+        "accuracy": {
+            "scored": len(scored),
+            "table": round(sum(s["table_ok"] for s in scored) / len(scored), 4) if scored else None,
+            "intent": round(sum(s["intent_ok"] for s in scored) / len(scored), 4) if scored else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end del conector con servicios locales")
+    harness.add_pg_arguments(parser)
+    parser.add_argument("--load", action="store_true", help="Crear tablas y cargar data/*.sql antes de medir")
+    parser.add_argument("--load-copy", default="", help="Cargar con COPY un directorio con manifest.json")
+    parser.add_argument("--load-jobs", type=int, default=4, help="Conexiones en paralelo para --load-copy")
+    parser.add_argument("--questions", default="", help="Corpus (.txt, .json o .jsonl); por defecto uno interno")
+    parser.add_argument("--concurrency", default="1,4,16", help="Niveles de concurrencia separados por coma")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por nivel")
+    parser.add_argument("--warmup-requests", type=int, default=20, help="Peticiones descartadas antes de medir")
+    parser.add_argument("--sqlcoder-latency-ms", type=float, default=40)
+    parser.add_argument("--nlg-latency-ms", type=float, default=80)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default="bench_results/e2e.json")
+    args = parser.parse_args()
+
+    settings = harness.pg_settings(args)
+    load_info = harness.load_database(settings) if args.load else None
+    if args.load_copy:
+        load_info = harness.load_copy(settings, args.load_copy, args.load_jobs)
+    questions = load_questions(args.questions)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmpdir:
+        services = start_services(args, tmpdir)
+        url = services["connector"].url
+        try:
+            if args.warmup_requests:
+                run_level(url, questions, 1, args.warmup_requests, args.timeout)
+            results = []
+            for c in levels:
+                level = run_level(url, questions, c, args.requests, args.timeout)
+                results.append(level)
+                print(
+                    f"⏱️  c={c:>3}  ok={level['requests'] - level['errors']:>5}  "
+                    f"rps={level['throughput_rps']}  p50={level['latency_ms']['p50']}ms  "
+                    f"p95={level['latency_ms']['p95']}ms  p99={level['latency_ms']['p99']}ms  "
+                    f"tabla={level['accuracy']['table']}  intención={level['accuracy']['intent']}"
+                )
+        finally:
+            for s in services.values():
+                s.stop()
+
+    harness.write_json(args.output, {
+        "benchmark": "e2e",
+        "meta": harness.run_metadata(),
+        "config": {
+            "questions": len(questions),
+            "requests_per_level": args.requests,
+            "sqlcoder_latency_ms": args.sqlcoder_latency_ms,
+            "nlg_latency_ms": args.nlg_latency_ms,
+            "database": {k: v for k, v in settings.items() if k != "PG_PASS"},
+            "load": load_info,
+        },
+        "levels": results,
+    })
+    print(f"💾 Resultados: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
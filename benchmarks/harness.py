@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Utilidades compartidas por los benchmarks.
+
+- Carga de una base PostgreSQL local a partir del catálogo YAML y los scripts
+  de data/ (seed_database.sql, inserts_completos.sql).
+- Servidores uvicorn en hilos para el conector y para SQLCoder/NLG con
+  latencia inyectada.
+- Percentiles y metadatos (commit, python) para resultados comparables.
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import platform
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONECTOR_DIR = os.path.join(ROOT, "api", "conector")
+SQLCODER_DIR = os.path.join(ROOT, "sqlcoder_7b_2")
+NLG_DIR = os.path.join(ROOT, "GPT")
+COMMON_DIR = os.path.join(ROOT, "common")
+DATA_DIR = os.path.join(ROOT, "data")
+SCHEMA_PATH = os.path.join(CONECTOR_DIR, "schema_catalog.yaml")
+
+DATA_FILES = ("inserts_completos.sql", "seed_database.sql")
+
+# Tipos del catálogo -> tipo de la columna id con secuencia (setval en los scripts)
+SERIAL_TYPES = {"integer": "serial", "bigint": "bigserial"}
+
+
+# ============================================================================
+# BASE DE DATOS
+# ============================================================================
+def pg_settings(args) -> Dict[str, str]:
+    return {
+        "PG_HOST": args.pg_host,
+        "PG_PORT": str(args.pg_port),
+        "PG_DB": args.pg_db,
+        "PG_USER": args.pg_user,
+        "PG_PASS": args.pg_pass,
+    }
+
+
+def add_pg_arguments(parser):
+    parser.add_argument("--pg-host", default=os.getenv("BENCH_PG_HOST", "127.0.0.1"))
+    parser.add_argument("--pg-port", type=int, default=int(os.getenv("BENCH_PG_PORT", "5432")))
+    parser.add_argument("--pg-db", default=os.getenv("BENCH_PG_DB", "agrodb_bench"))
+    parser.add_argument("--pg-user", default=os.getenv("BENCH_PG_USER", "postgres"))
+    parser.add_argument("--pg-pass", default=os.getenv("BENCH_PG_PASS", "postgres"))
+
+
+def connect(settings: Dict[str, str]):
+    import psycopg2
+    return psycopg2.connect(
+        host=settings["PG_HOST"], port=settings["PG_PORT"], dbname=settings["PG_DB"],
+        user=settings["PG_USER"], password=settings["PG_PASS"], connect_timeout=10
+    )
+
+
+def catalog_ddl(schema_path: str = SCHEMA_PATH) -> List[str]:
+    """CREATE TABLE por cada tabla del catálogo (id como clave primaria con secuencia)"""
+    with open(schema_path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    statements = []
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            sname = sch.get("name") or "public"
+            for t in sch.get("tables", []):
+                cols = []
+                for c in t.get("columns", []):
+                    name, ctype = c.get("name"), c.get("type") or "text"
+                    if name == "id":
+                        cols.append(f'"id" {SERIAL_TYPES.get(ctype, ctype)} PRIMARY KEY')
+                    else:
+                        cols.append(f'"{name}" {ctype}')
+                statements.append(f'CREATE TABLE IF NOT EXISTS {sname}."{t["name"]}" ({", ".join(cols)})')
+    return statements
+
+
+def split_sql(script: str) -> List[str]:
+    """Separa un script en sentencias (sin comentarios de línea completa)"""
+    lines = [l for l in script.splitlines() if not l.lstrip().startswith("--")]
+    return [s.strip() for s in re.split(r";\s*\n", "\n".join(lines) + "\n") if s.strip()]
+
+
+def load_database(settings: Dict[str, str], files=DATA_FILES) -> Dict[str, Any]:
+    """
+    Crea las tablas del catálogo y carga los scripts de data/.
+    Cada sentencia va en su propio savepoint: los duplicados entre scripts se omiten.
+    """
+    conn = connect(settings)
+    loaded, skipped = 0, 0
+    try:
+        with conn.cursor() as cur:
+            for stmt in catalog_ddl():
+                cur.execute(stmt)
+            conn.commit()
+            for name in files:
+                with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8") as f:
+                    for stmt in split_sql(f.read()):
+                        cur.execute("SAVEPOINT stmt")
+                        try:
+                            cur.execute(stmt)
+                            cur.execute("RELEASE SAVEPOINT stmt")
+                            loaded += 1
+                        except Exception:
+                            cur.execute("ROLLBACK TO SAVEPOINT stmt")
+                            skipped += 1
+                conn.commit()
+            cur.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return {"statements_loaded": loaded, "statements_skipped": skipped}
+
+
+def load_copy(settings: Dict[str, str], directory: str, jobs: int = 4) -> Dict[str, Any]:
+    """Carga masiva con COPY de un directorio de generar_datos(_escala).py (ver data/cargar_datos.py)"""
+    if DATA_DIR not in sys.path:
+        sys.path.insert(0, DATA_DIR)
+    import cargar_datos
+    return cargar_datos.load_directory(settings, directory, jobs=jobs)
+
+
+# ============================================================================
+# SERVIDORES EN PROCESO
+# ============================================================================
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def add_latency(app, latency_ms: float, paths: tuple):
+    """Middleware que simula el tiempo de inferencia del modelo en las rutas dadas"""
+    @app.middleware("http")
+    async def _latency(request, call_next):
+        if latency_ms > 0 and request.url.path in paths:
+            await asyncio.sleep(latency_ms / 1000)
+        return await call_next(request)
+    return app
+
+
+class ServerThread:
+    """uvicorn en un hilo, con arranque y parada controlados"""
+
+    def __init__(self, app, port: int, name: str):
+        import uvicorn
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.port = port
+        self.thread = threading.Thread(target=self.server.run, name=name, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 30) -> "ServerThread":
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError(f"{self.thread.name} no arrancó en {timeout}s")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def load_module(directory: str, filename: str, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Ejecuta un servicio del repo (con su directorio en sys.path) y devuelve sus globales"""
+    import runpy
+    os.environ.update(env or {})
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return runpy.run_path(os.path.join(directory, filename), run_name=f"bench_{filename[:-3]}")
+
+
+def load_app(directory: str, filename: str, env: Optional[Dict[str, str]] = None):
+    """App FastAPI de un servicio del repo"""
+    return load_module(directory, filename, env)["app"]
+
+
+# ============================================================================
+# RESULTADOS
+# ============================================================================
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil por rango más cercano (sin interpolar)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+def run_metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_json(path: str, payload: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False, default=str)
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de corpus de preguntas para pruebas de carga y de exactitud.
+
+Combina:
+- las intenciones que reconoce el motor de reglas (count, sum, avg, list, max, min),
+- las entidades de TABLE_KEYWORDS (SQLCoder) y TABLE_PREFIXES (conector), leídas
+  de common/keyword_matcher.py sin importarlo,
+- nombres reales de cultivos, fincas y compradores de los datos generados
+  (datos_completos.json o un directorio con manifest.json de generar_datos_escala.py),
+en español e inglés, con variantes de escritura (sin tildes, sin signos, minúsculas).
+
+Cada pregunta lleva la tabla y la intención esperadas para que e2e_bench.py mida
+latencia y exactitud a la vez:
+
+    python benchmarks/question_corpus.py --size 5000 --output bench_results/corpus.jsonl
+    python benchmarks/e2e_bench.py --questions bench_results/corpus.jsonl
+"""
+
+import os
+import re
+import ast
+import sys
+import csv
+import json
+import random
+import argparse
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+INTENTS = ("count", "sum", "avg", "list", "max", "min")
+
+# Sustantivos por tabla: (singular, plural, género) en español y (singular, plural) en inglés.
+# Solo se usan las tablas a las que apunta TABLE_KEYWORDS y sustantivos que contienen una de sus keywords.
+NOUNS: Dict[str, Dict[str, Any]] = {
+    "commerce_buyer": {"es": ("comprador", "compradores", "m"), "en": ("buyer", "buyers")},
+    "commerce_invoice": {"es": ("factura", "facturas", "f"), "en": ("invoice", "invoices")},
+    "commerce_listing": {"es": ("publicación", "publicaciones", "f"), "en": ("listing", "listings")},
+    "commerce_bid": {"es": ("oferta", "ofertas", "f"), "en": ("bid", "bids")},
+    "commerce_worker": {"es": ("trabajador", "trabajadores", "m"), "en": ("worker", "workers")},
+    "commerce_workerdebt": {"es": ("deuda", "deudas", "f"), "en": ("debt", "debts")},
+    "commerce_workerpayment": {"es": ("pago", "pagos", "m"), "en": ("payment", "payments")},
+    "farm_crop": {"es": ("cultivo", "cultivos", "m"), "en": ("crop", "crops")},
+    "farm_production": {"es": ("producción", "producción", "f"), "en": ("production", "production")},
+    "farm_farm": {"es": ("finca", "fincas", "f"), "en": ("farm", "farms")},
+    "farm_tool": {"es": ("herramienta", "herramientas", "f"), "en": ("tool", "tools")},
+    "farm_income": {"es": ("ingreso", "ingresos", "m"), "en": ("income", "incomes")},
+    "farm_cost": {"es": ("costo", "costos", "m"), "en": ("cost", "costs")},
+    "users_user": {"es": ("usuario", "usuarios", "m"), "en": ("user", "users")},
+    "commerce_marketprice": {"es": ("precio", "precios", "m"), "en": ("price", "prices")},
+}
+
+# Tablas con una medida numérica (sum/avg/max/min tienen sentido)
+MEASURE_TABLES = {
+    "commerce_invoice", "commerce_listing", "commerce_bid", "commerce_workerdebt", "commerce_workerpayment",
+    "farm_production", "farm_farm", "farm_tool", "farm_income", "farm_cost", "commerce_marketprice",
+}
+
+TEMPLATES: Dict[str, Dict[str, List[str]]] = {
+    "es": {
+        "count": ["¿Cuánt{os} {pl} hay?", "¿Cuál es la cantidad de {pl}?", "número de {pl} registrad{os}",
+                  "¿cuánt{os} {pl} tenemos?"],
+        "sum": ["¿Cuál es el total de {pl}?", "suma de {pl}", "total de {pl} por mes", "total de {pl} por semana"],
+        "avg": ["¿Cuál es el promedio de {pl}?", "promedio de {pl}", "media de {pl}"],
+        "list": ["muestra los primeros {n} {pl}", "lista {las} {pl}", "dame {n} {pl}", "muéstrame {las} últim{os} {pl}"],
+        "max": ["¿Cuál es el máximo de {pl}?", "{sg} con el valor más alto", "mayor valor de {pl}"],
+        "min": ["¿Cuál es el mínimo de {pl}?", "{sg} con el valor más bajo", "menor valor de {pl}"],
+    },
+    "en": {
+        "count": ["How many {pl} are there?", "count of {pl}", "how many {pl} do we have?"],
+        "sum": ["What is the total of {pl}?", "sum of {pl}", "total {pl} per month", "total {pl} weekly"],
+        "avg": ["What is the average of {pl}?", "average {pl}", "avg of {pl}"],
+        "list": ["show the first {n} {pl}", "list {pl}", "show me {n} {pl}", "top {n} {pl}"],
+        "max": ["What is the highest {sg}?", "max {sg}", "highest {sg} value"],
+        "min": ["What is the lowest {sg}?", "min {sg}", "lowest {sg} value"],
+    },
+}
+
+# Preguntas con valores reales de los datos: (intención, tabla esperada, tipo de nombre, plantillas)
+NAMED_TEMPLATES = [
+    ("sum", "farm_production", "crop", {
+        "es": ["total de producción del cultivo {name}", "¿cuánta cosecha de {name} hubo en total?"],
+        "en": ["total production of {name}", "sum of {name} production"],
+    }),
+    ("count", "farm_crop", "crop", {
+        "es": ["¿Cuántos cultivos de {name} hay?"],
+        "en": ["how many {name} crops are there?"],
+    }),
+    ("sum", "farm_income", "farm", {
+        "es": ["total de ingresos de la {name}", "suma de ganancias de {name}"],
+        "en": ["total income of {name}"],
+    }),
+    ("sum", "farm_cost", "farm", {
+        "es": ["total de gastos de la {name}", "¿cuál es el total de costos de {name}?"],
+        "en": ["total costs of {name}"],
+    }),
+    ("list", "commerce_invoice", "buyer", {
+        "es": ["muestra las facturas de {name}", "lista las facturas del cliente {name}"],
+        "en": ["show invoices for {name}"],
+    }),
+    ("count", "commerce_bid", "buyer", {
+        "es": ["¿cuántas ofertas hizo {name}?"],
+        "en": ["how many bids did {name} make?"],
+    }),
+]
+
+# Prefijos y sufijos de cortesía para variar la redacción
+COURTESY = {
+    "es": (["", "por favor, ", "oye, ", "me puedes decir ", "necesito saber ", "quiero ver "],
+           ["", " por favor", " gracias", " hoy"]),
+    "en": (["", "please ", "hey, ", "can you tell me ", "I need to know ", "I want to see "],
+           ["", " please", " thanks", " today"]),
+}
+
+PERIODS = {"por mes": "month", "per month": "month", "por semana": "week", "weekly": "week"}
+
+
+# ============================================================================
+# FUENTES
+# ============================================================================
+def literal_from_source(path: str, name: str) -> Any:
+    """Valor literal de una asignación de módulo (sin ejecutar el servicio)"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target] if isinstance(node, ast.AnnAssign) else []
+        if any(isinstance(t, ast.Name) and t.id == name for t in targets):
+            return ast.literal_eval(node.value)
+    raise KeyError(f"{name} no está en {path}")
+
+
+def keyword_entities() -> Dict[str, List[str]]:
+    """{tabla: keywords} a partir de TABLE_KEYWORDS (SQLCoder) y TABLE_PREFIXES (conector)"""
+    entities: Dict[str, List[str]] = {}
+    source = os.path.join(harness.COMMON_DIR, "keyword_matcher.py")
+    for table, keywords in literal_from_source(source, "TABLE_KEYWORDS").items():
+        entities.setdefault(table, []).extend(keywords)
+    for key, full_table in literal_from_source(source, "TABLE_PREFIXES").items():
+        entities.setdefault(full_table.split(".", 1)[-1], []).append(key)
+    return entities
+
+
+def _tsv_column(directory: str, manifest: Dict, table: str, column: str, limit: int) -> List[str]:
+    info = manifest["tables"].get(table)
+    if not info:
+        return []
+    index = info["columns"].index(column)
+    values: List[str] = []
+    for rel in info["files"]:
+        with open(os.path.join(directory, rel), "r", encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if row[index] not in values:
+                    values.append(row[index])
+                if len(values) >= limit:
+                    return values
+    return values
+
+
+def load_names(path: str, limit: int = 50) -> Dict[str, List[str]]:
+    """Nombres de cultivos, fincas y compradores de datos_completos.json o de un directorio COPY"""
+    if os.path.isdir(path):
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return {
+            "crop": _tsv_column(path, manifest, "farm_crop", "name", limit),
+            "farm": _tsv_column(path, manifest, "farm_farm", "name", limit),
+            "buyer": _tsv_column(path, manifest, "commerce_buyer", "name", limit),
+        }
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    def distinct(rows):
+        return list(dict.fromkeys(r["name"] for r in rows))[:limit]
+
+    return {"crop": distinct(data.get("crops", [])), "farm": distinct(data.get("farms", [])),
+            "buyer": distinct(data.get("buyers", []))}
+
+
+# ============================================================================
+# GENERACIÓN
+# ============================================================================
+def strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def variants(question: str, lang: str, rng: random.Random) -> str:
+    """Variante de redacción y escritura como la de un usuario real"""
+    prefixes, suffixes = COURTESY[lang]
+    prefix = rng.choice(prefixes)
+    if prefix:
+        question = question.strip("¿?")
+        question = question[0].lower() + question[1:]
+    question = f"{prefix}{question}{rng.choice(suffixes)}"
+    choice = rng.random()
+    if choice < 0.15:
+        return strip_accents(question)
+    if choice < 0.25:
+        return question.strip("¿?").lower()
+    if choice < 0.30:
+        return question.upper()
+    return question
+
+
+def _fill(template: str, lang: str, nouns: Dict[str, Any], n: int) -> str:
+    if lang == "es":
+        sg, pl, gender = nouns["es"]
+        feminine = gender == "f"
+        return template.format(
+            sg=sg, pl=pl, n=n, os="as" if feminine else "os", las="las" if feminine else "los"
+        )
+    sg, pl = nouns["en"]
+    return template.format(sg=sg, pl=pl, n=n)
+
+
+def base_questions(names: Dict[str, List[str]], rng: random.Random) -> List[Dict[str, Any]]:
+    """Todas las combinaciones entidad × intención × plantilla × idioma"""
+    entities = keyword_entities()
+    out: List[Dict[str, Any]] = []
+    for table, nouns in NOUNS.items():
+        keywords = entities.get(table, [])
+        if not any(kw in strip_accents(nouns["es"][1]) or kw in nouns["es"][1] for kw in keywords):
+            continue  # entidad que ni SQLCoder ni el conector reconocen
+        for lang, by_intent in TEMPLATES.items():
+            for intent, templates in by_intent.items():
+                if intent in ("sum", "avg", "max", "min") and table not in MEASURE_TABLES:
+                    continue
+                for template in templates:
+                    question = _fill(template, lang, nouns, rng.choice([3, 5, 10, 20, 50]))
+                    period = next((g for k, g in PERIODS.items() if k in question.lower()), None)
+                    out.append({"question": question, "lang": lang, "intent": intent,
+                                "expected_table": f"public.{table}", "period": period})
+
+    for intent, table, kind, by_lang in NAMED_TEMPLATES:
+        for name in names.get(kind, []):
+            for lang, templates in by_lang.items():
+                for template in templates:
+                    out.append({"question": template.format(name=name), "lang": lang, "intent": intent,
+                                "expected_table": f"public.{table}", "period": None,
+                                "filter": {"kind": kind, "value": name}})
+    return out
+
+
+def build_corpus(size: int, data_path: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Corpus de `size` preguntas: todas las combinaciones primero y luego variantes
+    aleatorias repartidas por igual entre intenciones.
+    """
+    rng = random.Random(seed)
+    base = base_questions(load_names(data_path), rng)
+    by_intent = {i: [q for q in base if q["intent"] == i] for i in INTENTS}
+    corpus = list(base)
+    seen = {q["question"] for q in corpus}
+    attempts = 0
+    while len(corpus) < size and attempts < size * 20:
+        attempts += 1
+        item = dict(rng.choice(by_intent[INTENTS[attempts % len(INTENTS)]]))
+        question = re.sub(r"\b\d+\b", str(rng.randint(1, 100)), item["question"])
+        item["question"] = variants(question, item["lang"], rng)
+        if item["question"] in seen:
+            continue
+        seen.add(item["question"])
+        corpus.append(item)
+    rng.shuffle(corpus)
+    corpus = corpus[:size]
+    for i, item in enumerate(corpus, 1):
+        item["id"] = i
+    return corpus
+
+
+# ============================================================================
+# EXACTITUD
+# ============================================================================
+AGGREGATE_INTENTS = [("count", r"\bCOUNT\s*\("), ("sum", r"\bSUM\s*\("), ("avg", r"\bAVG\s*\("),
+                     ("max", r"\bMAX\s*\("), ("min", r"\bMIN\s*\(")]
+TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([a-zA-Z_][\w]*\.[a-zA-Z_][\w]*)", re.IGNORECASE)
+
+
+def sql_intent(sql: str) -> Optional[str]:
+    """Intención que expresa un SQL (la primera agregación, o list si no agrega)"""
+    if not sql:
+        return None
+    for intent, pattern in AGGREGATE_INTENTS:
+        if re.search(pattern, sql, re.IGNORECASE):
+            return intent
+    return "list"
+
+
+def score(item: Dict[str, Any], sql: str) -> Dict[str, bool]:
+    """¿El SQL usa la tabla esperada y expresa la intención esperada?"""
+    tables = {t.lower() for t in TABLE_RE.findall(sql or "")}
+    return {
+        "table_ok": item.get("expected_table", "").lower() in tables,
+        "intent_ok": sql_intent(sql) == item.get("intent"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus de preguntas con tabla e intención esperadas")
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default=os.path.join(harness.DATA_DIR, "datos_completos.json"),
+                        help="datos_completos.json o directorio con manifest.json")
+    parser.add_argument("--output", default="bench_results/corpus.jsonl")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.data, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        for item in corpus:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    by_intent: Dict[str, int] = {}
+    for item in corpus:
+        by_intent[item["intent"]] = by_intent.get(item["intent"], 0) + 1
+    print(f"✅ {len(corpus)} preguntas → {args.output}")
+    print("   " + ", ".join(f"{k}={v}" for k, v in sorted(by_intent.items())))
+
+
+if __name__ == "__main__":
+    main()
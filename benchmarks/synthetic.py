@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Entradas sintéticas deterministas para los micro-benchmarks.
+
+- Catálogos de N tablas: las 28 reales de schema_catalog.yaml más tablas
+  generadas con nombres y columnas del mismo estilo.
+- Memorias de SQLCoder con N consultas aprendidas.
+"""
+
+import re
+import random
+from typing import Dict, List
+
+import yaml
+
+from harness import SCHEMA_PATH
+
+CATALOG_SIZES = [28, 1000, 10000]
+MEMORY_SIZES = [200, 10000, 100000]
+
+PREFIXES = ["farm", "commerce", "users", "auth", "chat", "inventory", "logistics", "finance"]
+WORDS = [
+    "crop", "harvest", "invoice", "payment", "buyer", "seller", "tool", "worker", "debt",
+    "listing", "bid", "price", "cost", "income", "production", "parcel", "irrigation",
+    "fertilizer", "pest", "storage", "shipment", "contract", "supplier", "order", "stock",
+]
+COLUMN_TYPES = ["bigint", "integer", "numeric", "character varying", "text", "date",
+                "timestamp with time zone", "boolean"]
+COLUMN_NAMES = ["name", "amount", "quantity_kg", "price_per_kg", "status", "notes", "date",
+                "created_at", "is_active", "description", "total_amount", "category", "email"]
+QUESTION_TEMPLATES = [
+    "¿cuántos {w} hay?", "muestra los primeros N {w}", "total de {w} por mes",
+    "promedio de {w}", "lista los {w} activos", "dame N {w} recientes",
+]
+
+
+def real_tables() -> Dict[str, dict]:
+    """Tablas del catálogo real en el formato de parse_schema: {tabla: {description, columns}}"""
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    tables = {}
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            for t in sch.get("tables", []):
+                tables[f'{sch.get("name", "public")}.{t["name"]}'] = {
+                    "description": t.get("description", "") or "",
+                    "columns": [{"name": c["name"], "type": c["type"]} for c in t.get("columns", [])],
+                }
+    return tables
+
+
+def synthetic_tables(n: int, seed: int = 0) -> Dict[str, dict]:
+    """Catálogo de n tablas: las reales primero y el resto generadas"""
+    rng = random.Random(seed)
+    tables = dict(list(real_tables().items())[:n])
+    i = 0
+    while len(tables) < n:
+        name = f"public.{rng.choice(PREFIXES)}_{rng.choice(WORDS)}{rng.choice(WORDS)}_{i}"
+        i += 1
+        cols = [{"name": "id", "type": "bigint"}]
+        for cname in rng.sample(COLUMN_NAMES, rng.randint(2, 10)):
+            cols.append({"name": cname, "type": rng.choice(COLUMN_TYPES)})
+        cols.append({"name": f"{rng.choice(WORDS)}_id", "type": "bigint"})
+        tables[name] = {"description": "", "columns": cols}
+    return tables
+
+
+def render_schema_text(tables: Dict[str, dict]) -> str:
+    """Mismo formato que load_schema_text() del conector (sin el recorte a 20000 caracteres)"""
+    lines: List[str] = []
+    for name, info in tables.items():
+        lines.append(f"TABLE {name} -- {info['description']}".strip())
+        for c in info["columns"]:
+            lines.append(f"  - {c['name']} ({c['type']})")
+    return "\n".join(lines)
+
+
+def _letters(i: int) -> str:
+    """Sufijo sin dígitos (a, b, ..., ba, bb, ...): SQLMemory normaliza los números a N"""
+    out = ""
+    while True:
+        i, r = divmod(i, 26)
+        out = chr(ord("a") + r) + out
+        if i == 0:
+            return out
+
+
+def synthetic_memory(n: int, seed: int = 0) -> Dict[str, list]:
+    """Memoria de SQLCoder con n consultas exitosas de preguntas distintas"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(n):
+        word = f"{rng.choice(WORDS)}_{_letters(i)}"
+        original = rng.choice(QUESTION_TEMPLATES).format(w=word).replace("N", str(rng.randint(1, 50)))
+        entries.append({
+            "question": re.sub(r"\d+", "N", original.lower()),
+            "original": original,
+            "sql": f"SELECT COUNT(*) AS total FROM public.farm_{word}",
+            "tables": [f"public.farm_{word}"],
+            "timestamp": 1_700_000_000 + i,
+        })
+    return {"successful_queries": entries, "failed_patterns": []}
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Palabras clave de los tres servicios (SQLCoder, conector y NLG) compiladas en
+un solo autómata Aho-Corasick.
+
+Cada servicio preguntaba `any(kw in q for kw in ...)` lista por lista: una
+búsqueda de subcadena por palabra clave y por regla. Aquí todas las listas se
+registran una vez, agrupadas por espacio de nombres (entity, intent, period,
+agro_topic...) y etiqueta, y `match_question()` devuelve en una sola pasada
+sobre la pregunta todas las etiquetas encontradas:
+
+    >>> match_question("¿Cuántas facturas por mes?")["intent"]
+    frozenset({'count'})
+
+La semántica es la misma que `kw in question.lower()` (subcadena, sin límites
+de palabra), incluidas coincidencias solapadas ("lista" y "listado"). El orden
+de precedencia entre etiquetas lo sigue decidiendo cada servicio, recorriendo
+sus tablas en orden y quedándose con la primera etiqueta encontrada.
+
+Los servicios importan este módulo desde common/ (una carpeta por encima de su
+directorio) para no divergir en vocabulario.
+"""
+
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Tuple
+
+# ====== VOCABULARIO ======
+# SQLCoder: sufijo de tabla -> palabras clave (en orden de precedencia)
+TABLE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    # Compradores/Clientes
+    "commerce_buyer": ("comprador", "compradores", "buyer", "cliente", "clientes", "customer", "customers"),
+    # Facturas
+    "commerce_invoice": ("factura", "facturas", "invoice", "invoices"),
+    # Listados/Publicaciones
+    "commerce_listing": ("listado", "listados", "listing", "listings", "publicacion", "publicaciones"),
+    # Ofertas
+    "commerce_bid": ("oferta", "ofertas", "bid", "bids", "puja", "pujas"),
+    # Trabajadores
+    "commerce_worker": ("trabajador", "trabajadores", "worker", "workers", "empleado", "empleados"),
+    # Deudas
+    "commerce_workerdebt": ("deuda", "deudas", "debt", "debts", "debe", "deben"),
+    # Pagos
+    "commerce_workerpayment": ("pago", "pagos", "payment", "payments", "abono", "abonos"),
+    # Cultivos
+    "farm_crop": ("cultivo", "cultivos", "crop", "crops", "siembra", "siembras"),
+    # Producción
+    "farm_production": ("produccion", "producción", "production", "cosecha", "cosechas"),
+    # Fincas
+    "farm_farm": ("finca", "fincas", "farm", "farms", "terreno", "terrenos", "predio"),
+    # Herramientas
+    "farm_tool": ("herramienta", "herramientas", "tool", "tools", "equipo", "equipos"),
+    # Ingresos
+    "farm_income": ("ingreso", "ingresos", "income", "incomes", "ganancia", "ganancias"),
+    # Costos/Gastos
+    "farm_cost": ("costo", "costos", "gasto", "gastos", "cost", "costs", "expense", "expenses"),
+    # Usuarios
+    "users_user": ("usuario", "usuarios", "user", "users"),
+    # Precios de mercado
+    "commerce_marketprice": ("precio", "precios", "price", "prices", "mercado"),
+}
+
+# Conector: prefijo de palabra -> tabla completa (en orden de precedencia)
+TABLE_PREFIXES: Dict[str, str] = {
+    "compr": "public.commerce_buyer",
+    "buyer": "public.commerce_buyer",
+    "factur": "public.commerce_invoice",
+    "list": "public.commerce_listing",
+    "bid": "public.commerce_bid",
+    "ofert": "public.commerce_bid",
+    "trabaj": "public.commerce_worker",
+    "deuda": "public.commerce_workerdebt",
+    "pago": "public.commerce_workerpayment",
+    "cultiv": "public.farm_crop",
+    "producc": "public.farm_production",
+    "finca": "public.farm_farm",
+    "herram": "public.farm_tool",
+    "ingreso": "public.farm_income",
+    "costo": "public.farm_cost",
+    "usuario": "public.users_user",
+    "precio": "public.commerce_marketprice",
+}
+
+# SQLCoder: patrones del motor de reglas (se evalúan en este orden)
+INTENT_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "count": ("cuántos", "cuantos", "cuántas", "cuantas", "cantidad", "número", "numero", "how many", "count"),
+    "sum": ("total", "suma", "sum", "sumar"),
+    "avg": ("promedio", "media", "average", "avg"),
+    "list": ("muestra", "lista", "dame", "ver", "show", "list", "enséñame", "ensename", "primeros", "top"),
+    "max": ("mayor", "máximo", "maximo", "max", "más alto", "mas alto", "highest"),
+    "min": ("menor", "mínimo", "minimo", "min", "más bajo", "mas bajo", "lowest"),
+}
+
+# Agrupaciones temporales -> grano de date_trunc
+PERIOD_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "day": ("por día", "por dia", "diario", "diaria", "per day", "daily"),
+    "week": ("por semana", "semanal", "per week", "weekly"),
+    "month": ("por mes", "mensual", "per month", "monthly"),
+    "year": ("por año", "por ano", "anual", "per year", "yearly"),
+}
+
+# Conector: atajos locales (COUNT forzado, fallback sin SQLCoder, listados)
+CONNECTOR_INTENT_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "force_count": ("cuántos", "cuantos", "cantidad", "número", "numero", "total de"),
+    "count": ("cuántos", "cuantos", "cuántas", "cuantas", "cantidad", "número", "numero", "total de", "how many"),
+    "list": (
+        "muestra", "lista", "enséñame", "ensename", "primeros", "top",
+        "ver los primeros", "muéstrame", "muestrame", "dame", "ver",
+        "últimos", "ultimos",
+    ),
+}
+
+# NLG: temas agrícolas (en orden de precedencia)
+AGRO_TOPICS: Dict[str, Tuple[str, ...]] = {
+    "cultivo": ("cultivar", "siembra", "plantar", "cultivo", "cosecha"),
+    "riego": ("riego", "agua", "irrigacion", "hidratar"),
+    "fertilizacion": ("fertiliz", "abono", "nutrient", "npk"),
+    "fertilizante_marca": ("yara", "yaramilas", "yaraliva", "yaratera", "monomeros", "abocol"),
+    "plagas": ("plaga", "enfermedad", "insecto", "control", "fungicida", "pesticida"),
+    "clima": ("clima", "temperatura", "lluvia", "sequia", "helada"),
+    "precio": ("precio", "venta", "mercado", "comercio"),
+}
+
+
+# ====== AUTÓMATA ======
+class KeywordMatcher:
+    """
+    Aho-Corasick sobre {espacio: {etiqueta: palabras clave}}. Las transiciones
+    fallidas se resuelven al compilar (DFA completo sobre el alfabeto de las
+    palabras clave), así que `match` hace un acceso a dict por carácter.
+    """
+
+    def __init__(self, groups: Mapping[str, Mapping[str, Iterable[str]]]):
+        self.namespaces = list(groups)
+        self.patterns = 0
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[set] = [set()]
+        for namespace, labels in groups.items():
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    state = 0
+                    for ch in keyword.lower():
+                        nxt = goto[state].get(ch)
+                        if nxt is None:
+                            nxt = len(goto)
+                            goto[state][ch] = nxt
+                            goto.append({})
+                            outputs.append(set())
+                        state = nxt
+                    outputs[state].add((namespace, label))
+                    self.patterns += 1
+
+        # Enlaces de fallo en anchura; cada estado hereda las salidas de su enlace
+        alphabet = {ch for edges in goto for ch in edges}
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict() for _ in goto]
+        delta[0] = dict(goto[0])
+        queue = list(goto[0].values())
+        for head in queue:
+            for ch, child in goto[head].items():
+                queue.append(child)
+                f = fail[head]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0) if goto[f].get(ch) != child else 0
+                outputs[child] |= outputs[fail[child]]
+        # DFA: transición para cada carácter del alfabeto (los caracteres ausentes vuelven a la raíz)
+        for state in queue:
+            row = delta[state]
+            for ch in alphabet:
+                nxt = goto[state].get(ch)
+                row[ch] = nxt if nxt is not None else delta[fail[state]].get(ch, 0)
+            for ch in [c for c, nxt in row.items() if nxt == 0]:
+                del row[ch]
+
+        self._delta = delta
+        self._outputs = [frozenset(out) if out else None for out in outputs]
+
+    def match(self, text: str) -> Dict[str, FrozenSet[str]]:
+        """{espacio: etiquetas encontradas} para todos los espacios (vacíos si no hay coincidencias)"""
+        delta, outputs = self._delta, self._outputs
+        found = set()
+        state = 0
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if outputs[state] is not None:
+                found |= outputs[state]
+        result: Dict[str, set] = {namespace: set() for namespace in self.namespaces}
+        for namespace, label in found:
+            result[namespace].add(label)
+        return {namespace: frozenset(labels) for namespace, labels in result.items()}
+
+
+MATCHER = KeywordMatcher({
+    "entity": TABLE_KEYWORDS,
+    "entity_prefix": {prefix: (prefix,) for prefix in TABLE_PREFIXES},
+    "intent": INTENT_KEYWORDS,
+    "period": PERIOD_KEYWORDS,
+    "connector_intent": CONNECTOR_INTENT_KEYWORDS,
+    "agro_topic": AGRO_TOPICS,
+})
+
+
+@lru_cache(maxsize=4096)
+def match_question(question: str) -> Dict[str, FrozenSet[str]]:
+    """
+    Coincidencias de la pregunta con todo el vocabulario compartido (memoizado:
+    un mismo servicio consulta varias veces la misma pregunta). No modificar el
+    dict devuelto.
+    """
+    return MATCHER.match(question)
+
+
+def first_label(labels: FrozenSet[str], order: Iterable[str]):
+    """Primera etiqueta de `order` que esté en `labels` (la precedencia de cada servicio)"""
+    return next((label for label in order if label in labels), None)
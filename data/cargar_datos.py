@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Carga masiva en PostgreSQL con COPY FROM STDIN.
+
+Lee el manifest.json que escriben generar_datos.py (--copy-dir) y
+generar_datos_escala.py (--out) y:
+
+1. Crea las tablas del catálogo que aparecen en el manifiesto, sin claves ni índices.
+   Si alguna ya existe con filas se aborta (los ids chocarían o se duplicarían):
+   para reemplazarlas hay que pasar --recreate. Si existe vacía (p. ej. una BD
+   migrada con Django) se quitan sus índices secundarios y claves foráneas
+   antes del COPY y se vuelven a crear después.
+2. Carga cada archivo con COPY en paralelo (una conexión por tarea): sin claves
+   foráneas todas las tablas son independientes.
+3. Después de la carga crea claves primarias, índices sobre las columnas de
+   relación y claves foráneas, y ajusta las secuencias de id.
+4. ANALYZE de las tablas cargadas.
+
+Uso:
+    python data/cargar_datos.py data/escala/sf1000 --jobs 8 --pg-db agrodb_bench
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import yaml
+import psycopg2
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(os.path.dirname(DATA_DIR), "api", "conector", "schema_catalog.yaml")
+SCHEMA = "public"
+
+# Tipos del catálogo -> tipo de la columna id con secuencia
+SERIAL_TYPES = {"integer": "serial", "bigint": "bigserial"}
+
+# (tabla, columna, tabla referenciada) entre las tablas que generan los scripts de data/
+FOREIGN_KEYS: List[Tuple[str, str, str]] = [
+    ("farm_farm", "owner_id", "users_user"),
+    ("farm_crop", "farm_id", "farm_farm"),
+    ("farm_production", "crop_id", "farm_crop"),
+    ("farm_income", "farm_id", "farm_farm"),
+    ("farm_cost", "farm_id", "farm_farm"),
+    ("farm_tool", "farm_id", "farm_farm"),
+    ("farm_employee", "farm_id", "farm_farm"),
+    ("commerce_workerdebt", "worker_id", "commerce_worker"),
+    ("commerce_workerpayment", "debt_id", "commerce_workerdebt"),
+    ("commerce_workerpayment", "worker_id", "commerce_worker"),
+    ("commerce_listing", "crop_id", "farm_crop"),
+    ("commerce_listing", "seller_id", "users_user"),
+    ("commerce_bid", "buyer_id", "commerce_buyer"),
+    ("commerce_bid", "listing_id", "commerce_listing"),
+    ("commerce_invoice", "buyer_id", "commerce_buyer"),
+    ("commerce_invoice", "listing_id", "commerce_listing"),
+]
+
+
+# ====================================
+# CONEXIÓN Y CATÁLOGO
+# ====================================
+
+def connect(settings: Dict[str, str]):
+    return psycopg2.connect(
+        host=settings["PG_HOST"], port=settings["PG_PORT"], dbname=settings["PG_DB"],
+        user=settings["PG_USER"], password=settings["PG_PASS"], connect_timeout=10
+    )
+
+
+def catalog_columns(schema_path: str = SCHEMA_PATH) -> Dict[str, List[Tuple[str, str]]]:
+    """{tabla: [(columna, tipo)]} del esquema public del catálogo YAML"""
+    with open(schema_path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    tables = {}
+    for db in data.get("databases", []):
+        for sch in db.get("schemas", []):
+            if (sch.get("name") or SCHEMA) != SCHEMA:
+                continue
+            for t in sch.get("tables", []):
+                tables[t["name"]] = [(c["name"], c.get("type") or "text") for c in t.get("columns", [])]
+    return tables
+
+
+def create_table_sql(table: str, columns: List[Tuple[str, str]]) -> str:
+    """CREATE TABLE sin restricciones: la clave primaria se crea después de la carga"""
+    cols = [
+        f'"{name}" {SERIAL_TYPES.get(ctype, ctype) if name == "id" else ctype}'
+        for name, ctype in columns
+    ]
+    return f'CREATE TABLE IF NOT EXISTS {SCHEMA}."{table}" ({", ".join(cols)})'
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ====================================
+# FASES
+# ====================================
+
+def _execute(settings: Dict[str, str], statements: List[str]) -> float:
+    """Ejecuta sentencias en autocommit con su propia conexión; devuelve segundos"""
+    start = time.time()
+    conn = connect(settings)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for stmt in statements:
+                cur.execute(stmt)
+    finally:
+        conn.close()
+    return time.time() - start
+
+
+def _copy_file(settings: Dict[str, str], table: str, columns: List[str], path: str) -> Dict[str, Any]:
+    start = time.time()
+    conn = connect(settings)
+    try:
+        with conn.cursor() as cur, open(path, "r", encoding="utf-8") as f:
+            cur.execute("SET synchronous_commit TO off")
+            cols = ", ".join(f'"{c}"' for c in columns)
+            cur.copy_expert(f'COPY {SCHEMA}."{table}" ({cols}) FROM STDIN', f)
+            rows = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return {"table": table, "file": path, "rows": rows, "seconds": time.time() - start}
+
+
+def _non_empty_tables(settings: Dict[str, str], tables: List[str]) -> List[str]:
+    """Tablas que ya existen y tienen al menos una fila"""
+    conn = connect(settings)
+    try:
+        with conn.cursor() as cur:
+            found = []
+            for t in tables:
+                cur.execute("SELECT to_regclass(%s)", (f'{SCHEMA}."{t}"',))
+                if cur.fetchone()[0] is None:
+                    continue
+                cur.execute(f'SELECT EXISTS (SELECT 1 FROM {SCHEMA}."{t}")')
+                if cur.fetchone()[0]:
+                    found.append(t)
+            return found
+    finally:
+        conn.close()
+
+
+def _existing_constraints(settings: Dict[str, str], tables: List[str]) -> Dict[str, set]:
+    """{tabla: nombres de restricciones} para no recrear PK/FK en recargas sobre tablas existentes"""
+    conn = connect(settings)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT cl.relname, co.conname, co.contype FROM pg_constraint co "
+                "JOIN pg_class cl ON cl.oid = co.conrelid JOIN pg_namespace n ON n.oid = cl.relnamespace "
+                "WHERE n.nspname = %s AND cl.relname = ANY(%s)",
+                (SCHEMA, tables)
+            )
+            found: Dict[str, set] = {t: set() for t in tables}
+            for relname, conname, contype in cur.fetchall():
+                found[relname].add(conname)
+                if contype == "p":
+                    found[relname].add("__pkey__")
+            return found
+    finally:
+        conn.close()
+
+
+def _detach_secondary(settings: Dict[str, str], tables: List[str]
+                      ) -> Tuple[List[str], Dict[str, Dict[str, List[str]]], Dict[str, set]]:
+    """
+    Quita índices secundarios y FKs de las tablas que ya existen (vacías) para que el
+    COPY en paralelo no dependa del orden de carga ni mantenga índices fila a fila.
+    Devuelve (sentencias DROP, {fase: {tabla: sentencias para restaurarlos}},
+    {tabla: nombres propios equivalentes que ya no hay que crear}).
+    """
+    drops: List[str] = []
+    restore: Dict[str, Dict[str, List[str]]] = {"indexes": {}, "foreign_keys": {}}
+    covered: Dict[str, set] = {t: set() for t in tables}
+    conn = connect(settings)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT cl.relname, co.conname, pg_get_constraintdef(co.oid), "
+                "ARRAY(SELECT a.attname FROM pg_attribute a WHERE a.attrelid = co.conrelid AND a.attnum = ANY(co.conkey)) "
+                "FROM pg_constraint co JOIN pg_class cl ON cl.oid = co.conrelid "
+                "JOIN pg_namespace n ON n.oid = cl.relnamespace "
+                "WHERE n.nspname = %s AND cl.relname = ANY(%s) AND co.contype = 'f'",
+                (SCHEMA, tables)
+            )
+            for table, name, definition, columns in cur.fetchall():
+                drops.append(f'ALTER TABLE {SCHEMA}."{table}" DROP CONSTRAINT "{name}"')
+                restore["foreign_keys"].setdefault(table, []).append(
+                    f'ALTER TABLE {SCHEMA}."{table}" ADD CONSTRAINT "{name}" {definition}'
+                )
+                if len(columns) == 1:
+                    covered[table].add(f"{table}_{columns[0]}_fk")
+            # Solo índices no únicos que no respaldan una restricción: PK y UNIQUE se quedan
+            cur.execute(
+                "SELECT cl.relname, ic.relname, pg_get_indexdef(i.indexrelid), "
+                "ARRAY(SELECT a.attname FROM pg_attribute a WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) "
+                "FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid JOIN pg_class cl ON cl.oid = i.indrelid "
+                "JOIN pg_namespace n ON n.oid = cl.relnamespace "
+                "WHERE n.nspname = %s AND cl.relname = ANY(%s) AND NOT i.indisunique "
+                "AND NOT EXISTS (SELECT 1 FROM pg_constraint co WHERE co.conindid = i.indexrelid)",
+                (SCHEMA, tables)
+            )
+            for table, name, definition, columns in cur.fetchall():
+                drops.append(f'DROP INDEX IF EXISTS {SCHEMA}."{name}"')
+                restore["indexes"].setdefault(table, []).append(definition)
+                if len(columns) == 1:
+                    covered[table].add(f"{table}_{columns[0]}_idx")
+    finally:
+        conn.close()
+    # Las FKs primero: un índice no se puede quitar mientras una restricción dependa de él
+    drops.sort(key=lambda stmt: not stmt.startswith("ALTER"))
+    return drops, restore, covered
+
+
+def constraint_statements(tables: List[str], existing: Dict[str, set], foreign_keys: bool = True
+                          ) -> Dict[str, Dict[str, List[str]]]:
+    """Sentencias por fase y tabla: claves primarias, índices de relación y claves foráneas"""
+    loaded = set(tables)
+    phases: Dict[str, Dict[str, List[str]]] = {"primary_keys": {}, "indexes": {}, "foreign_keys": {}}
+    for t in tables:
+        if "__pkey__" not in existing.get(t, set()):
+            phases["primary_keys"][t] = [f'ALTER TABLE {SCHEMA}."{t}" ADD PRIMARY KEY ("id")']
+    for table, column, ref in FOREIGN_KEYS:
+        if table not in loaded:
+            continue
+        if f"{table}_{column}_idx" not in existing.get(table, set()):
+            phases["indexes"].setdefault(table, []).append(
+                f'CREATE INDEX IF NOT EXISTS "{table}_{column}_idx" ON {SCHEMA}."{table}" ("{column}")'
+            )
+        name = f"{table}_{column}_fk"
+        if foreign_keys and ref in loaded and name not in existing.get(table, set()):
+            phases["foreign_keys"].setdefault(table, []).append(
+                f'ALTER TABLE {SCHEMA}."{table}" ADD CONSTRAINT "{name}" '
+                f'FOREIGN KEY ("{column}") REFERENCES {SCHEMA}."{ref}" ("id")'
+            )
+    return phases
+
+
+def load_directory(settings: Dict[str, str], directory: str, jobs: int = 4, recreate: bool = False,
+                   foreign_keys: bool = True, schema_path: str = SCHEMA_PATH) -> Dict[str, Any]:
+    """Carga un directorio con manifest.json; devuelve tiempos por fase y filas/s por tabla"""
+    manifest = read_manifest(directory)
+    catalog = catalog_columns(schema_path)
+    tables = [t for t in manifest["tables"] if t in catalog and manifest["tables"][t]["files"]]
+    missing = [t for t in manifest["tables"] if t not in catalog]
+    if missing:
+        print(f"⚠️  Tablas fuera del catálogo (se omiten): {', '.join(missing)}")
+
+    report: Dict[str, Any] = {"directory": directory, "config": manifest.get("config"), "phases": {}}
+    started = time.time()
+
+    # 1. Tablas sin restricciones (COPY sobre datos previos duplicaría filas o chocaría con la PK)
+    if not recreate:
+        non_empty = _non_empty_tables(settings, tables)
+        if non_empty:
+            raise RuntimeError(
+                f"Tablas con datos: {', '.join(non_empty)}. Usa --recreate para eliminarlas y cargar de nuevo"
+            )
+    restore: Dict[str, Dict[str, List[str]]] = {}
+    covered: Dict[str, set] = {}
+    if recreate:
+        ddl = [f'DROP TABLE IF EXISTS {SCHEMA}."{t}" CASCADE' for t in tables]
+    else:
+        ddl, restore, covered = _detach_secondary(settings, tables)
+        if ddl:
+            print(f"🔧 Tablas existentes: se quitan {len(ddl)} índices/FKs durante la carga")
+    ddl += [create_table_sql(t, catalog[t]) for t in tables]
+    report["phases"]["create_tables"] = round(_execute(settings, ddl), 3)
+
+    # 2. COPY en paralelo: los archivos más grandes primero para repartir mejor la carga
+    tasks = [
+        (t, manifest["tables"][t]["columns"], os.path.join(directory, f))
+        for t in tables for f in manifest["tables"][t]["files"]
+    ]
+    tasks.sort(key=lambda task: os.path.getsize(task[2]), reverse=True)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda task: _copy_file(settings, *task), tasks))
+    copy_seconds = time.time() - start
+    report["phases"]["copy"] = round(copy_seconds, 3)
+
+    per_table: Dict[str, Dict[str, Any]] = {}
+    for r in results:
+        entry = per_table.setdefault(r["table"], {"rows": 0, "files": 0, "seconds": 0.0})
+        entry["rows"] += r["rows"]
+        entry["files"] += 1
+        entry["seconds"] += r["seconds"]
+    for entry in per_table.values():
+        entry["rows_per_second"] = round(entry["rows"] / entry["seconds"]) if entry["seconds"] else None
+        entry["seconds"] = round(entry["seconds"], 3)
+    report["tables"] = per_table
+
+    # 3. Claves, índices y FKs después de la carga (cada fase en paralelo por tabla)
+    existing = _existing_constraints(settings, tables)
+    for t, names in covered.items():
+        existing[t] |= names
+    phases = constraint_statements(tables, existing, foreign_keys)
+    for phase, by_table in restore.items():
+        for t, stmts in by_table.items():
+            phases[phase].setdefault(t, []).extend(stmts)
+    for phase, by_table in phases.items():
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(lambda stmts: _execute(settings, stmts), by_table.values()))
+        report["phases"][phase] = round(time.time() - start, 3)
+
+    # 4. Secuencias y estadísticas
+    finish = [
+        f"SELECT setval(pg_get_serial_sequence('{SCHEMA}.\"{t}\"', 'id'), "
+        f'COALESCE((SELECT MAX("id") FROM {SCHEMA}."{t}"), 0) + 1, false)'
+        for t in tables
+    ] + [f'ANALYZE {SCHEMA}."{t}"' for t in tables]
+    report["phases"]["sequences_analyze"] = round(_execute(settings, finish), 3)
+
+    total_rows = sum(e["rows"] for e in per_table.values())
+    total_seconds = time.time() - started
+    report["rows"] = total_rows
+    report["seconds"] = round(total_seconds, 3)
+    report["copy_rows_per_second"] = round(total_rows / copy_seconds) if copy_seconds else None
+    report["rows_per_second"] = round(total_rows / total_seconds) if total_seconds else None
+    return report
+
+
+# ====================================
+# EJECUCIÓN PRINCIPAL
+# ====================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga con COPY los TSV de generar_datos(_escala).py")
+    parser.add_argument("directory", help="Directorio con manifest.json")
+    parser.add_argument("--jobs", type=int, default=4, help="Conexiones en paralelo")
+    parser.add_argument("--recreate", action="store_true", help="Eliminar y recrear las tablas antes de cargar")
+    parser.add_argument("--no-foreign-keys", action="store_true", help="No crear claves foráneas")
+    parser.add_argument("--schema-path", default=SCHEMA_PATH)
+    parser.add_argument("--report", default=None, help="Guardar el reporte en JSON")
+    parser.add_argument("--pg-host", default=os.getenv("PG_HOST", "127.0.0.1"))
+    parser.add_argument("--pg-port", default=os.getenv("PG_PORT", "5432"))
+    parser.add_argument("--pg-db", default=os.getenv("PG_DB"))
+    parser.add_argument("--pg-user", default=os.getenv("PG_USER", "postgres"))
+    parser.add_argument("--pg-pass", default=os.getenv("PG_PASS", ""))
+    args = parser.parse_args()
+
+    settings = {
+        "PG_HOST": args.pg_host, "PG_PORT": str(args.pg_port), "PG_DB": args.pg_db,
+        "PG_USER": args.pg_user, "PG_PASS": args.pg_pass,
+    }
+    print("=" * 60)
+    print(f"🚚 CARGANDO {args.directory} → {args.pg_db}@{args.pg_host}")
+    print("=" * 60)
+    try:
+        report = load_directory(
+            settings, args.directory, jobs=args.jobs, recreate=args.recreate,
+            foreign_keys=not args.no_foreign_keys, schema_path=args.schema_path
+        )
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    for table, entry in sorted(report["tables"].items(), key=lambda kv: -kv[1]["rows"]):
+        print(f"  {table}: {entry['rows']:,} filas ({entry['rows_per_second'] or 0:,} filas/s)")
+    print("\n⏱️  Fases: " + ", ".join(f"{k}={v}s" for k, v in report["phases"].items()))
+    print(f"📊 {report['rows']:,} filas en {report['seconds']}s "
+          f"(COPY {report['copy_rows_per_second'] or 0:,} filas/s, total {report['rows_per_second'] or 0:,} filas/s)")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Reporte: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
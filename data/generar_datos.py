@@ -1,5 +1,7 @@
+import os
 import random
 import json
+import argparse
 from datetime import datetime, timedelta
 from faker import Faker
 
@@ -338,6 +340,8 @@ class DataGenerator:
         listing_id = 1
         bid_id = 1
         invoice_id = 1
+        # El vendedor es el dueño (users_user) de la finca del cultivo
+        owners = {f["id"]: f["owner_id"] for f in self.data["farms"]}
         
         # Crear listados basados en producción alta
         for crop in self.data["crops"][:10]:  # Solo algunos cultivos
@@ -352,7 +356,7 @@ class DataGenerator:
                     "is_auction": random.choice([True, False]),
                     "status": random.choice(["active", "active", "sold"]),
                     "crop_id": crop["id"],
-                    "seller_id": crop["farm_id"]
+                    "seller_id": owners[crop["farm_id"]]
                 }
                 self.data["listings"].append(listing)
                 
@@ -558,11 +562,82 @@ def generate_sql(data):
     
     return "\n".join(sql)
 
+# ====================================
+# GENERADOR DE ARCHIVOS COPY
+# ====================================
+
+# Clave en data -> (tabla, columnas en el mismo orden que generate_sql)
+COPY_TABLES = {
+    "users": ("users_user", ["id", "username", "email", "first_name", "last_name", "role", "is_active",
+                             "date_joined", "password", "is_superuser", "is_staff", "last_login"]),
+    "farms": ("farm_farm", ["id", "name", "location", "area_hectares", "owner_id"]),
+    "crops": ("farm_crop", ["id", "name", "variety", "planted_at", "expected_harvest_at", "farm_id"]),
+    "workers": ("commerce_worker", ["id", "full_name", "document", "phone", "is_active"]),
+    "buyers": ("commerce_buyer", ["id", "name", "email", "phone"]),
+    "production": ("farm_production", ["id", "date", "quantity_kg", "crop_id"]),
+    "income": ("farm_income", ["id", "date", "source", "amount", "farm_id"]),
+    "costs": ("farm_cost", ["id", "date", "category", "amount", "notes", "farm_id"]),
+    "tools": ("farm_tool", ["id", "name", "purchase_date", "cost", "farm_id"]),
+    "employees": ("farm_employee", ["id", "full_name", "role", "daily_rate", "farm_id"]),
+    "worker_debts": ("commerce_workerdebt", ["id", "description", "amount", "created_at", "paid", "worker_id"]),
+    "worker_payments": ("commerce_workerpayment", ["id", "amount", "created_at", "note", "debt_id", "worker_id"]),
+    "listings": ("commerce_listing", ["id", "quantity_kg", "min_price_per_kg", "is_auction", "status",
+                                      "crop_id", "seller_id"]),
+    "bids": ("commerce_bid", ["id", "price_per_kg", "created_at", "buyer_id", "listing_id"]),
+    "invoices": ("commerce_invoice", ["id", "total_amount", "created_at", "is_proforma", "buyer_id", "listing_id"]),
+}
+
+# Columnas que generate_sql escribe como constantes
+COPY_DEFAULTS = {"password": "pbkdf2_sha256$dummy", "is_superuser": False, "is_staff": False, "last_login": None}
+
+COPY_MANIFEST = "manifest.json"
+
+
+def copy_value(value) -> str:
+    """Valor en formato texto de COPY (NULL = \\N)"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return str(value)
+
+
+def generate_copy(data, out_dir):
+    """Un TSV por tabla (formato texto de COPY) y un manifest.json para cargar_datos.py"""
+    tables = {}
+    for key, (table, columns) in COPY_TABLES.items():
+        os.makedirs(os.path.join(out_dir, table), exist_ok=True)
+        path = f"{table}/part-00000.tsv"
+        with open(os.path.join(out_dir, path), "w", encoding="utf-8", newline="\n") as f:
+            for row in data.get(key, []):
+                f.write("\t".join(copy_value(row.get(c, COPY_DEFAULTS.get(c))) for c in columns) + "\n")
+        tables[table] = {"columns": columns, "rows": len(data.get(key, [])), "files": [path]}
+
+    manifest = {"format": "copy-text", "config": {"source": "generar_datos.py"}, "tables": tables}
+    with open(os.path.join(out_dir, COPY_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
 # ====================================
 # EJECUCIÓN PRINCIPAL
 # ====================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera datos agrícolas de ejemplo (JSON, INSERT y COPY)")
+    parser.add_argument("--copy-dir", default="copy", help="Directorio de los TSV para cargar_datos.py")
+    parser.add_argument("--from-json", default=None,
+                        help="No generar datos nuevos: exportar a COPY un JSON existente (p. ej. datos_completos.json)")
+    args = parser.parse_args()
+
+    if args.from_json:
+        with open(args.from_json, 'r', encoding='utf-8') as f:
+            manifest = generate_copy(json.load(f), args.copy_dir)
+        print(f"✅ Guardado: {os.path.join(args.copy_dir, COPY_MANIFEST)} "
+              f"({sum(t['rows'] for t in manifest['tables'].values()):,} filas)")
+        raise SystemExit(0)
+
     try:
         # Generar datos
         generator = DataGenerator()
@@ -598,6 +673,10 @@ if __name__ == "__main__":
             f.write(sql_script)
         print("✅ Guardado: inserts_completos.sql")
         
+        # Guardar archivos COPY (carga masiva con cargar_datos.py)
+        generate_copy(data, args.copy_dir)
+        print(f"✅ Guardado: {os.path.join(args.copy_dir, COPY_MANIFEST)}")
+        
         print("\n" + "=" * 60)
         print("🎉 PROCESO COMPLETADO")
         print("=" * 60)
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de datos sintéticos a escala (NumPy).
+
+Escala el modelo de generar_datos.py con un factor SF: SF=1 equivale al volumen
+del generador original (3 fincas, 15 usuarios, 25 trabajadores, 10 compradores)
+y SF=1000 supera el millón de registros de producción.
+
+- Vectorizado: cada tabla se genera por bloques de fincas o trabajadores con arrays.
+- Particionado y con semilla: la partición p usa default_rng([seed, p]) y solo
+  genera su rango de ids, así que las particiones se pueden producir en procesos
+  (o máquinas) distintos y el resultado no depende de cuántos se usen a la vez.
+- Streaming: cada bloque se escribe en <salida>/<tabla>/part-NNNNN.tsv (formato
+  texto de COPY) y se descarta; nunca se mantiene el dataset completo en memoria.
+- Integridad referencial: las dimensiones (usuarios, fincas, cultivos,
+  compradores, trabajadores) tienen ids calculables sin coordinación y los hechos
+  usan bloques de ids por partición (p * ID_BLOCK + n).
+
+Uso:
+    python data/generar_datos_escala.py --scale 1000 --partitions 8 --workers 8 --out data/escala/sf1000
+"""
+
+import os
+import json
+import time
+import argparse
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from generar_datos import (
+    CROP_TYPES, COST_CATEGORIES, TOOL_TYPES, COPY_TABLES, COPY_MANIFEST,
+    NUM_FARMS, NUM_USERS, NUM_WORKERS, NUM_BUYERS, NUM_CROPS_PER_FARM, NUM_DAYS,
+)
+
+# ====================================
+# CONFIGURACIÓN
+# ====================================
+ID_BLOCK = 10 ** 9          # ids de hechos reservados por partición
+CHUNK_FARMS = 250           # fincas por bloque (≈ CHUNK_FARMS * 5 * días celdas de producción)
+CHUNK_WORKERS = 5000        # trabajadores por bloque
+LISTING_RATE = 0.4          # fracción de cultivos con producción > 100 kg que salen a la venta
+
+USER_ROLES = ["farmer", "buyer", "admin"]
+EMPLOYEE_ROLES = ["Jornalero", "Mayordomo", "Recolector", "Fumigador"]
+LISTING_STATUS = ["active", "active", "sold"]
+HIGH_MONTHS = [4, 5, 6, 10, 11, 12]
+LOCATIONS = ["Vereda El Café, Chinchiná", "Vereda La Esperanza, Manizales", "Vereda Santa Rita, Palestina",
+             "Vereda La Palma, Chinchiná", "Vereda El Rosario, Neira", "Vereda Guacaica, Manizales"]
+COST_RANGES = {"Fertilizantes": (100000, 500000), "Mano de obra": (200000, 800000)}
+DEFAULT_COST_RANGE = (50000, 300000)
+
+# Vocabulario fijo (Faker no es vectorizable y rompería el determinismo por partición)
+FIRST_NAMES = ["Alcides", "César", "Nerea", "Milena", "Luisa", "Andrés", "Camila", "Jorge", "Paula",
+               "Hernán", "Diana", "Mateo", "Valentina", "Óscar", "Lucía", "Fabio", "Sandra", "Iván"]
+LAST_NAMES = ["Galiano", "Guevara", "Naranjo", "Bohórquez", "Ruiz", "Molina", "Jiménez", "Márquez",
+              "Gil", "Cañas", "Osorio", "Restrepo", "Londoño", "Zuluaga", "Arango", "Giraldo"]
+COMPANY_WORDS = ["Agro", "Comercializadora", "Distribuidora", "Café", "Frutas", "Cosechas", "Andina"]
+NOTE_WORDS = ["compra mensual", "pago a proveedor", "reposición de insumos", "servicio técnico",
+              "transporte a bodega", "jornal semanal", "arreglo de cerca"]
+DEBT_WORDS = ["anticipo", "emergencia", "herramienta", "mercado", "salud", "transporte"]
+
+TABLE_COLUMNS: Dict[str, List[str]] = dict(COPY_TABLES.values())
+
+PARTS_DIR = "_parts"
+
+
+def scaled_counts(scale: int) -> Dict[str, int]:
+    return {
+        "users": NUM_USERS * scale,
+        "farms": NUM_FARMS * scale,
+        "workers": NUM_WORKERS * scale,
+        "buyers": NUM_BUYERS * scale,
+    }
+
+
+def id_range(total: int, partitions: int, p: int) -> Tuple[int, int]:
+    """Rango [lo, hi) de ids 1..total que le toca a la partición p"""
+    return total * p // partitions + 1, total * (p + 1) // partitions + 1
+
+
+def cat(*parts) -> np.ndarray:
+    """Concatenación de strings elemento a elemento (arrays o escalares)"""
+    out = np.asarray(parts[0]).astype(str)
+    for part in parts[1:]:
+        out = np.char.add(out, np.asarray(part).astype(str))
+    return out
+
+
+def _text(column) -> List[str]:
+    """Columna en formato texto de COPY"""
+    arr = np.asarray(column)
+    if arr.dtype == bool:
+        return np.where(arr, "t", "f").tolist()
+    if arr.dtype.kind == "f":
+        return np.char.mod("%.2f", arr).tolist()
+    return arr.astype(str).tolist()
+
+
+# ====================================
+# PARTICIÓN
+# ====================================
+
+class Partition:
+    """Estado de una partición: generador aleatorio, contadores de ids y archivos TSV"""
+
+    def __init__(self, seed: int, index: int, out_dir: str):
+        self.index = index
+        self.out_dir = out_dir
+        self.rng = np.random.default_rng([seed, index])
+        self.counters = {t: index * ID_BLOCK for t in TABLE_COLUMNS}
+        self.files = {}
+        self.rows = {t: 0 for t in TABLE_COLUMNS}
+
+    def next_ids(self, table: str, n: int) -> np.ndarray:
+        start = self.counters[table]
+        self.counters[table] = start + n
+        return np.arange(start + 1, start + n + 1, dtype=np.int64)
+
+    def path(self, table: str) -> str:
+        return os.path.join(self.out_dir, table, f"part-{self.index:05d}.tsv")
+
+    def write(self, table: str, columns: list):
+        n = len(columns[0])
+        if n == 0:
+            return
+        fh = self.files.get(table)
+        if fh is None:
+            os.makedirs(os.path.join(self.out_dir, table), exist_ok=True)
+            fh = self.files[table] = open(self.path(table), "w", encoding="utf-8", newline="\n")
+        rows = zip(*[_text(c) for c in columns])
+        fh.write("\n".join(map("\t".join, rows)))
+        fh.write("\n")
+        self.rows[table] += n
+
+    def close(self) -> Dict[str, int]:
+        for fh in self.files.values():
+            fh.close()
+        return {t: n for t, n in self.rows.items() if n}
+
+
+# ====================================
+# GENERADOR
+# ====================================
+
+class ScaleGenerator:
+    def __init__(self, scale: int = 1, seed: int = 42, days: int = NUM_DAYS,
+                 start_date: str = None, partitions: int = 1):
+        self.scale = scale
+        self.seed = seed
+        self.days = days
+        self.partitions = partitions
+        self.counts = scaled_counts(scale)
+        self.start_date = start_date or (date.today() - timedelta(days=days)).isoformat()
+        self.start = np.datetime64(self.start_date, "D")
+        self.dates = self.start + np.arange(days)
+        months = self.dates.astype("datetime64[M]").astype(int) % 12 + 1
+        self.high_season = np.isin(months, HIGH_MONTHS)
+        self.weeks = -(-days // 7)
+
+        self.crop_names = np.array([c["name"] for c in CROP_TYPES])
+        self.crop_varieties = np.array([c["variety"] for c in CROP_TYPES])
+        self.crop_cycles = np.array([c["cycle_days"] for c in CROP_TYPES])
+        self.cost_categories = np.array(COST_CATEGORIES)
+        ranges = [COST_RANGES.get(c, DEFAULT_COST_RANGE) for c in COST_CATEGORIES]
+        self.cost_low = np.array([r[0] for r in ranges])
+        self.cost_high = np.array([r[1] for r in ranges])
+
+    def config(self) -> Dict:
+        return {"scale": self.scale, "seed": self.seed, "days": self.days,
+                "start_date": self.start_date, "partitions": self.partitions}
+
+    def generate_partition(self, index: int, out_dir: str) -> Dict[str, int]:
+        """Genera y escribe la partición `index`; devuelve filas por tabla"""
+        part = Partition(self.seed, index, out_dir)
+        try:
+            self.generate_users(part, *id_range(self.counts["users"], self.partitions, index))
+            self.generate_buyers(part, *id_range(self.counts["buyers"], self.partitions, index))
+            lo, hi = id_range(self.counts["farms"], self.partitions, index)
+            for a in range(lo, hi, CHUNK_FARMS):
+                self.generate_farms(part, a, min(a + CHUNK_FARMS, hi))
+            lo, hi = id_range(self.counts["workers"], self.partitions, index)
+            for a in range(lo, hi, CHUNK_WORKERS):
+                self.generate_workers(part, a, min(a + CHUNK_WORKERS, hi))
+        finally:
+            rows = part.close()
+        return rows
+
+    # ----- utilidades -----
+
+    def _choice(self, part: Partition, values: list, n: int) -> np.ndarray:
+        return np.asarray(values)[part.rng.integers(0, len(values), n)]
+
+    def _names(self, part: Partition, n: int) -> np.ndarray:
+        return cat(self._choice(part, FIRST_NAMES, n), " ", self._choice(part, LAST_NAMES, n))
+
+    def _phones(self, part: Partition, n: int) -> np.ndarray:
+        return cat("3", part.rng.integers(100000000, 200000000, n))
+
+    def _days_in_range(self, part: Partition, n: int) -> np.ndarray:
+        """Fechas dentro del período generado (como start_date + randint(0, NUM_DAYS))"""
+        return self.start + part.rng.integers(0, self.days + 1, n)
+
+    # ----- dimensiones -----
+
+    def generate_users(self, part: Partition, lo: int, hi: int):
+        ids = np.arange(lo, hi, dtype=np.int64)
+        n = len(ids)
+        first = self._choice(part, FIRST_NAMES, n)
+        last = self._choice(part, LAST_NAMES, n)
+        # Rol por posición: los dueños de fincas (ids 1, 4, 7...) son siempre "farmer"
+        role = np.asarray(USER_ROLES)[(ids - 1) % len(USER_ROLES)]
+        joined = self.start - part.rng.integers(0, 366, n)
+        part.write("users_user", [
+            ids, cat(np.char.lower(first), ".", np.char.lower(last), ids), cat("user", ids, "@example.com"),
+            first, last, role, np.ones(n, dtype=bool), joined, np.full(n, "pbkdf2_sha256$dummy"),
+            np.zeros(n, dtype=bool), np.zeros(n, dtype=bool), np.full(n, "\\N"),
+        ])
+
+    def generate_buyers(self, part: Partition, lo: int, hi: int):
+        ids = np.arange(lo, hi, dtype=np.int64)
+        n = len(ids)
+        part.write("commerce_buyer", [
+            ids, cat(self._choice(part, COMPANY_WORDS, n), " ", self._choice(part, LAST_NAMES, n), " ", ids),
+            cat("compras", ids, "@example.com"), self._phones(part, n),
+        ])
+
+    def generate_farms(self, part: Partition, lo: int, hi: int):
+        """Fincas [lo, hi) con sus cultivos, producción, ventas, costos, herramientas, empleados y mercado"""
+        rng = part.rng
+        farm_ids = np.arange(lo, hi, dtype=np.int64)
+        nf = len(farm_ids)
+        farmers = -(-self.counts["users"] // len(USER_ROLES))
+        names = self._choice(part, LAST_NAMES, nf)
+        areas = np.round(rng.uniform(2.5, 15.0, nf), 2)
+        owners = 1 + len(USER_ROLES) * rng.integers(0, farmers, nf)
+        part.write("farm_farm", [
+            farm_ids, cat("Finca ", names), np.asarray(LOCATIONS)[(farm_ids - 1) % len(LOCATIONS)], areas, owners,
+        ])
+
+        # Cultivos: NUM_CROPS_PER_FARM por finca, ids contiguos por finca
+        per_farm = NUM_CROPS_PER_FARM
+        crop_ids = ((farm_ids - 1)[:, None] * per_farm + np.arange(1, per_farm + 1)).ravel()
+        crop_farm = np.repeat(farm_ids, per_farm)
+        nc = len(crop_ids)
+        kind = rng.integers(0, len(CROP_TYPES), nc)
+        planted_ago = rng.integers(0, 366, nc)
+        planted = self.start - planted_ago
+        part.write("farm_crop", [
+            crop_ids, self.crop_names[kind], self.crop_varieties[kind], planted,
+            planted + self.crop_cycles[kind], crop_farm,
+        ])
+
+        # Producción diaria durante la ventana de cosecha, con estacionalidad
+        since_planted = np.arange(self.days)[None, :] + planted_ago[:, None]
+        harvest = (since_planted > 120) & (since_planted < 300)
+        quantity = np.where(self.high_season[None, :],
+                            rng.integers(20, 81, (nc, self.days)), rng.integers(5, 31, (nc, self.days)))
+        quantity = np.where(harvest, quantity, 0)
+        ci, di = np.nonzero(harvest)
+        part.write("farm_production", [
+            part.next_ids("farm_production", len(ci)), self.dates[di], quantity[ci, di], crop_ids[ci],
+        ])
+
+        # Ventas semanales por finca a partir de su producción
+        padded = np.zeros((nf, self.weeks * 7), dtype=np.int64)
+        padded[:, :self.days] = quantity.reshape(nf, per_farm, self.days).sum(axis=1)
+        weekly_kg = padded.reshape(nf, self.weeks, 7).sum(axis=2)
+        fi, wi = np.nonzero(weekly_kg > 0)
+        kg = weekly_kg[fi, wi]
+        part.write("farm_income", [
+            part.next_ids("farm_income", len(fi)), self.start + 7 * (wi + 1),
+            cat("Venta de ", self.crop_names[kind[fi * per_farm]], " - ", kg, " kg"),
+            kg * rng.integers(8000, 12001, len(fi)), farm_ids[fi],
+        ])
+
+        # Costos: 2-4 por semana y finca, monto según categoría
+        per_week = rng.integers(2, 5, (nf, self.weeks)).ravel()
+        cost_farm = np.repeat(np.repeat(farm_ids, self.weeks), per_week)
+        cost_week = np.repeat(np.tile(np.arange(self.weeks), nf), per_week)
+        n = len(cost_farm)
+        category = rng.integers(0, len(COST_CATEGORIES), n)
+        part.write("farm_cost", [
+            part.next_ids("farm_cost", n), self.start + 7 * cost_week, self.cost_categories[category],
+            rng.integers(self.cost_low[category], self.cost_high[category] + 1),
+            cat(self.cost_categories[category], " - ", self._choice(part, NOTE_WORDS, n)), cost_farm,
+        ])
+
+        # Herramientas y empleados: 3-8 por finca
+        tool_farm = np.repeat(farm_ids, rng.integers(3, 9, nf))
+        n = len(tool_farm)
+        part.write("farm_tool", [
+            part.next_ids("farm_tool", n), self._choice(part, TOOL_TYPES, n),
+            self.start - rng.integers(0, 366, n), rng.integers(50000, 1500001, n), tool_farm,
+        ])
+        employee_farm = np.repeat(farm_ids, rng.integers(3, 9, nf))
+        n = len(employee_farm)
+        part.write("farm_employee", [
+            part.next_ids("farm_employee", n), self._names(part, n), self._choice(part, EMPLOYEE_ROLES, n),
+            rng.integers(40000, 80001, n), employee_farm,
+        ])
+
+        # El vendedor de un listado es el dueño (users_user) de la finca del cultivo
+        self.generate_market(part, crop_ids, np.repeat(owners, per_farm), quantity.sum(axis=1))
+
+    def generate_market(self, part: Partition, crop_ids: np.ndarray, crop_seller: np.ndarray, total_kg: np.ndarray):
+        """Listados de cultivos con producción suficiente, ofertas en subastas y facturas de vendidos"""
+        rng = part.rng
+        selected = np.nonzero((total_kg > 100) & (rng.random(len(crop_ids)) < LISTING_RATE))[0]
+        n = len(selected)
+        listing_ids = part.next_ids("commerce_listing", n)
+        quantity = rng.integers(100, np.minimum(500, total_kg[selected]) + 1)
+        min_price = rng.integers(8000, 10001, n)
+        is_auction = rng.random(n) < 0.5
+        status = self._choice(part, LISTING_STATUS, n)
+        part.write("commerce_listing", [
+            listing_ids, quantity, min_price, is_auction, status, crop_ids[selected], crop_seller[selected],
+        ])
+
+        auctions = np.nonzero(is_auction)[0]
+        bid_listing = np.repeat(auctions, rng.integers(1, 6, len(auctions)))
+        n = len(bid_listing)
+        part.write("commerce_bid", [
+            part.next_ids("commerce_bid", n), min_price[bid_listing] + rng.integers(100, 1001, n),
+            self._days_in_range(part, n), rng.integers(1, self.counts["buyers"] + 1, n), listing_ids[bid_listing],
+        ])
+
+        sold = np.nonzero(status == "sold")[0]
+        n = len(sold)
+        part.write("commerce_invoice", [
+            part.next_ids("commerce_invoice", n), quantity[sold] * (min_price[sold] + rng.integers(0, 501, n)),
+            self._days_in_range(part, n), rng.random(n) < 0.5,
+            rng.integers(1, self.counts["buyers"] + 1, n), listing_ids[sold],
+        ])
+
+    def generate_workers(self, part: Partition, lo: int, hi: int):
+        """Trabajadores [lo, hi) con sus deudas y pagos"""
+        rng = part.rng
+        ids = np.arange(lo, hi, dtype=np.int64)
+        n = len(ids)
+        active = rng.random(n) < 0.75
+        part.write("commerce_worker", [
+            ids, self._names(part, n), rng.integers(10000000, 100000000, n), self._phones(part, n), active,
+        ])
+
+        # 2-5 deudas por trabajador activo, 2/3 pagadas
+        debt_worker = np.repeat(ids[active], rng.integers(2, 6, int(active.sum())))
+        n = len(debt_worker)
+        debt_ids = part.next_ids("commerce_workerdebt", n)
+        created = self._days_in_range(part, n)
+        amount = rng.integers(100000, 500001, n)
+        paid = rng.random(n) < 2 / 3
+        part.write("commerce_workerdebt", [
+            debt_ids, cat("Préstamo ", self._choice(part, DEBT_WORDS, n)), amount, created, paid, debt_worker,
+        ])
+
+        # Pagos de 1 a 3 cuotas que suman el monto de la deuda (mismas reglas que generar_datos.py):
+        # las parciales valen al menos 50000 y si el resto es <= 100000 se liquida de una vez
+        d = np.nonzero(paid)[0]
+        total = amount[d]
+        installments = rng.integers(1, 4, len(d))
+        first = np.where(installments >= 2, rng.integers(50000, total // 2 + 1), total)
+        rest = total - first
+        three = (installments == 3) & (rest > 100000)
+        second = np.where(three, rng.integers(50000, np.maximum(rest // 2, 50000) + 1), rest)
+        has_second = installments >= 2
+        debt_index = np.concatenate([d, d[has_second], d[three]])
+        order = np.argsort(debt_index, kind="stable")
+        debt_index = debt_index[order]
+        pay_amount = np.concatenate([first, second[has_second], (rest - second)[three]])[order]
+        number = np.concatenate([np.full(len(d), 1), np.full(int(has_second.sum()), 2),
+                                 np.full(int(three.sum()), 3)])[order]
+        n = len(debt_index)
+        part.write("commerce_workerpayment", [
+            part.next_ids("commerce_workerpayment", n), pay_amount,
+            created[debt_index] + rng.integers(7, 61, n), cat("Pago parcial ", number),
+            debt_ids[debt_index], debt_worker[debt_index],
+        ])
+
+
+# ====================================
+# EJECUCIÓN
+# ====================================
+
+def _run_partition(task: Tuple[Dict, int, str]) -> Tuple[int, Dict[str, int]]:
+    config, index, out_dir = task
+    rows = ScaleGenerator(**config).generate_partition(index, out_dir)
+    os.makedirs(os.path.join(out_dir, PARTS_DIR), exist_ok=True)
+    with open(os.path.join(out_dir, PARTS_DIR, f"part-{index:05d}.json"), "w", encoding="utf-8") as f:
+        json.dump({"config": config, "rows": rows}, f)
+    return index, rows
+
+
+def write_manifest(out_dir: str) -> Dict:
+    """Une las estadísticas de las particiones en manifest.json (columnas, filas y archivos por tabla)"""
+    parts_dir = os.path.join(out_dir, PARTS_DIR)
+    parts = [json.load(open(os.path.join(parts_dir, name), encoding="utf-8"))
+             for name in sorted(os.listdir(parts_dir)) if name.endswith(".json")]
+    config = parts[0]["config"]
+    if len(parts) != config["partitions"]:
+        raise RuntimeError(f"Faltan particiones: {len(parts)}/{config['partitions']}")
+    tables = {}
+    for table, columns in TABLE_COLUMNS.items():
+        files = sorted(os.listdir(os.path.join(out_dir, table))) if os.path.isdir(os.path.join(out_dir, table)) else []
+        tables[table] = {
+            "columns": columns,
+            "rows": sum(p["rows"].get(table, 0) for p in parts),
+            "files": [f"{table}/{name}" for name in files if name.endswith(".tsv")],
+        }
+    manifest = {"format": "copy-text", "config": config, "tables": tables}
+    with open(os.path.join(out_dir, COPY_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datos sintéticos a escala en archivos TSV (formato COPY)")
+    parser.add_argument("--scale", type=int, default=1, help="Factor de escala (SF=1 ≈ generar_datos.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=NUM_DAYS)
+    parser.add_argument("--start-date", default=None, help="Inicio del período (AAAA-MM-DD); por defecto hoy - días")
+    parser.add_argument("--partitions", type=int, default=None, help="Número de particiones (por defecto = workers)")
+    parser.add_argument("--partition", type=int, default=None, help="Generar solo esta partición")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos en paralelo")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "escala"))
+    args = parser.parse_args()
+
+    generator = ScaleGenerator(args.scale, args.seed, args.days, args.start_date, args.partitions or args.workers)
+    config = generator.config()
+    indexes = [args.partition] if args.partition is not None else list(range(generator.partitions))
+
+    print("=" * 60)
+    print(f"🚀 GENERANDO SF={args.scale} en {len(indexes)} partición(es) → {args.out}")
+    print("=" * 60)
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(indexes)))) as pool:
+        for index, rows in pool.map(_run_partition, [(config, i, args.out) for i in indexes]):
+            print(f"✅ Partición {index}: {sum(rows.values()):,} filas")
+    elapsed = time.time() - start
+
+    done = len(os.listdir(os.path.join(args.out, PARTS_DIR)))
+    if done < generator.partitions:
+        print(f"⏳ {done}/{generator.partitions} particiones listas; el manifiesto se escribe al completar todas")
+        return
+    manifest = write_manifest(args.out)
+    total = sum(t["rows"] for t in manifest["tables"].values())
+    print(f"\n📊 RESUMEN ({elapsed:.1f}s, {total / max(elapsed, 1e-9):,.0f} filas/s):")
+    for table, info in manifest["tables"].items():
+        print(f"  {table}: {info['rows']:,}")
+    print(f"✅ Guardado: {os.path.join(args.out, COPY_MANIFEST)}")
+
+
+if __name__ == "__main__":
+    main()
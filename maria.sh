@@ -15,6 +15,8 @@ NC='\033[0m'
 CONECTOR_PORT=8000
 NLG_PORT=8002
 SQLCODER_PORT=8011
+# Workers de SQLCoder; con más de uno la memoria se comparte en SQLite (MEMORY_DB)
+SQLCODER_WORKERS=${SQLCODER_WORKERS:-1}
 
 # Rutas de proyecto
 CONECTOR_DIR="/workspace/api/conector"
@@ -135,6 +137,8 @@ start_sqlcoder() {
     if ! pip show fastapi > /dev/null 2>&1; then
         print_warning "Instalando dependencias..."
         pip install -q fastapi uvicorn[standard]
+        # Opcional: similitud TF-IDF de la memoria (MEMORY_SIMILARITY_ENABLED)
+        pip install -q numpy scipy || print_warning "numpy/scipy no instalados: memoria solo con coincidencias exactas"
     fi
     
     mkdir -p /workspace/sqlcoder_7b_2/
@@ -146,9 +150,10 @@ start_sqlcoder() {
     kill_service $SQLCODER_PORT "SQLCoder"
     
     print_info "Iniciando SQLCoder en puerto $SQLCODER_PORT..."
-    nohup uvicorn app_sqlcoder:app \
+    WEB_CONCURRENCY=$SQLCODER_WORKERS nohup uvicorn app_sqlcoder:app \
         --host 0.0.0.0 \
         --port $SQLCODER_PORT \
+        --workers $SQLCODER_WORKERS \
         --log-level info \
         > /tmp/sqlcoder.log 2>&1 &
     
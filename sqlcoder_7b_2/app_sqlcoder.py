@@ -5,19 +5,59 @@ Sin dependencias de ML (PyTorch, transformers, etc.)
 Ventajas: Instantáneo (<10ms), RAM mínima (~5MB), aprende de consultas exitosas
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import os
 import re
+import sys
 import json
 import time
+import sqlite3
+import pickle
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo del archivo de memoria entre procesos
+    fcntl = None
+
+from similarity_index import NgramIndex, similarity_available
+from eviction import FrequencySketch, make_policy
+
+# Vocabulario y autómata de palabras clave compartidos con el conector y el NLG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from keyword_matcher import PERIOD_KEYWORDS, TABLE_KEYWORDS, first_label, match_question
 
 # ============================================================================
 # CONFIGURACIÓN
 # ============================================================================
 PORT = int(os.getenv("PORT", "8001"))
 MEMORY_FILE = os.getenv("MEMORY_FILE", "/workspace/sqlcoder_7b_2/memory.json")
+MEMORY_MAX_ENTRIES = int(os.getenv("MEMORY_MAX_ENTRIES", "5000"))  # Consultas aprendidas que se conservan
+MEMORY_MAX_BYTES = int(os.getenv("MEMORY_MAX_BYTES", "0"))          # Tamaño máximo aproximado (0 = sin límite)
+# Desalojo al superar los límites: lru | lfu | tinylfu (ver eviction.py)
+MEMORY_EVICTION_POLICY = os.getenv("MEMORY_EVICTION_POLICY", "lru").lower()
+MEMORY_FSYNC_SECONDS = float(os.getenv("MEMORY_FSYNC_SECONDS", "1"))      # Lote de fsync del journal
+MEMORY_COMPACT_SECONDS = float(os.getenv("MEMORY_COMPACT_SECONDS", "300"))  # Snapshot periódico
+MEMORY_COMPACT_LINES = int(os.getenv("MEMORY_COMPACT_LINES", "1000"))      # ...o antes si el journal crece
+# Backend de la memoria: json (snapshot + journal en RAM) | sqlite (índices en disco + FTS5)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "json").lower()
+MEMORY_DB = os.getenv("MEMORY_DB", "") or os.path.splitext(MEMORY_FILE)[0] + ".sqlite"
+# Workers de uvicorn (uvicorn --workers toma el mismo valor por defecto); con más de uno la memoria va en sqlite
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Recuperación por similitud (TF-IDF de n-gramas; requiere numpy y scipy)
+MEMORY_SIMILARITY_ENABLED = os.getenv("MEMORY_SIMILARITY_ENABLED", "false").lower() in ("1", "true", "yes")
+MEMORY_SIMILARITY_THRESHOLD = float(os.getenv("MEMORY_SIMILARITY_THRESHOLD", "0.7"))  # Acierto de caché por vecino
+MEMORY_EXAMPLE_THRESHOLD = float(os.getenv("MEMORY_EXAMPLE_THRESHOLD", "0.3"))         # Ejemplos few-shot
+# Catálogo compilado por api/conector/gen_schema.py (vacío = parsear schema_text en cada petición)
+CATALOG_ARTIFACT_PATH = os.getenv("CATALOG_ARTIFACT_PATH", "")
+# Esquemas parseados que se conservan, por sha256 del schema_text (LRU)
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "16"))
 
 app = FastAPI(
     title="SQLCoder Ligero",
@@ -30,7 +70,9 @@ app = FastAPI(
 # ============================================================================
 class SQLIn(BaseModel):
     question: str
-    schema_text: str
+    # Texto completo del esquema, o solo su huella (sha256) si el servicio ya lo vio
+    schema_text: Optional[str] = None
+    schema_fingerprint: Optional[str] = None
     lang: str = "es"
     max_new_tokens: int = 256
     feedback: Optional[str] = None
@@ -38,42 +80,312 @@ class SQLIn(BaseModel):
 class SQLOut(BaseModel):
     sql: str
     source: str = "rule_engine"
+    schema_fingerprint: Optional[str] = None
     debug_info: Optional[Dict] = None
 
 # ============================================================================
 # SISTEMA DE MEMORIA Y APRENDIZAJE
 # ============================================================================
+def new_similarity_index() -> Optional[NgramIndex]:
+    """Índice de similitud si está activado y numpy/scipy están instalados"""
+    if not MEMORY_SIMILARITY_ENABLED:
+        return None
+    if not similarity_available():
+        print("⚠️ MEMORY_SIMILARITY_ENABLED sin numpy/scipy: solo coincidencias exactas")
+        return None
+    return NgramIndex()
+
+def adapt_cached_sql(sql: str, question: str) -> str:
+    """Si la pregunta tenía números, reemplazarlos en el SQL aprendido (LIMIT)"""
+    numbers = re.findall(r'\d+', question)
+    if numbers and 'LIMIT' in sql.upper():
+        sql = re.sub(r'LIMIT\s+\d+', f'LIMIT {numbers[0]}', sql, flags=re.IGNORECASE)
+    return sql
+
+def entry_size(entry: Dict) -> int:
+    """Tamaño aproximado de una consulta aprendida (bytes de su JSON), para MEMORY_MAX_BYTES"""
+    return len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+def hit_stats(lookups: int, hits: int, near_hits: int) -> Dict:
+    """Tasa de aciertos de la caché desde el arranque (near_hits = vecinos del Paso 2b)"""
+    return {
+        "lookups": lookups,
+        "hits": hits,
+        "near_hits": near_hits,
+        "misses": lookups - hits - near_hits,
+        "hit_rate": round((hits + near_hits) / lookups, 4) if lookups else None
+    }
+
 class SQLMemory:
-    """Sistema de caché inteligente que aprende de consultas exitosas"""
+    """
+    Sistema de caché inteligente que aprende de consultas exitosas.
+    Las búsquedas usan un dict por pregunta normalizada (O(1)), que también
+    conserva el orden de llegada para el snapshot.
+
+    Persistencia: memory.json es un snapshot y cada consulta aprendida se
+    añade como una línea a memory.json.journal (JSONL). Un hilo en segundo
+    plano hace flush + fsync por lotes y compacta periódicamente (snapshot
+    nuevo escrito de forma atómica y journal vacío). Al arrancar se carga el
+    snapshot y se reproduce el journal; una línea cortada por un fallo se ignora.
+
+    Desalojo: al superar max_entries o max_bytes sale la víctima de la política
+    (lru | lfu | tinylfu, ver eviction.py). Cada acierto suma `hits` y actualiza
+    `last_hit_at` en la entrada; esos contadores viajan en el siguiente snapshot,
+    no en el journal. Al reproducir el journal no se aplica el filtro de
+    admisión: esas entradas ya fueron admitidas.
+
+    Vive en la RAM de un solo proceso: un bloqueo exclusivo sobre memory.json.lock
+    impide que un segundo proceso escriba el mismo journal y snapshot (con varios
+    workers, SQLiteMemory). exclusive=False solo para leerla (importación a sqlite).
+    """
     
-    def __init__(self, path: str):
+    def __init__(self, path: str, max_entries: int = MEMORY_MAX_ENTRIES,
+                 fsync_seconds: float = MEMORY_FSYNC_SECONDS,
+                 compact_seconds: float = MEMORY_COMPACT_SECONDS,
+                 compact_lines: int = MEMORY_COMPACT_LINES,
+                 max_bytes: int = MEMORY_MAX_BYTES,
+                 policy: str = MEMORY_EVICTION_POLICY,
+                 exclusive: bool = True):
         self.path = path
-        self.memory = self._load()
+        self.journal_path = f"{path}.journal"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy_name = policy
+        self.fsync_seconds = fsync_seconds
+        self.compact_seconds = compact_seconds
+        self.compact_lines = compact_lines
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._journal = None
+        self._journal_lines = 0
+        self._dirty = False
+        self._hits_dirty = False
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_compaction: Optional[float] = None
+        self.lookups = self.hits = self.near_hits = 0
+        self.evictions = self.rejected = 0
+        self._lock_file = self._acquire_process_lock() if exclusive else None
+        self._load()
+
+    def _acquire_process_lock(self):
+        """Bloqueo exclusivo (flock) de memory.json.lock mientras viva el proceso"""
+        if fcntl is None:
+            return None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(
+                f"{self.path} ya está en uso por otro proceso; con varios workers usa MEMORY_BACKEND=sqlite"
+            )
+        return lock_file
+
+    @property
+    def memory(self) -> Dict:
+        return {**self._memory, "successful_queries": list(self._index.values())}
+
+    @memory.setter
+    def memory(self, value: Dict):
+        self._memory = {k: v for k, v in value.items() if k != "successful_queries"}
+        self._index: Dict[str, Dict] = {}
+        self._sizes: Dict[str, int] = {}
+        for entry in value.get("successful_queries", []):
+            # Como el recorrido lineal anterior: gana la primera aparición
+            if entry["question"] in self._index:
+                continue
+            entry.setdefault("hits", 0)
+            entry.setdefault("last_hit_at", None)
+            self._index[entry["question"]] = entry
+            self._sizes[entry["question"]] = entry_size(entry)
+        self._bytes = sum(self._sizes.values())
+
+        # El orden de desalojo se reconstruye con el último uso de cada entrada
+        self.policy = make_policy(self.policy_name, self.max_entries)
+        last_used = lambda e: e["last_hit_at"] or e.get("timestamp", 0)
+        for entry in sorted(self._index.values(), key=last_used):
+            self.policy.on_insert(entry["question"], entry["hits"])
+
+        self.similarity = new_similarity_index()
+        if self.similarity is not None:
+            self.similarity.build_in_background(
+                [(key, entry.get("original", key)) for key, entry in self._index.items()]
+            )
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Pregunta normalizada (minúsculas, números -> N): la clave del índice"""
+        return re.sub(r'\d+', 'N', question.lower().strip())
     
     def _load(self) -> Dict:
-        """Carga memoria desde archivo JSON"""
+        """Carga el snapshot JSON y reproduce el journal pendiente"""
+        memory = {"successful_queries": [], "failed_patterns": []}
         if os.path.exists(self.path):
             try:
                 with open(self.path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    memory = json.load(f)
             except Exception as e:
                 print(f"⚠️ Error cargando memoria: {e}")
-                return {"successful_queries": [], "failed_patterns": []}
-        return {"successful_queries": [], "failed_patterns": []}
-    
-    def _save(self):
-        """Guarda memoria en archivo JSON"""
+
+        self.memory = memory
+        replayed = 0
+        # .compacting existe solo si el proceso cayó a mitad de una compactación
+        for journal in (f"{self.journal_path}.compacting", self.journal_path):
+            if not os.path.exists(journal):
+                continue
+            with open(journal, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Última línea incompleta tras un fallo
+                    if record.get("op") == "add" and self._apply(record["entry"], admit=False):
+                        replayed += 1
+        if replayed:
+            print(f"📜 Journal de memoria reproducido: {replayed} consultas")
+        return self.memory
+
+    def _over_limits(self, extra_entries: int = 0, extra_bytes: int = 0) -> bool:
+        return (len(self._index) + extra_entries > self.max_entries
+                or bool(self.max_bytes) and self._bytes + extra_bytes > self.max_bytes)
+
+    def _apply(self, entry: Dict, admit: bool = True) -> bool:
+        """
+        Añade una entrada a la memoria (sin persistir) y desaloja lo que sobre.
+        False si ya existía o no quedó en memoria (rechazada por el filtro de
+        admisión, o desalojada al instante por lfu).
+        """
+        key = entry["question"]
+        if key in self._index:
+            return False
+        entry.setdefault("hits", 0)
+        entry.setdefault("last_hit_at", None)
+        size = entry_size(entry)
+        if self.max_bytes and size > self.max_bytes:
+            self.rejected += 1
+            return False
+        if admit and self._over_limits(1, size):
+            victim = self.policy.victim()
+            if victim is not None and not self.policy.admit(key, victim):
+                self.rejected += 1
+                return False
+
+        self._index[key] = entry
+        self._sizes[key] = size
+        self._bytes += size
+        self.policy.on_insert(key, entry["hits"])
+        if self.similarity is not None:
+            self.similarity.add(key, entry.get("original"))
+
+        while self._over_limits():
+            victim = self.policy.victim()
+            if victim is None:
+                break
+            self._remove(victim)
+            self.evictions += 1
+        return key in self._index
+
+    def _remove(self, key: str):
+        del self._index[key]
+        self._bytes -= self._sizes.pop(key)
+        self.policy.on_remove(key)
+        if self.similarity is not None:
+            self.similarity.remove(key)
+
+    def _touch(self, key: str, entry: Dict):
+        """Cuenta un acierto sobre la entrada (bajo _lock)"""
+        entry["hits"] += 1
+        entry["last_hit_at"] = time.time()
+        self.policy.on_hit(key, entry["hits"])
+        self._hits_dirty = True
+        self._start_writer()
+
+    def _append_journal(self, record: Dict):
+        """Escribe la línea en el buffer del journal; el fsync lo hace el hilo de fondo"""
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_lines += 1
+        self._dirty = True
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, name="memory-journal", daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self):
+        last_compaction = time.time()
+        while not self._stop.wait(self.fsync_seconds):
+            try:
+                self.flush()
+                # Los aciertos solo se guardan en el snapshot: también cuentan para la compactación periódica
+                if (self._journal_lines or self._hits_dirty) and (
+                    self._journal_lines >= self.compact_lines
+                    or time.time() - last_compaction >= self.compact_seconds
+                ):
+                    self.compact()
+                    last_compaction = time.time()
+            except Exception as e:
+                print(f"⚠️ Error persistiendo memoria: {e}")
+
+    def flush(self):
+        """flush + fsync del journal si hay líneas nuevas"""
+        with self._lock:
+            if self._journal is None or not self._dirty:
+                return
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._dirty = False
+
+    def compact(self):
+        """Escribe un snapshot nuevo (atómico) y empieza un journal vacío"""
+        with self._compact_lock:
+            # Bajo el lock solo se serializa y se rota el journal; la escritura
+            # del snapshot no bloquea a add_success
+            with self._lock:
+                snapshot = json.dumps(self.memory, indent=2, ensure_ascii=False)
+                if self._journal is not None:
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                    self._journal.close()
+                    self._journal = None
+                compacting = f"{self.journal_path}.compacting"
+                if os.path.exists(self.journal_path):
+                    os.replace(self.journal_path, compacting)
+                self._journal_lines = 0
+                self._dirty = False
+                self._hits_dirty = False
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            if os.path.exists(compacting):
+                os.remove(compacting)
+            self.last_compaction = time.time()
+
+    def close(self):
+        """Detiene el hilo de fondo y deja todo en el snapshot"""
+        self._stop.set()
         try:
-            os.makedirs(os.path.dirname(self.path), exist_ok=True)
-            with open(self.path, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, indent=2, ensure_ascii=False)
+            self.compact()
         except Exception as e:
-            print(f"⚠️ Error guardando memoria: {e}")
+            print(f"⚠️ Error compactando memoria al cerrar: {e}")
+        if self._lock_file is not None:
+            self._lock_file.close()  # libera el flock
+            self._lock_file = None
     
     def add_success(self, question: str, sql: str, tables_used: List[str]):
         """Registra una consulta exitosa"""
         # Normalizar pregunta (reemplazar números por N)
-        q_normalized = re.sub(r'\d+', 'N', question.lower().strip())
+        q_normalized = self.normalize(question)
         
         entry = {
             "question": q_normalized,
@@ -84,44 +396,536 @@ class SQLMemory:
         }
         
         # Evitar duplicados
-        if not any(e["question"] == q_normalized for e in self.memory["successful_queries"]):
-            self.memory["successful_queries"].append(entry)
-            
-            # Mantener solo las últimas 200 consultas
-            if len(self.memory["successful_queries"]) > 200:
-                self.memory["successful_queries"] = self.memory["successful_queries"][-200:]
-            
-            self._save()
-            print(f"✅ Consulta aprendida: {q_normalized}")
+        with self._lock:
+            if not self._apply(entry):
+                return
+            self._append_journal({"op": "add", "entry": entry})
+        print(f"✅ Consulta aprendida: {q_normalized}")
     
-    def get_similar(self, question: str) -> Optional[str]:
-        """Busca consulta similar en memoria"""
-        q_normalized = re.sub(r'\d+', 'N', question.lower().strip())
-        
-        for entry in self.memory["successful_queries"]:
-            if entry["question"] == q_normalized:
-                sql = entry["sql"]
-                
-                # Si la pregunta tenía números, reemplazarlos en el SQL
-                numbers = re.findall(r'\d+', question)
-                if numbers and 'LIMIT' in sql.upper():
-                    sql = re.sub(r'LIMIT\s+\d+', f'LIMIT {numbers[0]}', sql, flags=re.IGNORECASE)
-                
-                print(f"🔍 Match encontrado en memoria para: {q_normalized}")
-                return sql
+    def get_similar(self, question: str, count_hit: bool = True) -> Optional[str]:
+        """Busca consulta similar en memoria; con count_hit=False (calentamiento) no toca contadores ni frecuencias"""
+        q_normalized = self.normalize(question)
         
-        return None
+        with self._lock:
+            if count_hit:
+                self.lookups += 1
+                self.policy.record_access(q_normalized)
+            entry = self._index.get(q_normalized)
+            if entry is not None and count_hit:
+                self.hits += 1
+                self._touch(q_normalized, entry)
+        if entry is None:
+            return None
+
+        print(f"🔍 Match encontrado en memoria para: {q_normalized}")
+        return adapt_cached_sql(entry["sql"], question)
+
+    def record_hit(self, key: str):
+        """Acierto por vecino cercano (Paso 2b): cuenta como uso de la entrada `key`"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None:
+                self.near_hits += 1
+                self._touch(key, entry)
     
+    def examples(self, question: str, k: int = 3, threshold: float = MEMORY_EXAMPLE_THRESHOLD) -> List[Dict]:
+        """Consultas aprendidas más parecidas (vecinos TF-IDF), con su similitud en `score`"""
+        if self.similarity is None:
+            return []
+        return [
+            {**self._index[key], "score": round(score, 4)}
+            for key, score in self.similarity.top_k(question, k, threshold) if key in self._index
+        ]
+
+    def get_stats(self) -> Dict:
+        """Obtiene estadísticas de la memoria"""
+        return {
+            "backend": "json",
+            "similarity": self.similarity.stats() if self.similarity is not None else None,
+            "total_queries": len(self._index),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes or None,
+            "entries_size_kb": round(self._bytes / 1024, 1),
+            "eviction_policy": self.policy.name,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "cache": hit_stats(self.lookups, self.hits, self.near_hits),
+            "failed_patterns": len(self._memory.get("failed_patterns", [])),
+            "memory_size_kb": sum(
+                os.path.getsize(p) for p in (self.path, self.journal_path) if os.path.exists(p)
+            ) / 1024,
+            "journal_lines": self._journal_lines,
+            "last_compaction_seconds_ago": (
+                round(time.time() - self.last_compaction, 1) if self.last_compaction else None
+            )
+        }
+
+SQLITE_MEMORY_SCHEMA = [
+    # AUTOINCREMENT: ids siempre crecientes, para que cada worker detecte las filas nuevas (_sync_similarity)
+    """CREATE TABLE IF NOT EXISTS queries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT NOT NULL UNIQUE,
+        original TEXT NOT NULL,
+        sql TEXT NOT NULL,
+        tables TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        last_hit_at REAL,
+        size_bytes INTEGER NOT NULL DEFAULT 0
+    )""",
+]
+
+# Índices que recorre _evict según la política (mismo ORDER BY que SQLITE_EVICTION_ORDER)
+SQLITE_MEMORY_INDEXES = [
+    "DROP INDEX IF EXISTS queries_created_at",
+    "CREATE INDEX IF NOT EXISTS queries_recency ON queries(COALESCE(last_hit_at, created_at), id)",
+    "CREATE INDEX IF NOT EXISTS queries_frequency ON queries(hits, COALESCE(last_hit_at, created_at), id)",
+]
+
+# Totales compartidos por todos los workers (una fila), mantenidos por triggers
+SQLITE_MEMORY_TOTALS = [
+    """CREATE TABLE IF NOT EXISTS queries_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    )""",
+    """INSERT OR IGNORE INTO queries_totals (id, entries, bytes)
+       SELECT 1, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM queries""",
+    """CREATE TRIGGER IF NOT EXISTS queries_totals_insert AFTER INSERT ON queries BEGIN
+        UPDATE queries_totals SET entries = entries + 1, bytes = bytes + new.size_bytes WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS queries_totals_delete AFTER DELETE ON queries BEGIN
+        UPDATE queries_totals SET entries = entries - 1, bytes = bytes - old.size_bytes WHERE id = 1;
+    END""",
+]
+
+# Suma de hits para get_stats sin recorrer queries (la columna se añade en SQLiteMemory.__init__)
+SQLITE_MEMORY_HIT_TOTALS = [
+    """CREATE TRIGGER IF NOT EXISTS queries_totals_hits_insert AFTER INSERT ON queries BEGIN
+        UPDATE queries_totals SET hits = hits + new.hits WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS queries_totals_hits_update AFTER UPDATE OF hits ON queries BEGIN
+        UPDATE queries_totals SET hits = hits + new.hits - old.hits WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS queries_totals_hits_delete AFTER DELETE ON queries BEGIN
+        UPDATE queries_totals SET hits = hits - old.hits WHERE id = 1;
+    END""",
+]
+
+SQLITE_EVICTION_ORDER = {
+    "lru": "COALESCE(last_hit_at, created_at), id",
+    "lfu": "hits, COALESCE(last_hit_at, created_at), id",
+    "tinylfu": "COALESCE(last_hit_at, created_at), id",
+}
+
+# Índice de texto externo (content=queries) sincronizado por triggers
+SQLITE_MEMORY_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS queries_fts USING fts5(
+        question, content='queries', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS queries_fts_insert AFTER INSERT ON queries BEGIN
+        INSERT INTO queries_fts(rowid, question) VALUES (new.id, new.question);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS queries_fts_delete AFTER DELETE ON queries BEGIN
+        INSERT INTO queries_fts(queries_fts, rowid, question) VALUES ('delete', old.id, old.question);
+    END""",
+]
+
+class SQLiteMemory:
+    """
+    Memoria en SQLite con la misma interfaz que SQLMemory.
+    - Búsqueda exacta por la columna indexada `question` (pregunta normalizada);
+      en RAM solo queda la caché de páginas de SQLite, no la memoria completa.
+    - queries_fts (FTS5) indexa el texto para recuperar preguntas parecidas (search).
+    - Cada acierto suma hits y actualiza last_hit_at; el desalojo recorre el
+      índice de la política (recencia o frecuencia). Con tinylfu el sketch de
+      frecuencias vive en RAM y se reinicia con el proceso.
+
+    Es el modo compartido para varios workers de uvicorn: todos abren la misma
+    base (WAL: lecturas concurrentes sin bloqueo) y ven al instante lo que
+    aprende cualquiera. Las escrituras van en transacciones BEGIN IMMEDIATE,
+    serializadas entre hilos (_write_lock) y entre procesos (bloqueo de SQLite);
+    los totales para los límites viven en queries_totals, no en cada proceso.
+    El índice TF-IDF es local a cada worker y se pone al día leyendo las filas
+    con id mayor que la última vista. Los contadores de aciertos de `cache`
+    (hit_rate) son del worker que responde; `total_hits` es global.
+    """
+
+    def __init__(self, path: str, max_entries: int = MEMORY_MAX_ENTRIES,
+                 max_bytes: int = MEMORY_MAX_BYTES, policy: str = MEMORY_EVICTION_POLICY):
+        if policy not in SQLITE_EVICTION_ORDER:
+            raise ValueError(f"Política de desalojo desconocida: {policy} (opciones: {', '.join(SQLITE_EVICTION_ORDER)})")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy_name = policy
+        self._order = SQLITE_EVICTION_ORDER[policy]
+        self.sketch = FrequencySketch(max_entries) if policy == "tinylfu" else None
+        self.lookups = self.hits = self.near_hits = 0
+        self.evictions = self.rejected = 0
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_id = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Varios workers arrancan a la vez: el esquema y las migraciones en una sola transacción
+        with self._write() as conn:
+            for stmt in SQLITE_MEMORY_SCHEMA:
+                conn.execute(stmt)
+            # Bases creadas antes de existir size_bytes: tamaño estimado de las filas existentes
+            if "size_bytes" not in {row[1] for row in conn.execute("PRAGMA table_info(queries)")}:
+                conn.execute("ALTER TABLE queries ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    "UPDATE queries SET size_bytes = 100 + length(CAST(question || original || sql || tables AS BLOB))"
+                )
+            for stmt in SQLITE_MEMORY_INDEXES + SQLITE_MEMORY_TOTALS:
+                conn.execute(stmt)
+            if "hits" not in {row[1] for row in conn.execute("PRAGMA table_info(queries_totals)")}:
+                conn.execute("ALTER TABLE queries_totals ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE queries_totals SET hits = (SELECT COALESCE(SUM(hits), 0) FROM queries)")
+            for stmt in SQLITE_MEMORY_HIT_TOTALS:
+                conn.execute(stmt)
+            try:
+                had_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'queries_fts'").fetchone()
+                for stmt in SQLITE_MEMORY_FTS:
+                    conn.execute(stmt)
+                if not had_fts:
+                    # Índice nuevo sobre filas existentes: poblarlo (si no, los triggers de borrado lo corrompen)
+                    conn.execute("INSERT INTO queries_fts(queries_fts) VALUES ('rebuild')")
+                self.fts_enabled = True
+            except sqlite3.OperationalError as e:
+                # SQLite compilado sin FTS5: siguen funcionando las búsquedas exactas
+                print(f"⚠️ FTS5 no disponible, memoria sin búsqueda por similitud: {e}")
+                self.fts_enabled = False
+        self.similarity = new_similarity_index()
+        if self.similarity is not None:
+            rows = conn.execute("SELECT id, question, original FROM queries ORDER BY id").fetchall()
+            self._synced_id = rows[-1][0] if rows else 0
+            self.similarity.build_in_background([(question, original) for _, question, original in rows])
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Transacción de escritura serializada entre hilos y entre workers"""
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _totals(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """(consultas, bytes) de la memoria compartida"""
+        return conn.execute("SELECT entries, bytes FROM queries_totals WHERE id = 1").fetchone()
+
+    def _over_limits(self, conn: sqlite3.Connection, extra_entries: int = 0, extra_bytes: int = 0) -> bool:
+        count, size = self._totals(conn)
+        return (count + extra_entries > self.max_entries
+                or bool(self.max_bytes) and size + extra_bytes > self.max_bytes)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Desaloja en el orden de la política hasta volver a max_entries y max_bytes"""
+        count, size = self._totals(conn)
+        excess = count - self.max_entries
+        if excess <= 0 and not (self.max_bytes and size > self.max_bytes):
+            return
+        victims: List[Tuple[int, str]] = []
+        freed = 0
+        cur = conn.execute(f"SELECT id, question, size_bytes FROM queries ORDER BY {self._order}")
+        for row_id, question, row_size in cur:
+            if len(victims) >= excess and not (self.max_bytes and size - freed > self.max_bytes):
+                break
+            victims.append((row_id, question))
+            freed += row_size
+        cur.close()
+        conn.executemany("DELETE FROM queries WHERE id = ?", [(row_id,) for row_id, _ in victims])
+        if self.similarity is not None:
+            for _, question in victims:
+                self.similarity.remove(question)
+        self.evictions += len(victims)
+
+    def _admit(self, conn: sqlite3.Connection, question: str) -> bool:
+        """Filtro de admisión de tinylfu: la nueva pregunta debe ser más frecuente que la víctima"""
+        if self.sketch is None:
+            return True
+        victim = conn.execute(f"SELECT question FROM queries ORDER BY {self._order} LIMIT 1").fetchone()
+        return victim is None or self.sketch.frequency(question) > self.sketch.frequency(victim[0])
+
+    def _sync_similarity(self):
+        """Añade al índice TF-IDF las filas nuevas (de este worker o de otros)"""
+        with self._sync_lock:
+            rows = self._conn().execute(
+                "SELECT id, question, original FROM queries WHERE id > ? ORDER BY id", (self._synced_id,)
+            ).fetchall()
+            if not rows:
+                return
+            self._synced_id = rows[-1][0]
+            if len(rows) == 1:
+                self.similarity.add(rows[0][1], rows[0][2])
+            else:
+                self.similarity.add_many((question, original) for _, question, original in rows)
+
+    def import_entries(self, entries: List[Dict], if_empty: bool = False) -> int:
+        """
+        Carga masiva de entradas con el formato de successful_queries (migración desde JSON).
+        Con if_empty solo se importa si la memoria sigue vacía dentro de la transacción
+        (varios workers arrancando a la vez importan una sola vez).
+        """
+        rows = [
+            (e["question"], e.get("original", e["question"]), e["sql"],
+             json.dumps(e.get("tables", []), ensure_ascii=False), e.get("timestamp", time.time()),
+             e.get("hits", 0), e.get("last_hit_at"), entry_size(e))
+            for e in entries
+        ]
+        with self._write() as conn:
+            before = self._totals(conn)[0]
+            if if_empty and before:
+                return 0
+            conn.executemany(
+                """INSERT OR IGNORE INTO queries (question, original, sql, tables, created_at, hits, last_hit_at, size_bytes)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            imported = self._totals(conn)[0] - before
+            self._evict(conn)
+        if self.similarity is not None:
+            self._sync_similarity()
+        return imported
+
+    def add_success(self, question: str, sql: str, tables_used: List[str]):
+        """Registra una consulta exitosa"""
+        q_normalized = SQLMemory.normalize(question)
+        entry = {
+            "question": q_normalized,
+            "original": question.lower(),
+            "sql": sql,
+            "tables": tables_used,
+            "timestamp": time.time(),
+            "hits": 0,
+            "last_hit_at": None
+        }
+        size = entry_size(entry)
+        with self._write() as conn:
+            if self._over_limits(conn, 1, size) and (
+                (self.max_bytes and size > self.max_bytes) or not self._admit(conn, q_normalized)
+            ):
+                if not conn.execute("SELECT 1 FROM queries WHERE question = ?", (q_normalized,)).fetchone():
+                    self.rejected += 1
+                return
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO queries (question, original, sql, tables, created_at, size_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                (q_normalized, entry["original"], sql, json.dumps(tables_used, ensure_ascii=False), entry["timestamp"], size)
+            )
+            if cur.rowcount:
+                self._evict(conn)
+        if cur.rowcount:
+            if self.similarity is not None:
+                self._sync_similarity()
+            print(f"✅ Consulta aprendida: {q_normalized}")
+
+    def get_similar(self, question: str, count_hit: bool = True) -> Optional[str]:
+        """Busca la consulta con la misma pregunta normalizada; con count_hit=False (calentamiento) solo lee"""
+        q_normalized = SQLMemory.normalize(question)
+        conn = self._conn()
+        if count_hit:
+            with self._write_lock:
+                self.lookups += 1
+                if self.sketch is not None:
+                    self.sketch.increment(q_normalized)
+        row = conn.execute("SELECT id, sql FROM queries WHERE question = ?", (q_normalized,)).fetchone()
+        if row is None:
+            return None
+        if count_hit:
+            with self._write_lock:
+                self.hits += 1
+                conn.execute("UPDATE queries SET hits = hits + 1, last_hit_at = ? WHERE id = ?", (time.time(), row[0]))
+        print(f"🔍 Match encontrado en memoria para: {q_normalized}")
+        return adapt_cached_sql(row[1], question)
+
+    def record_hit(self, key: str):
+        """Acierto por vecino cercano (Paso 2b): cuenta como uso de la entrada `key`"""
+        with self._write_lock:
+            self.near_hits += 1
+            self._conn().execute(
+                "UPDATE queries SET hits = hits + 1, last_hit_at = ? WHERE question = ?", (time.time(), key)
+            )
+
+    def search(self, question: str, limit: int = 5) -> List[Dict]:
+        """Preguntas aprendidas más parecidas (FTS5, ordenadas por bm25)"""
+        if not self.fts_enabled:
+            return []
+        terms = re.findall(r"\w+", SQLMemory.normalize(question))
+        if not terms:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        rows = self._conn().execute(
+            """SELECT q.question, q.sql, q.tables, q.hits, bm25(queries_fts) AS rank
+               FROM queries_fts JOIN queries q ON q.id = queries_fts.rowid
+               WHERE queries_fts MATCH ? ORDER BY rank LIMIT ?""",
+            (match, limit)
+        ).fetchall()
+        return [
+            {"question": r[0], "sql": r[1], "tables": json.loads(r[2]), "hits": r[3], "score": round(-r[4], 4)}
+            for r in rows
+        ]
+
+    def examples(self, question: str, k: int = 3, threshold: float = MEMORY_EXAMPLE_THRESHOLD) -> List[Dict]:
+        """Consultas aprendidas más parecidas (vecinos TF-IDF), con su similitud en `score`"""
+        if self.similarity is None:
+            return []
+        self._sync_similarity()
+        scores = dict(self.similarity.top_k(question, k, threshold))
+        if not scores:
+            return []
+        rows = self._conn().execute(
+            f"SELECT question, original, sql, tables, created_at FROM queries WHERE question IN ({', '.join('?' * len(scores))})",
+            list(scores)
+        ).fetchall()
+        found = [
+            {"question": r[0], "original": r[1], "sql": r[2], "tables": json.loads(r[3]),
+             "timestamp": r[4], "score": round(scores[r[0]], 4)}
+            for r in rows
+        ]
+        return sorted(found, key=lambda e: -e["score"])
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
     def get_stats(self) -> Dict:
         """Obtiene estadísticas de la memoria"""
+        conn = self._conn()
+        count, size, hits = conn.execute("SELECT entries, bytes, hits FROM queries_totals WHERE id = 1").fetchone()
         return {
-            "total_queries": len(self.memory["successful_queries"]),
-            "failed_patterns": len(self.memory.get("failed_patterns", [])),
-            "memory_size_kb": os.path.getsize(self.path) / 1024 if os.path.exists(self.path) else 0
+            "backend": "sqlite",
+            "worker_pid": os.getpid(),
+            "total_queries": count,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes or None,
+            "entries_size_kb": round(size / 1024, 1),
+            "eviction_policy": self.policy_name,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "cache": hit_stats(self.lookups, self.hits, self.near_hits),
+            "fts_enabled": self.fts_enabled,
+            "similarity": self.similarity.stats() if self.similarity is not None else None,
+            "total_hits": hits,
+            "memory_size_kb": sum(
+                os.path.getsize(p) for p in (self.path, f"{self.path}-wal") if os.path.exists(p)
+            ) / 1024
         }
 
+def create_memory():
+    """
+    Memoria según MEMORY_BACKEND; la primera vez con sqlite se importa la memoria JSON existente.
+    La memoria JSON es de un solo proceso: con varios workers (WEB_CONCURRENCY) se usa sqlite,
+    y también si el flock de memory.json ya lo tiene otro proceso (p. ej. `uvicorn --workers N`
+    sin WEB_CONCURRENCY), en lugar de fallar al arrancar el worker.
+    """
+    backend = MEMORY_BACKEND
+    if backend == "json" and WORKERS > 1:
+        print(f"⚠️ MEMORY_BACKEND=json no se comparte entre {WORKERS} workers: usando sqlite ({MEMORY_DB})")
+        backend = "sqlite"
+    if backend == "json":
+        try:
+            return SQLMemory(MEMORY_FILE)
+        except RuntimeError as e:
+            print(f"⚠️ {e}. Este proceso usa sqlite ({MEMORY_DB}); define MEMORY_BACKEND=sqlite para todos los workers")
+    store = SQLiteMemory(MEMORY_DB)
+    if store.get_stats()["total_queries"] == 0 and os.path.exists(MEMORY_FILE):
+        legacy = SQLMemory(MEMORY_FILE, exclusive=False)
+        imported = store.import_entries(legacy.memory["successful_queries"], if_empty=True)
+        if imported:
+            print(f"📥 Memoria JSON importada a SQLite: {imported} consultas")
+    return store
+
 # Instancia global de memoria
-memory = SQLMemory(MEMORY_FILE)
+memory = create_memory()
+
+@app.on_event("shutdown")
+def close_memory():
+    """Vuelca el journal al snapshot al detener el servicio"""
+    memory.close()
+
+# ============================================================================
+# CATÁLOGO COMPILADO
+# ============================================================================
+CATALOG_MAGIC = b"AGROCAT\0"
+CATALOG_FORMAT_VERSION = 1
+CATALOG_HEADER = struct.Struct(">8sI")
+
+class CompiledCatalog:
+    """
+    Tablas ya parseadas del catálogo compilado (ver api/conector/catalog_artifact.py).
+    Si la huella (sha256) del schema_text recibido es la del texto compilado,
+    se reutilizan sus tablas en vez de llamar a parse_schema().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = None
+        self.text_sha256 = None
+        self.tables: Optional[Dict] = None
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.tables, self.text_sha256, self.mtime = None, None, None
+            return
+        if mtime == self.mtime:
+            return
+        with self._lock:
+            if mtime == self.mtime:
+                return
+            try:
+                with open(self.path, "rb") as f:
+                    magic, version = CATALOG_HEADER.unpack(f.read(CATALOG_HEADER.size))
+                    if magic != CATALOG_MAGIC or version != CATALOG_FORMAT_VERSION:
+                        raise ValueError(f"formato incompatible (v{version})")
+                    artifact = pickle.load(f)
+                self.tables = artifact["prompt_tables"]
+                self.text_sha256 = artifact["schema_text_sha256"]
+                print(f"📦 Catálogo compilado cargado: {len(self.tables)} tablas ({self.path})")
+            except Exception as e:
+                print(f"⚠️ Catálogo compilado ignorado: {e}")
+                self.tables, self.text_sha256 = None, None
+            self.mtime = mtime
+
+    def tables_for(self, fingerprint: str) -> Optional[Dict]:
+        """Tablas precompiladas si la huella coincide con la del schema_text del artefacto; None si no"""
+        if not self.path:
+            return None
+        self._reload_if_changed()
+        if self.tables is None or fingerprint != self.text_sha256:
+            return None
+        self.hits += 1
+        return self.tables
+
+    def get_stats(self) -> Dict:
+        return {
+            "path": self.path or None,
+            "loaded": self.tables is not None,
+            "tables": len(self.tables) if self.tables else 0,
+            "hits": self.hits,
+        }
+
+compiled_catalog = CompiledCatalog(CATALOG_ARTIFACT_PATH)
 
 # ============================================================================
 # PARSER DE ESQUEMA
@@ -164,78 +968,84 @@ def parse_schema(schema_text: str) -> Dict[str, dict]:
     
     return tables
 
+class SchemaCache:
+    """
+    Esquemas parseados por huella (sha256 del schema_text), en un LRU pequeño:
+    el conector envía casi siempre el mismo texto y no hace falta volver a
+    parsearlo. Una vez visto un esquema basta con enviar su huella
+    (schema_fingerprint); si no está en caché (reinicio, desalojo u otro
+    worker) se responde 409 y el cliente reenvía el texto completo.
+    El catálogo compilado se consulta antes que el LRU.
+    """
+
+    def __init__(self, capacity: int = SCHEMA_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.unknown = 0
+
+    @staticmethod
+    def fingerprint(schema_text: str) -> str:
+        return hashlib.sha256(schema_text.encode("utf-8")).hexdigest()
+
+    def resolve(self, schema_text: Optional[str], fingerprint: Optional[str]) -> Tuple[Optional[Dict], str, str]:
+        """(tablas, huella, origen); tablas None si solo llegó una huella que no está en caché"""
+        if schema_text is not None:
+            fingerprint = self.fingerprint(schema_text)
+
+        tables = compiled_catalog.tables_for(fingerprint)
+        if tables is not None:
+            return tables, fingerprint, "compiled_catalog"
+
+        with self._lock:
+            tables = self._entries.get(fingerprint)
+            if tables is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return tables, fingerprint, "cache"
+            if schema_text is None:
+                self.unknown += 1
+                return None, fingerprint, "unknown"
+            self.misses += 1
+
+        tables = parse_schema(schema_text)
+        if tables:
+            with self._lock:
+                self._entries[fingerprint] = tables
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return tables, fingerprint, "parsed"
+
+    def get_stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unknown_fingerprints": self.unknown,
+        }
+
+schema_cache = SchemaCache()
+
 # ============================================================================
-# MAPEO DE PALABRAS CLAVE A TABLAS
+# PALABRAS CLAVE (common/keyword_matcher.py)
 # ============================================================================
-KEYWORD_MAP = {
-    # Compradores/Clientes
-    ("comprador", "compradores", "buyer", "cliente", "clientes", "customer", "customers"): 
-        "commerce_buyer",
-    
-    # Facturas
-    ("factura", "facturas", "invoice", "invoices"): 
-        "commerce_invoice",
-    
-    # Listados/Publicaciones
-    ("listado", "listados", "listing", "listings", "publicacion", "publicaciones"): 
-        "commerce_listing",
-    
-    # Ofertas
-    ("oferta", "ofertas", "bid", "bids", "puja", "pujas"): 
-        "commerce_bid",
-    
-    # Trabajadores
-    ("trabajador", "trabajadores", "worker", "workers", "empleado", "empleados"): 
-        "commerce_worker",
-    
-    # Deudas
-    ("deuda", "deudas", "debt", "debts", "debe", "deben"): 
-        "commerce_workerdebt",
-    
-    # Pagos
-    ("pago", "pagos", "payment", "payments", "abono", "abonos"): 
-        "commerce_workerpayment",
-    
-    # Cultivos
-    ("cultivo", "cultivos", "crop", "crops", "siembra", "siembras"): 
-        "farm_crop",
-    
-    # Producción
-    ("produccion", "producción", "production", "cosecha", "cosechas"): 
-        "farm_production",
-    
-    # Fincas
-    ("finca", "fincas", "farm", "farms", "terreno", "terrenos", "predio"): 
-        "farm_farm",
-    
-    # Herramientas
-    ("herramienta", "herramientas", "tool", "tools", "equipo", "equipos"): 
-        "farm_tool",
-    
-    # Ingresos
-    ("ingreso", "ingresos", "income", "incomes", "ganancia", "ganancias"): 
-        "farm_income",
-    
-    # Costos/Gastos
-    ("costo", "costos", "gasto", "gastos", "cost", "costs", "expense", "expenses"): 
-        "farm_cost",
-    
-    # Usuarios
-    ("usuario", "usuarios", "user", "users"): 
-        "users_user",
-    
-    # Precios de mercado
-    ("precio", "precios", "price", "prices", "mercado"): 
-        "commerce_marketprice",
-}
+# TABLE_KEYWORDS: sufijo de tabla -> keywords; INTENT_KEYWORDS: patrones del
+# motor de reglas; PERIOD_KEYWORDS: grano de date_trunc. Una sola pasada del
+# autómata por pregunta (match_question) da las tres cosas.
+
+def question_constraints(question: str) -> Tuple:
+    """Lo que un vecino de memoria debe compartir con la pregunta: números literales y agrupación temporal"""
+    period = first_label(match_question(question)["period"], PERIOD_KEYWORDS)
+    return tuple(re.findall(r'\d+', question)), period
 
 def find_table(question: str, available_tables: List[str]) -> Optional[str]:
     """Encuentra la tabla más relevante para la pregunta"""
-    q_lower = question.lower()
+    entities = match_question(question)["entity"]
     
-    # Buscar por keywords mapeadas
-    for keywords, table_suffix in KEYWORD_MAP.items():
-        if any(kw in q_lower for kw in keywords):
+    # Buscar por keywords mapeadas (en orden de TABLE_KEYWORDS)
+    for table_suffix in TABLE_KEYWORDS:
+        if table_suffix in entities:
             for full_table in available_tables:
                 if table_suffix in full_table:
                     return full_table
@@ -257,7 +1067,8 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     - Promedio: promedio, media, average
     - Máximo/Mínimo: mayor, menor, máximo, mínimo
     """
-    q_lower = question.lower()
+    matched = match_question(question)
+    intents = matched["intent"]
     available_tables = list(tables.keys())
     
     # Encontrar tabla objetivo
@@ -271,16 +1082,13 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     # ========================================
     # PATRÓN 1: CONTAR
     # ========================================
-    if any(kw in q_lower for kw in [
-        "cuántos", "cuantos", "cuántas", "cuantas", "cantidad", 
-        "número", "numero", "how many", "count"
-    ]):
+    if "count" in intents:
         return f"SELECT COUNT(*) AS total FROM {target_table}"
     
     # ========================================
     # PATRÓN 2: SUMAR/TOTAL
     # ========================================
-    if any(kw in q_lower for kw in ["total", "suma", "sum", "sumar"]):
+    if "sum" in intents:
         # Buscar columnas numéricas
         numeric_cols = [
             col["name"] for col in table_info["columns"] 
@@ -296,6 +1104,16 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
                 money_col = col
                 break
         
+        # "por mes / por semana / por día / por año": serie temporal agrupada
+        measures = [c for c in numeric_cols if c != "id" and not c.endswith("_id")]
+        sum_col = money_col or (measures[0] if measures else None)
+        period = first_label(matched["period"], PERIOD_KEYWORDS)
+        if sum_col and period and "date" in columns:
+            return (
+                f"SELECT date_trunc('{period}', date) AS periodo, SUM({sum_col}) AS total "
+                f"FROM {target_table} GROUP BY 1 ORDER BY 1"
+            )
+
         if money_col:
             return f"SELECT SUM({money_col}) AS total FROM {target_table}"
         elif numeric_cols:
@@ -307,7 +1125,7 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     # ========================================
     # PATRÓN 3: PROMEDIO
     # ========================================
-    if any(kw in q_lower for kw in ["promedio", "media", "average", "avg"]):
+    if "avg" in intents:
         numeric_cols = [
             col["name"] for col in table_info["columns"] 
             if any(t in col["type"] for t in ["int", "decimal", "numeric", "float"])
@@ -318,10 +1136,7 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     # ========================================
     # PATRÓN 4: LISTAR/MOSTRAR
     # ========================================
-    if any(kw in q_lower for kw in [
-        "muestra", "lista", "dame", "ver", "show", "list", 
-        "enséñame", "ensename", "primeros", "top"
-    ]):
+    if "list" in intents:
         # Buscar límite numérico en la pregunta (ej: "los primeros 5")
         limit_match = re.search(r'(\d+)', question)
         limit = int(limit_match.group(1)) if limit_match else 10
@@ -359,9 +1174,7 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     # ========================================
     # PATRÓN 5: MÁXIMO
     # ========================================
-    if any(kw in q_lower for kw in [
-        "mayor", "máximo", "maximo", "max", "más alto", "mas alto", "highest"
-    ]):
+    if "max" in intents:
         numeric_cols = [
             col["name"] for col in table_info["columns"] 
             if any(t in col["type"] for t in ["int", "decimal", "numeric", "float"])
@@ -372,9 +1185,7 @@ def generate_sql(question: str, tables: Dict[str, dict]) -> str:
     # ========================================
     # PATRÓN 6: MÍNIMO
     # ========================================
-    if any(kw in q_lower for kw in [
-        "menor", "mínimo", "minimo", "min", "más bajo", "mas bajo", "lowest"
-    ]):
+    if "min" in intents:
         numeric_cols = [
             col["name"] for col in table_info["columns"] 
             if any(t in col["type"] for t in ["int", "decimal", "numeric", "float"])
@@ -409,9 +1220,23 @@ def health():
             "avg_response_time_ms": "<10",
             "ram_usage_mb": "~5"
         },
-        "memory": stats
+        "memory": stats,
+        "compiled_catalog": compiled_catalog.get_stats(),
+        "schema_cache": schema_cache.get_stats()
     }
 
+@app.get("/memory/search")
+def memory_search(q: str, limit: int = 5):
+    """
+    Consultas aprendidas parecidas a `q` (p. ej. ejemplos few-shot): vecinos TF-IDF
+    si MEMORY_SIMILARITY_ENABLED, si no FTS5 del backend sqlite
+    """
+    if memory.similarity is not None:
+        return {"query": q, "method": "tfidf", "results": memory.examples(q, k=limit)}
+    if not hasattr(memory, "search"):
+        raise HTTPException(status_code=501, detail="El backend de memoria no soporta búsqueda por similitud")
+    return {"query": q, "method": "fts5", "results": memory.search(q, limit=limit)}
+
 @app.post("/warmup")
 def warmup():
     """Pre-calentamiento (no necesario en modo ligero)"""
@@ -422,22 +1247,44 @@ def warmup():
         "message": "No warmup needed - instant response"
     }
 
+def deadline_expired(x_deadline_ms: Optional[int], start_time: float) -> bool:
+    """True si el presupuesto enviado por el conector (X-Deadline-Ms) ya se consumió"""
+    if x_deadline_ms is None:
+        return False
+    return (time.time() - start_time) * 1000 >= x_deadline_ms
+
 @app.post("/generate_sql", response_model=SQLOut)
-def generate_sql_endpoint(data: SQLIn):
+def generate_sql_endpoint(
+    data: SQLIn,
+    x_deadline_ms: Optional[int] = Header(default=None),
+    x_warmup: Optional[str] = Header(default=None)
+):
     """
     Endpoint principal para generar SQL
     
     Flujo:
     1. Buscar en memoria (caché)
-    2. Parsear esquema
+    2. Resolver el esquema por su huella (catálogo compilado, caché de parseos o parsear)
     3. Generar SQL con reglas
-    4. Retornar resultado
+    4. Retornar resultado (con schema_fingerprint)
+
+    Si solo llega schema_fingerprint y no está en caché se responde 409
+    (error "schema_unknown"): el cliente debe reenviar schema_text.
+
+    Si el conector envía X-Deadline-Ms y el presupuesto ya se agotó, se
+    responde 504 sin generar (el cliente ya no esperará la respuesta).
+
+    Con X-Warmup (reproducción del calentamiento del conector) los aciertos en
+    memoria no se cuentan: no suben hits, LRU ni el sketch TinyLFU.
     """
     start_time = time.time()
+    count_hit = (x_warmup or "").lower() not in ("1", "true", "yes")
+    if deadline_expired(x_deadline_ms, start_time):
+        raise HTTPException(status_code=504, detail="Deadline agotado antes de generar SQL")
     
     try:
         # Paso 1: Buscar en memoria primero
-        cached_sql = memory.get_similar(data.question)
+        cached_sql = memory.get_similar(data.question, count_hit=count_hit)
         if cached_sql:
             execution_time = (time.time() - start_time) * 1000
             return SQLOut(
@@ -449,11 +1296,47 @@ def generate_sql_endpoint(data: SQLIn):
                 }
             )
         
-        # Paso 2: Parsear esquema
-        tables = parse_schema(data.schema_text)
+        # Paso 2: Esquema por huella: catálogo compilado, caché de parseos o parsear el texto
+        if data.schema_text is None and not data.schema_fingerprint:
+            raise HTTPException(status_code=422, detail="Se requiere schema_text o schema_fingerprint")
+        tables, fingerprint, schema_source = schema_cache.resolve(data.schema_text, data.schema_fingerprint)
+        if tables is None:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "error": "schema_unknown",
+                    "message": "Huella de esquema desconocida: reenviar schema_text",
+                    "schema_fingerprint": fingerprint
+                }
+            )
         
         if not tables:
             raise ValueError("No se pudieron parsear tablas del esquema")
+
+        # Paso 2b: vecino cercano en memoria ("cuántos compradores tenemos" ~ "cuántos compradores hay"),
+        # solo si apunta a la misma tabla que elegirían las reglas y con los mismos números/periodo
+        if memory.similarity is not None:
+            near = memory.examples(data.question, k=1, threshold=MEMORY_SIMILARITY_THRESHOLD)
+            if (near and find_table(data.question, list(tables.keys())) in near[0]["tables"]
+                    and question_constraints(data.question) == question_constraints(near[0]["original"])):
+                execution_time = (time.time() - start_time) * 1000
+                print(f"🧲 Vecino en memoria ({near[0]['score']:.2f}): {near[0]['question']}")
+                if count_hit:
+                    memory.record_hit(near[0]["question"])
+                return SQLOut(
+                    sql=adapt_cached_sql(near[0]["sql"], data.question),
+                    source="memory_similar",
+                    schema_fingerprint=fingerprint,
+                    debug_info={
+                        "execution_time_ms": round(execution_time, 2),
+                        "cache_hit": True,
+                        "similar_question": near[0]["question"],
+                        "similarity": near[0]["score"]
+                    }
+                )
+
+        if deadline_expired(x_deadline_ms, start_time):
+            raise HTTPException(status_code=504, detail="Deadline agotado durante la generación")
         
         # Paso 3: Generar SQL con reglas
         sql = generate_sql(data.question, tables)
@@ -468,14 +1351,18 @@ def generate_sql_endpoint(data: SQLIn):
         return SQLOut(
             sql=sql,
             source="rule_engine",
+            schema_fingerprint=fingerprint,
             debug_info={
                 "tables_available": len(tables),
+                "schema_source": schema_source,
                 "method": "pattern_matching",
                 "execution_time_ms": round(execution_time, 2),
                 "cache_hit": False
             }
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error generando SQL: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -521,7 +1408,7 @@ if __name__ == "__main__":
     print(f"📍 Puerto: {PORT}")
     print(f"💾 Memoria: {MEMORY_FILE}")
     print(f"⚡ Modo: Reglas + Caché (sin ML)")
-    print(f"🎯 Consultas aprendidas: {len(memory.memory['successful_queries'])}")
+    print(f"🎯 Consultas aprendidas: {memory.get_stats()['total_queries']} (backend {MEMORY_BACKEND})")
     print("=" * 60)
     
     uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from threading import Lock
 import os, re, torch, json, time
 
+from similarity_index import NgramIndex, similarity_available
+
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
@@ -16,6 +18,7 @@ MODEL_NAME = os.getenv("SQLCODER_MODEL", "defog/sqlcoder-7b-2")
 TITLE = "SQLCoder 7B-2 (PostgreSQL) - Enhanced"
 PORT = int(os.getenv("PORT", "8001"))
 MEMORY_FILE = os.getenv("MEMORY_FILE", "/workspace/sqlcoder_7b_2/memory.json")
+EXAMPLE_THRESHOLD = float(os.getenv("MEMORY_EXAMPLE_THRESHOLD", "0.3"))  # Similitud mínima de ejemplos few-shot
 
 # Sugerencias para reducir RAM/CPU (ajústalas según tu máquina)
 os.environ.setdefault("HF_HOME", "/workspace/.cache/hf")
@@ -45,6 +48,10 @@ class SQLMemory:
     def __init__(self, path: str):
         self.path = path
         self.memory = self._load()
+        # Ejemplos few-shot por TF-IDF de n-gramas (si numpy/scipy están instalados)
+        self.similarity = NgramIndex() if similarity_available() else None
+        if self.similarity is not None:
+            self.similarity.add_many((e["question"], e["question"]) for e in self.memory["successful_queries"])
 
     def _load(self):
         if os.path.exists(self.path):
@@ -64,7 +71,12 @@ class SQLMemory:
         entry = {"question": question.lower(), "sql": sql, "tables": tables_used}
         if not any(e["question"] == entry["question"] for e in self.memory["successful_queries"]):
             self.memory["successful_queries"].append(entry)
+            if self.similarity is not None:
+                self.similarity.add(entry["question"])
             if len(self.memory["successful_queries"]) > 50:
+                if self.similarity is not None:
+                    for old in self.memory["successful_queries"][:-50]:
+                        self.similarity.remove(old["question"])
                 self.memory["successful_queries"] = self.memory["successful_queries"][-50:]
             self._save()
 
@@ -76,6 +88,12 @@ class SQLMemory:
             self._save()
 
     def get_similar_examples(self, question: str, limit: int = 3) -> List[dict]:
+        if self.similarity is not None:
+            by_question = {e["question"]: e for e in self.memory["successful_queries"]}
+            return [
+                by_question[key] for key, _ in self.similarity.top_k(question, limit, EXAMPLE_THRESHOLD)
+                if key in by_question
+            ]
         q_lower = question.lower()
         q_words = set(re.findall(r'\w+', q_lower))
         scored = []
@@ -276,11 +294,19 @@ def warmup():
     return {"status": "ready", "model_loaded": _model is not None}
 
 @app.post("/generate_sql")
-def generate_sql(data: SQLIn):
+def generate_sql(data: SQLIn, x_deadline_ms: Optional[int] = Header(default=None)):
+    # El conector envía el presupuesto restante; la generación se corta al agotarse
+    received_at = time.time()
     ensure_model()
     if _model is None or _loading:
         raise HTTPException(status_code=503, detail="Modelo cargando, intenta en unos segundos")
 
+    max_time = None
+    if x_deadline_ms is not None:
+        max_time = x_deadline_ms / 1000 - (time.time() - received_at)
+        if max_time <= 0:
+            raise HTTPException(status_code=504, detail="Deadline agotado antes de generar SQL")
+
     prompt = build_prompt(data.question, data.schema_text, data.lang, data.feedback)
     enc = _tokenizer(prompt, return_tensors="pt", truncation=True, max_length=4096)
 
@@ -292,6 +318,7 @@ def generate_sql(data: SQLIn):
         out = _model.generate(
             **enc,
             max_new_tokens=data.max_new_tokens,
+            max_time=max_time,
             do_sample=False,
             temperature=1e-5,
             top_p=1.0,
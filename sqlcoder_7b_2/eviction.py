@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Políticas de desalojo de la memoria de SQLCoder.
+
+- lru: sale la entrada usada (acertada o aprendida) hace más tiempo.
+- lfu: sale la de menos aciertos; a igualdad, la menos reciente.
+- tinylfu: víctima por LRU, pero una entrada nueva solo se admite si su
+  frecuencia estimada (sketch count-min con envejecimiento, alimentado por
+  todas las búsquedas, acierten o no) supera la de la víctima. Una ráfaga de
+  preguntas raras no desplaza a las de mucho tráfico.
+
+Cada política lleva solo el orden de desalojo; los datos viven en el backend.
+"""
+
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+POLICIES = ("lru", "lfu", "tinylfu")
+
+
+class FrequencySketch:
+    """
+    Count-min sketch de 4 filas con contadores de 4 bits (tope 15). Tras
+    `sample_size` incrementos se dividen todos a la mitad, para que la
+    frecuencia refleje el tráfico reciente. Ancho de 4x la capacidad: también
+    se cuentan preguntas que nunca entran en memoria.
+    """
+
+    DEPTH = 4
+
+    def __init__(self, capacity: int):
+        width = 1
+        while width < 4 * max(16, capacity):
+            width <<= 1
+        self.mask = width - 1
+        self.rows = [bytearray(width) for _ in range(self.DEPTH)]
+        self.sample_size = 10 * max(16, capacity)
+        self.additions = 0
+
+    def _slots(self, key: str):
+        for seed, row in enumerate(self.rows):
+            yield row, hash((seed, key)) & self.mask
+
+    def increment(self, key: str):
+        slots = list(self._slots(key))
+        least = min(row[i] for row, i in slots)
+        if least >= 15:
+            return
+        # Incremento conservador: solo los contadores que están en el mínimo
+        for row, i in slots:
+            if row[i] == least:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.rows = [bytearray(c >> 1 for c in row) for row in self.rows]
+            self.additions //= 2
+
+    def frequency(self, key: str) -> int:
+        return min(row[i] for row, i in self._slots(key))
+
+
+class EvictionPolicy:
+    """Orden de desalojo para el backend en RAM (claves = preguntas normalizadas)"""
+
+    name = "lru"
+
+    def __init__(self, capacity: int):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def record_access(self, key: str):
+        """Cada búsqueda, acierte o no (solo la usa tinylfu)"""
+
+    def on_insert(self, key: str, hits: int = 0):
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def on_hit(self, key: str, hits: int):
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def on_remove(self, key: str):
+        self._order.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        return next(iter(self._order), None)
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return True
+
+
+class LFUPolicy(EvictionPolicy):
+    """Montículo (aciertos, tick) con borrado perezoso de entradas obsoletas"""
+
+    name = "lfu"
+
+    def __init__(self, capacity: int):
+        self._state: Dict[str, Tuple[int, int]] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._tick = itertools.count()
+
+    def _push(self, key: str, hits: int):
+        state = (hits, next(self._tick))
+        self._state[key] = state
+        heapq.heappush(self._heap, (*state, key))
+        # Demasiadas entradas obsoletas: reconstruir el montículo
+        if len(self._heap) > 4 * max(64, len(self._state)):
+            self._heap = [(h, t, k) for k, (h, t) in self._state.items()]
+            heapq.heapify(self._heap)
+
+    def on_insert(self, key: str, hits: int = 0):
+        self._push(key, hits)
+
+    def on_hit(self, key: str, hits: int):
+        if key in self._state:
+            self._push(key, hits)
+
+    def on_remove(self, key: str):
+        self._state.pop(key, None)
+
+    def victim(self) -> Optional[str]:
+        while self._heap:
+            hits, tick, key = self._heap[0]
+            if self._state.get(key) == (hits, tick):
+                return key
+            heapq.heappop(self._heap)
+        return None
+
+
+class TinyLFUPolicy(EvictionPolicy):
+    """LRU como víctima + filtro de admisión por frecuencia estimada"""
+
+    name = "tinylfu"
+
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        self.sketch = FrequencySketch(capacity)
+
+    def record_access(self, key: str):
+        self.sketch.increment(key)
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return self.sketch.frequency(candidate) > self.sketch.frequency(victim)
+
+
+def make_policy(name: str, capacity: int) -> EvictionPolicy:
+    policies = {"lru": EvictionPolicy, "lfu": LFUPolicy, "tinylfu": TinyLFUPolicy}
+    if name not in policies:
+        raise ValueError(f"Política de desalojo desconocida: {name} (opciones: {', '.join(POLICIES)})")
+    return policies[name](capacity)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Índice TF-IDF de n-gramas de caracteres para las consultas aprendidas.
+
+La memoria solo acierta con la misma pregunta normalizada; este índice
+recupera las más parecidas ("cuántos compradores hay" ~ "número de
+compradores") para:
+- aciertos de caché por vecino cercano (con umbral alto), y
+- elegir ejemplos few-shot para el prompt.
+
+Implementación:
+- n-gramas de 3 a 5 caracteres por palabra (con espacios de relleno), sobre
+  texto en minúsculas, sin acentos y con los números como N.
+- Matriz dispersa (SciPy CSC) con filas TF-IDF normalizadas: la consulta solo
+  toca las columnas de sus n-gramas.
+- Altas incrementales: las filas nuevas se ponderan con el IDF vigente y
+  quedan en un bloque pendiente (CSR pequeño); cuando el bloque o el número de
+  documentos crece lo suficiente se recalcula el IDF y se reconstruye todo en
+  un hilo aparte, sobre una foto de los documentos. Mientras tanto se sigue
+  respondiendo con la matriz principal más el bloque pendiente, y al terminar
+  se intercambian (las altas y bajas ocurridas durante la reconstrucción se
+  conservan).
+- Bajas por marca (tombstone); la reconstrucción las descarta.
+
+NumPy y SciPy son opcionales: sin ellos similarity_available() es False y la
+memoria sigue funcionando solo con coincidencias exactas.
+"""
+
+import re
+import threading
+import unicodedata
+from itertools import chain
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = None
+    sparse = None
+
+
+def similarity_available() -> bool:
+    return np is not None and sparse is not None
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos, números -> N y solo letras/dígitos"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"\d+", "N", text)
+    return " ".join(re.findall(r"\w+", text))
+
+
+@lru_cache(maxsize=65536)
+def _word_ngrams(word: str, sizes: Tuple[int, ...]) -> Tuple[str, ...]:
+    """N-gramas de una palabra ya normalizada (las palabras se repiten mucho entre preguntas)"""
+    padded = f" {word} "
+    return tuple(padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1))
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = (3, 4, 5)) -> Dict[str, int]:
+    """Frecuencia de n-gramas de caracteres por palabra (' compradores ' -> ' co', 'com', ...)"""
+    counts: Dict[str, int] = {}
+    for word in normalize_text(text).split():
+        for gram in _word_ngrams(word, sizes):
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class NgramIndex:
+    """
+    Índice de similitud coseno sobre TF-IDF de n-gramas. Las claves son
+    arbitrarias (la pregunta normalizada en la memoria).
+    """
+
+    def __init__(self, rebuild_growth: float = 0.2, max_pending: int = 2000, background_rebuild: bool = True):
+        if not similarity_available():
+            raise RuntimeError("NgramIndex requiere numpy y scipy")
+        self.rebuild_growth = rebuild_growth   # Reconstruir cuando los documentos crecen este %
+        self.max_pending = max_pending         # ...o cuando el bloque pendiente llega a este tamaño
+        self._lock = threading.RLock()
+        self._vocab: Dict[str, int] = {}
+        self._df: List[int] = []
+        self._keys: List[str] = []
+        self._rows: List[Tuple[List[int], List[int]]] = []  # Conteos de n-gramas por documento
+        self._alive: List[bool] = []
+        self._position: Dict[str, int] = {}
+        self._idf = np.zeros(0)
+        self._main = None                      # CSC (documentos x vocabulario) ya ponderado
+        self._main_alive = np.zeros(0, dtype=bool)
+        self._main_count = 0
+        self._pending: List[int] = []
+        self._pending_matrix = None
+        self._docs_at_rebuild = 0
+        self._alive_count = 0
+        self.rebuilds = 0
+        # Reconstrucción en segundo plano: add() no paga el recálculo completo
+        self.background_rebuild = background_rebuild
+        self._rebuilding = False
+        self._generation = 0                   # Cambia con cada intercambio: una foto vieja se descarta
+        # Construcción inicial en segundo plano: mientras tanto las altas/bajas se
+        # encolan y top_k no devuelve nada (la memoria sigue con aciertos exactos)
+        self.ready = True
+        self._backlog: Optional[List[Tuple[str, str, Optional[str]]]] = None
+        self._backlog_lock = threading.Lock()
+        self._builder: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    # ---------- Altas / bajas ----------
+    def _tf_row(self, text: str, grow: bool) -> Tuple[List[int], List[int]]:
+        """Columnas y conteos de los n-gramas del texto (el TF sublineal se aplica al ponderar)"""
+        counts = char_ngrams(text)
+        vocab = self._vocab
+        if grow:
+            for gram in counts:
+                if gram not in vocab:
+                    vocab[gram] = len(vocab)
+                    self._df.append(0)
+            return [vocab[g] for g in counts], list(counts.values())
+        known = [g for g in counts if g in vocab]
+        return [vocab[g] for g in known], [counts[g] for g in known]
+
+    def build_in_background(self, items: Iterable[Tuple[str, str]]):
+        """Indexa `items` (clave, texto) en un hilo; el índice queda ready al terminar"""
+        with self._backlog_lock:
+            self.ready = False
+            self._backlog = []
+
+        def run():
+            self._builder = threading.get_ident()
+            self.add_many(items)
+            while True:
+                with self._backlog_lock:
+                    pending, self._backlog = self._backlog, []
+                    if not pending:
+                        self._backlog = None
+                        self._builder = None
+                        self.ready = True
+                        return
+                for op, key, text in pending:
+                    self.add(key, text) if op == "add" else self.remove(key)
+
+        threading.Thread(target=run, name="ngram-index", daemon=True).start()
+
+    def _deferred(self, op: str, key: str, text: Optional[str] = None) -> bool:
+        """Encola la operación si hay una construcción en curso (salvo desde el propio hilo que construye)"""
+        if threading.get_ident() == self._builder:
+            return False
+        with self._backlog_lock:
+            if self._backlog is None:
+                return False
+            self._backlog.append((op, key, text))
+            return True
+
+    def add(self, key: str, text: Optional[str] = None):
+        """Indexa `text` (por defecto la propia clave); reemplaza la entrada previa con la misma clave"""
+        if self._deferred("add", key, text):
+            return
+        with self._lock:
+            if key in self._position:
+                self.remove(key)
+            cols, vals = self._tf_row(text if text is not None else key, grow=True)
+            for c in cols:
+                self._df[c] += 1
+            doc = len(self._keys)
+            self._keys.append(key)
+            self._rows.append((cols, vals))
+            self._alive.append(True)
+            self._position[key] = doc
+            self._alive_count += 1
+            self._pending.append(doc)
+            self._pending_matrix = None
+            if self._rebuilding:
+                return
+            if (len(self._pending) >= self.max_pending
+                    or self._alive_count > self._docs_at_rebuild * (1 + self.rebuild_growth)):
+                if self.background_rebuild:
+                    self._rebuilding = True
+                    threading.Thread(target=self._rebuild_async, name="ngram-rebuild", daemon=True).start()
+                else:
+                    self.rebuild()
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        """Alta masiva (clave, texto) con una sola reconstrucción al final"""
+        with self._lock:
+            pending_limit, self.max_pending = self.max_pending, float("inf")
+            growth, self.rebuild_growth = self.rebuild_growth, float("inf")
+            try:
+                for key, text in items:
+                    self.add(key, text)
+            finally:
+                self.max_pending, self.rebuild_growth = pending_limit, growth
+            self.rebuild()
+
+    def remove(self, key: str):
+        if self._deferred("remove", key):
+            return
+        with self._lock:
+            doc = self._position.pop(key, None)
+            if doc is None:
+                return
+            self._alive[doc] = False
+            if doc < self._main_count:
+                self._main_alive[doc] = False
+            self._alive_count -= 1
+            for c in self._rows[doc][0]:
+                self._df[c] -= 1
+
+    # ---------- Matrices ----------
+    def _weighted(self, docs: List[int], idf) -> "sparse.csr_matrix":
+        """Filas TF-IDF normalizadas (L2) de los documentos dados"""
+        return self._weighted_rows([self._rows[d] for d in docs], idf, len(self._vocab))
+
+    @staticmethod
+    def _weighted_rows(rows: List[Tuple[List[int], List[int]]], idf, width: int) -> "sparse.csr_matrix":
+        lengths = np.fromiter((len(r[0]) for r in rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        nnz = int(indptr[-1])
+        indices = np.fromiter(chain.from_iterable(r[0] for r in rows), dtype=np.int32, count=nnz)
+        data = np.fromiter(chain.from_iterable(r[1] for r in rows), dtype=np.float64, count=nnz)
+        data = (1.0 + np.log(data)) * idf[indices]
+        row_of = np.repeat(np.arange(len(rows)), lengths)
+        norms = np.sqrt(np.bincount(row_of, weights=data * data, minlength=len(rows)))
+        if nnz:
+            data /= norms[row_of]
+        return sparse.csr_matrix((data.astype(np.float32), indices, indptr), shape=(len(rows), width))
+
+    def _snapshot(self) -> Dict:
+        """Foto (bajo el lock) de lo necesario para reconstruir: documentos vivos, df y vocabulario"""
+        live = [d for d in range(len(self._keys)) if self._alive[d]]
+        return {
+            "generation": self._generation,
+            "live": live,
+            "docs": len(self._keys),
+            "rows": [self._rows[d] for d in live],
+            "df": np.asarray(self._df, dtype=np.float64),
+            "width": len(self._vocab),
+        }
+
+    @classmethod
+    def _compute(cls, snap: Dict):
+        """IDF y matriz principal de la foto (sin lock: es la parte cara)"""
+        n = len(snap["live"])
+        idf = np.log((1.0 + n) / (1.0 + snap["df"])) + 1.0
+        return idf, cls._weighted_rows(snap["rows"], idf, snap["width"]).tocsc()
+
+    def _swap(self, snap: Dict, idf, main) -> bool:
+        """
+        Instala la matriz calculada (bajo el lock). Los documentos de la foto se
+        renumeran en orden; los dados de alta después pasan al bloque pendiente y
+        las bajas ocurridas entretanto quedan marcadas. False si la foto es vieja.
+        """
+        if snap["generation"] != self._generation:
+            return False
+        live, tail = snap["live"], range(snap["docs"], len(self._keys))
+        order = live + list(tail)
+        self._keys = [self._keys[d] for d in order]
+        self._rows = [self._rows[d] for d in order]
+        self._alive = [self._alive[d] for d in order]
+        self._position = {k: i for i, k in enumerate(self._keys) if self._alive[i]}
+        n = len(live)
+        self._idf = idf
+        self._main = main
+        self._main_alive = np.asarray(self._alive[:n], dtype=bool)
+        self._main_count = n
+        self._pending = list(range(n, len(order)))
+        self._pending_matrix = None
+        self._docs_at_rebuild = n
+        self._generation += 1
+        self.rebuilds += 1
+        return True
+
+    def _rebuild_async(self):
+        try:
+            with self._lock:
+                snap = self._snapshot()
+            idf, main = self._compute(snap)
+            with self._lock:
+                self._swap(snap, idf, main)
+        finally:
+            self._rebuilding = False
+
+    def rebuild(self):
+        """Recalcula el IDF, descarta bajas y compacta todo en la matriz principal (síncrono)"""
+        with self._lock:
+            snap = self._snapshot()
+            self._swap(snap, *self._compute(snap))
+
+    # ---------- Consulta ----------
+    def top_k(self, text: str, k: int = 5, threshold: float = 0.0) -> List[Tuple[str, float]]:
+        """Las k claves más parecidas con similitud coseno >= threshold"""
+        if not self.ready:
+            return []
+        with self._lock:
+            if not self._alive_count:
+                return []
+            counts = char_ngrams(text)
+            cols = [self._vocab[g] for g in counts if g in self._vocab]
+            if not cols:
+                return []
+            vals = [counts[g] for g in counts if g in self._vocab]
+            unseen = [c for g, c in counts.items() if g not in self._vocab]
+            max_idf = float(np.log(1.0 + self._docs_at_rebuild) + 1.0)
+            idf = self._idf
+            if len(idf) < len(self._vocab):
+                # N-gramas aparecidos tras la última reconstrucción: IDF máximo provisional
+                idf = np.concatenate([idf, np.full(len(self._vocab) - len(idf), max_idf)])
+            q = (1.0 + np.log(np.asarray(vals, dtype=np.float64))) * idf[cols]
+            # Los n-gramas que ningún documento tiene no suman al producto, pero sí a la norma:
+            # "cuántos compradores hay en total" no es idéntica a "cuántos compradores hay"
+            unseen_w = (1.0 + np.log(np.asarray(unseen, dtype=np.float64))) * max_idf
+            q /= np.sqrt((q * q).sum() + (unseen_w * unseen_w).sum())
+
+            scores = np.zeros(self._main_count + len(self._pending), dtype=np.float32)
+            main_cols = [c for c in cols if c < self._main.shape[1]]
+            if self._main_count and main_cols:
+                q_main = q[[i for i, c in enumerate(cols) if c < self._main.shape[1]]]
+                scores[:self._main_count] = self._main[:, main_cols] @ q_main
+            if self._pending:
+                if self._pending_matrix is None:
+                    self._pending_matrix = self._weighted(self._pending, idf)
+                q_vec = sparse.csr_matrix((q, (np.zeros(len(cols), dtype=np.int32), cols)), shape=(1, len(self._vocab)))
+                scores[self._main_count:] = (self._pending_matrix @ q_vec.T).toarray().ravel()
+
+            # Bajas: fuera del ranking
+            scores[:self._main_count][~self._main_alive] = -1.0
+            for i, doc in enumerate(self._pending):
+                if not self._alive[doc]:
+                    scores[self._main_count + i] = -1.0
+            k = min(k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            doc_of = lambda i: i if i < self._main_count else self._pending[i - self._main_count]
+            return [
+                (self._keys[doc_of(i)], float(scores[i]))
+                for i in best if scores[i] >= threshold and scores[i] > 0
+            ]
+
+    def stats(self) -> Dict:
+        return {
+            "documents": self._alive_count,
+            "vocabulary": len(self._vocab),
+            "pending": len(self._pending),
+            "rebuilds": self.rebuilds,
+            "ready": self.ready,
+        }